@@ -0,0 +1,74 @@
+from typing import List, Tuple, Dict
+from database import PRICE_BUCKETS, AREA_BUCKETS, BUDGET_BUCKETS, SUMMARIES
+from database_utils import execute_cached_query
+
+# Dashboard figures are read from DashboardSummary, which triggers keep
+# current (see database.SUMMARIES), so each call reads O(buckets) rows
+# whatever the size of the portfolio. Results are cached against the
+# tables each summary is derived from.
+
+# metric -> the table whose writes change it
+SUMMARY_TABLES = {metric: table for table, metrics in SUMMARIES.items() for metric in metrics}
+
+def _summary(admin_id, metric) -> List[Tuple[str, int]]:
+    """(bucket, count) pairs of one metric, largest first"""
+    return execute_cached_query("""
+        SELECT bucket, count FROM DashboardSummary
+        WHERE admin_id = ? AND metric = ? AND count > 0
+        ORDER BY count DESC
+    """, [admin_id, metric], admin_id, (SUMMARY_TABLES[metric],))
+
+def _bucket_summary(admin_id, metric, buckets) -> List[Tuple[str, int]]:
+    """(bucket, count) pairs of a bucketed metric in range order"""
+    counts = dict(_summary(admin_id, metric))
+    return [(label, counts[label]) for _, label in buckets if label in counts]
+
+def get_totals(admin_id) -> Dict[str, int]:
+    """Number of properties, buyers and marketers of an admin"""
+    totals = dict(execute_cached_query("""
+        SELECT metric, SUM(count) FROM DashboardSummary
+        WHERE admin_id = ? AND metric IN ('property_status', 'buyer_budget', 'marketer_type')
+        GROUP BY metric
+    """, [admin_id], admin_id, ('RealEstate', 'Buyer', 'Marketer')))
+    return {
+        'properties': totals.get('property_status', 0),
+        'buyers': totals.get('buyer_budget', 0),
+        'marketers': totals.get('marketer_type', 0),
+    }
+
+def properties_by_status(admin_id) -> List[Tuple[str, int]]:
+    """(status, count) pairs, largest first"""
+    return _summary(admin_id, 'property_status')
+
+def properties_by_city(admin_id) -> List[Tuple[str, int]]:
+    """(city, count) pairs, largest first"""
+    return _summary(admin_id, 'property_city')
+
+def properties_by_type(admin_id) -> List[Tuple[str, int]]:
+    """(property_type, count) pairs, largest first"""
+    return _summary(admin_id, 'property_type')
+
+def properties_by_price_range(admin_id) -> List[Tuple[str, int]]:
+    """(price bucket, count) pairs in PRICE_BUCKETS order"""
+    return _bucket_summary(admin_id, 'price_bucket', PRICE_BUCKETS)
+
+def properties_by_area_range(admin_id) -> List[Tuple[str, int]]:
+    """(area bucket, count) pairs in AREA_BUCKETS order"""
+    return _bucket_summary(admin_id, 'area_bucket', AREA_BUCKETS)
+
+def buyers_by_budget_range(admin_id) -> List[Tuple[str, int]]:
+    """(budget bucket, count) pairs in BUDGET_BUCKETS order"""
+    return _bucket_summary(admin_id, 'buyer_budget', BUDGET_BUCKETS)
+
+def top_buyers_by_budget(admin_id, limit=10) -> List[Tuple[str, float]]:
+    """(name, budget) of the buyers with the largest budgets"""
+    return execute_cached_query("""
+        SELECT name, budget FROM Buyer
+        WHERE admin_id = ?
+        ORDER BY budget DESC
+        LIMIT ?
+    """, [admin_id, limit], admin_id, ('Buyer',))
+
+def marketers_by_type(admin_id) -> List[Tuple[str, int]]:
+    """(marketer_type, count) pairs, largest first"""
+    return _summary(admin_id, 'marketer_type')
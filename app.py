@@ -6,8 +6,10 @@ from pages.marketers import marketers_page
 from database import init_db
 from pages.home import home_page
 from pages.automation import automation_page
+from pages.debug import debug_panel
 import sqlite3
 from utils.session import check_authentication
+from utils.query_trace import tracer
 
 # Set page config globally
 st.set_page_config(
@@ -18,6 +20,9 @@ st.set_page_config(
 )
 
 def main():
+    # Attribute the SQL issued by this rerun to a fresh trace scope
+    rerun = tracer.start_rerun()
+    
     # Initialize session state variables
     if 'authenticated' not in st.session_state:
         st.session_state.authenticated = False
@@ -55,6 +60,8 @@ def main():
             marketers_page()
         elif page == "صفحة الاتمتة":
             automation_page()
+        
+        debug_panel(rerun)
     else:
         auth_page()
 
@@ -0,0 +1,318 @@
+"""Benchmarks for the data-access layer and the main page renders.
+
+Seeds one database per size with the load-test generator (cached under
+.benchmarks/), times every public function in database_utils.py on a
+fresh copy of it, renders the dashboard pages headlessly with Streamlit's
+AppTest, and writes the timings to a JSON file:
+
+    python benchmark.py --sizes 10000 100000 --output baseline.json
+    python benchmark.py --baseline baseline.json --threshold 0.25
+
+With --baseline, the run exits non-zero if any case got slower than the
+baseline median by more than the threshold, or fails where the baseline
+ran. A public function of database_utils.py without a case stops the run. The shared read cache is
+off unless --cache is given, so repeated reads measure SQLite.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import time
+
+import inspect
+
+import analytics
+import database
+import database_utils as du
+from generate_dummy_data import (BASE_PROPERTIES, generate_buyer_data, generate_load_test_data,
+                                 generate_marketer_data, generate_real_estate_data)
+from utils.cache import read_cache
+
+BENCH_DIR = '.benchmarks'
+DEFAULT_SIZES = [10000, 100000, 1000000]
+SEED = 1234
+ADMIN_ID = 1
+
+def seeded_database(size):
+    """Path of a database holding `size` properties for one admin, built once"""
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    template = os.path.join(BENCH_DIR, f"seed_{size}.db")
+    if not os.path.exists(template):
+        building = template + '.building'
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(building + suffix):
+                os.remove(building + suffix)
+        database.configure_pool(building)
+        database.init_db()
+        generate_load_test_data(seed=SEED, scale=size / BASE_PROPERTIES, admins=1)
+        with database.db_connection() as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        database.get_pool().close_all()
+        os.replace(building, template)
+    return template
+
+def working_copy(template):
+    """Copy the seeded template so destructive cases never touch it"""
+    path = template.replace('seed_', 'work_')
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    shutil.copyfile(template, path)
+    return path
+
+def sample_ids(table, column='id', count=100):
+    rows = du.execute_query(f"SELECT DISTINCT {column} FROM {table} WHERE admin_id = ? ORDER BY {column} LIMIT ?", [ADMIN_ID, count])
+    return [row[0] for row in rows]
+
+def data_cases():
+    """(name, callable(i)) pairs for database_utils; i is the repetition number"""
+    properties = sample_ids('RealEstate')
+    buyers = sample_ids('BuyerRealEstate', 'buyer_id')
+    marketers = sample_ids('MarketerRealEstate', 'marketer_id')
+    property_data = dict(generate_real_estate_data(ADMIN_ID), id=properties[0])
+    buyer_data = {'id': buyers[0], 'name': 'مشتري', 'phone': '0500000000', 'email': None,
+                  'budget': 1500000, 'interests': 'مسبح، حديقة', 'preferred_region': 'الرياض',
+                  'preferred_city': 'الرياض', 'preferred_district': 'الملز', 'admin_id': ADMIN_ID}
+    marketer_data = {'id': marketers[0], 'name': 'مسوق', 'phone': '0500000000', 'email': None,
+                     'marketer_type': 'وسيط', 'admin_id': ADMIN_ID}
+    new_properties = [generate_real_estate_data(ADMIN_ID) for _ in range(100)]
+    new_buyers = [dict(buyer, admin_id=ADMIN_ID) for buyer in generate_buyer_data(1000)]
+    new_marketers = [dict(marketer, admin_id=ADMIN_ID) for marketer in generate_marketer_data(1000)]
+
+    def rebuilt(registry, build):
+        # Index getters are timed building from the database, not returning the loaded index
+        def case(i):
+            registry.clear()
+            return build(ADMIN_ID)
+        return case
+
+    # Destructive cases use ids from the back half of each sample so they
+    # do not disturb the lookups above
+    return [
+        ('verify_admin', lambda i: du.verify_admin('loadtest1', 'loadtest1')),
+        ('register_admin', lambda i: du.register_admin(f'benchmark{i}', 'benchmark')),
+        ('search_properties', lambda i: du.search_properties(ADMIN_ID)),
+        ('search_properties(term)', lambda i: du.search_properties(ADMIN_ID, search_term='فيلا')),
+        ('search_properties(type)', lambda i: du.search_properties(ADMIN_ID, property_type='سكني')),
+        ('search_properties(price)', lambda i: du.search_properties(ADMIN_ID, min_price=500000, max_price=1000000)),
+        ('search_properties(area)', lambda i: du.search_properties(ADMIN_ID, min_area=100, max_area=200)),
+        ('search_properties(city)', lambda i: du.search_properties(ADMIN_ID, city='جدة')),
+        ('search_properties(city, district)', lambda i: du.search_properties(ADMIN_ID, city='الرياض', district='الملز')),
+        ('search_properties(all filters)', lambda i: du.search_properties(
+            ADMIN_ID, search_term='سكني', property_type='سكني', min_price=0, max_price=2000000,
+            min_area=50, max_area=400, city='الرياض', district='الملز')),
+        ('search_properties_page(newest)', lambda i: du.search_properties_page(ADMIN_ID, with_total=True)),
+        ('search_properties_page(price_desc)', lambda i: du.search_properties_page(ADMIN_ID, sort='price_desc', min_price=0, max_price=10000000)),
+        ('search_properties_page(relevance)', lambda i: du.search_properties_page(ADMIN_ID, sort='relevance', search_term='فيلا')),
+        ('nearest_properties', lambda i: du.nearest_properties(ADMIN_ID, 24.7136, 46.6753, k=10)),
+        ('nearest_properties(type)', lambda i: du.nearest_properties(ADMIN_ID, 21.4858, 39.1925, k=10, property_type='تجاري')),
+        ('map_clusters(kingdom)', lambda i: du.map_clusters(ADMIN_ID, 5, 16.0, 34.0, 32.0, 56.0)),
+        ('map_clusters(city)', lambda i: du.map_clusters(ADMIN_ID, 11, 24.6, 46.5, 24.85, 46.85)),
+        ('export_properties(city)', lambda i: sum(map(len, du.export_properties(ADMIN_ID, city='جدة')))),
+        ('search_buyers', lambda i: du.search_buyers(ADMIN_ID)),
+        ('search_buyers(term)', lambda i: du.search_buyers(ADMIN_ID, search_term='مسبح')),
+        ('search_buyers(budget)', lambda i: du.search_buyers(ADMIN_ID, min_budget=1000000, max_budget=2000000)),
+        ('search_buyers_page', lambda i: du.search_buyers_page(ADMIN_ID, with_total=True)),
+        ('get_interest_terms', lambda i: du.get_interest_terms(ADMIN_ID)),
+        ('export_buyers', lambda i: sum(map(len, du.export_buyers(ADMIN_ID)))),
+        ('search_marketers', lambda i: du.search_marketers(ADMIN_ID)),
+        ('search_marketers(term)', lambda i: du.search_marketers(ADMIN_ID, search_term='وسيط')),
+        ('search_marketers_page', lambda i: du.search_marketers_page(ADMIN_ID, with_total=True)),
+        ('export_marketers', lambda i: sum(map(len, du.export_marketers(ADMIN_ID)))),
+        ('export_buyer_real_estates', lambda i: sum(map(len, du.export_buyer_real_estates(ADMIN_ID)))),
+        ('export_marketer_real_estates', lambda i: sum(map(len, du.export_marketer_real_estates(ADMIN_ID)))),
+        ('get_all_real_estates', lambda i: du.get_all_real_estates(ADMIN_ID)),
+        ('get_buyer_real_estates', lambda i: du.get_buyer_real_estates(buyers[i % 10], ADMIN_ID)),
+        ('get_marketer_real_estates', lambda i: du.get_marketer_real_estates(marketers[i % 10], ADMIN_ID)),
+        ('get_marketer_buyers', lambda i: du.get_marketer_buyers(marketers[i % 10])),
+        ('get_real_estates_for_buyers(20)', lambda i: du.get_real_estates_for_buyers(buyers[:20], ADMIN_ID)),
+        ('get_real_estates_for_marketers(20)', lambda i: du.get_real_estates_for_marketers(marketers[:20], ADMIN_ID)),
+        ('get_property_index', rebuilt(du._property_indexes, du.get_property_index)),
+        ('get_comps_index', rebuilt(du._comps_indexes, du.get_comps_index)),
+        ('get_dedup_index', rebuilt(du._dedup_indexes, du.get_dedup_index)),
+        ('get_price_model(load)', rebuilt(du._price_models, du.get_price_model)),
+        ('comparable_properties', lambda i: du.comparable_properties(ADMIN_ID, properties[i % 10])),
+        ('estimate_prices(20)', lambda i: du.estimate_prices(ADMIN_ID, properties[:20])),
+        ('price_outliers', lambda i: du.price_outliers(ADMIN_ID)),
+        ('find_duplicates', lambda i: du.find_duplicates(ADMIN_ID, property_data)),
+        ('duplicate_matches(100)', lambda i: du.duplicate_matches(ADMIN_ID, new_properties)),
+        ('duplicate_clusters', lambda i: du.duplicate_clusters(ADMIN_ID)),
+        ('analytics.get_totals', lambda i: analytics.get_totals(ADMIN_ID)),
+        ('analytics.properties_by_status', lambda i: analytics.properties_by_status(ADMIN_ID)),
+        ('analytics.properties_by_city', lambda i: analytics.properties_by_city(ADMIN_ID)),
+        ('analytics.properties_by_price_range', lambda i: analytics.properties_by_price_range(ADMIN_ID)),
+        ('analytics.properties_by_area_range', lambda i: analytics.properties_by_area_range(ADMIN_ID)),
+        ('analytics.top_buyers_by_budget', lambda i: analytics.top_buyers_by_budget(ADMIN_ID)),
+        ('analytics.marketers_by_type', lambda i: analytics.marketers_by_type(ADMIN_ID)),
+        ('add_property', lambda i: du.add_property(property_data)),
+        ('add_properties_bulk(1000)', lambda i: du.add_properties_bulk(generate_real_estate_data(ADMIN_ID) for _ in range(1000))),
+        ('add_buyer', lambda i: du.add_buyer(buyer_data)),
+        ('add_buyers_bulk(1000)', lambda i: du.add_buyers_bulk(new_buyers)),
+        ('add_marketer', lambda i: du.add_marketer(marketer_data)),
+        ('add_marketers_bulk(1000)', lambda i: du.add_marketers_bulk(new_marketers)),
+        ('update_property', lambda i: du.update_property(property_data)),
+        ('update_buyer', lambda i: du.update_buyer(buyer_data)),
+        ('update_marketer', lambda i: du.update_marketer(marketer_data)),
+        # Each delete case removes the link its add case made in the same run
+        ('add_buyer_real_estate', lambda i: du.add_buyer_real_estate(buyers[0], properties[-1 - i], ADMIN_ID)),
+        ('delete_buyer_real_estate', lambda i: du.delete_buyer_real_estate(buyers[0], properties[-1 - i], ADMIN_ID)),
+        ('add_marketer_real_estate', lambda i: du.add_marketer_real_estate(marketers[0], properties[-1 - i], ADMIN_ID)),
+        ('delete_marketer_real_estate', lambda i: du.delete_marketer_real_estate(marketers[0], properties[-1 - i], ADMIN_ID)),
+        ('add_buyer_real_estates_bulk(20)', lambda i: du.add_buyer_real_estates_bulk(
+            (buyer, properties[-20 - i], ADMIN_ID) for buyer in buyers[20:40])),
+        ('add_marketer_real_estates_bulk(20)', lambda i: du.add_marketer_real_estates_bulk(
+            (marketer, properties[-20 - i], ADMIN_ID) for marketer in marketers[20:40])),
+        ('delete_property', lambda i: du.delete_property(properties[50 + i], ADMIN_ID)),
+        ('delete_buyer', lambda i: du.delete_buyer(buyers[-1 - i], ADMIN_ID)),
+        ('delete_marketer', lambda i: du.delete_marketer(marketers[-1 - i], ADMIN_ID)),
+    ]
+
+# Query primitives and pure helpers, timed through the cases that call them
+UNTIMED = {
+    'to_columns', 'execute_query', 'execute_update', 'execute_delete', 'execute_cached_query',
+    'invalidate', 'execute_bulk_insert', 'execute_bulk_link', 'fts_query', 'map_cluster_level',
+    'dedup_row', 'price_model_dir', 'price_model_path',
+}
+
+def untimed_functions(case_names):
+    """Public functions of database_utils.py that no case times"""
+    covered = {name.split('(')[0] for name in case_names}
+    return sorted(
+        name for name, value in vars(du).items()
+        if inspect.isfunction(value) and value.__module__ == du.__name__
+        and not name.startswith('_') and name not in covered and name not in UNTIMED
+    )
+
+def _render(page):
+    # Runs inside AppTest, so it must be self-contained
+    import importlib
+    import time
+    import streamlit as st
+    st.session_state.setdefault('authenticated', True)
+    st.session_state.setdefault('admin_id', 1)
+    st.session_state.setdefault('username', 'loadtest1')
+    st.session_state.setdefault('session_token', 'benchmark')
+    st.session_state.setdefault('session_expiry', time.time() + 3600)
+    module, function = page.split(':')
+    getattr(importlib.import_module(module), function)()
+
+PAGES = {
+    'render home_page': 'pages.home:home_page',
+    'render real_estate_page': 'pages.real_estate:real_estate_page',
+    'render buyers_page': 'pages.buyers:buyers_page',
+}
+
+def page_cases():
+    from streamlit.testing.v1 import AppTest
+
+    def render(page):
+        app = AppTest.from_function(_render, args=(page,), default_timeout=600)
+        app.run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+
+    return [(name, lambda i, page=page: render(page)) for name, page in PAGES.items()]
+
+def time_case(func, repeat):
+    """Time func over `repeat` runs; a failing case is recorded, not fatal"""
+    timings = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        try:
+            func(i)
+        except Exception as e:
+            return {'error': str(e)}
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'runs': repeat,
+    }
+
+def forget_indexes():
+    """Drop the in-memory indexes loaded from the previous size's database"""
+    for registry in (du._property_indexes, du._comps_indexes, du._dedup_indexes, du._price_models):
+        registry.clear()
+
+def run_benchmarks(sizes, repeat, include_pages=True):
+    results = {}
+    for size in sizes:
+        template = seeded_database(size)
+        database.configure_pool(working_copy(template))
+        # Bring a template seeded by an older version up to the current schema
+        database.init_db()
+        forget_indexes()
+        cases = data_cases() + (page_cases() if include_pages else [])
+        missing = untimed_functions(name for name, _ in cases)
+        if missing:
+            sys.exit(f"No benchmark case for: {', '.join(missing)}")
+        results[str(size)] = {}
+        for name, func in cases:
+            timing = results[str(size)][name] = time_case(func, repeat)
+            if 'error' in timing:
+                print(f"{size:>8} {name:<40} failed: {timing['error']}")
+            else:
+                print(f"{size:>8} {name:<40} {timing['median_ms']:>10.2f} ms")
+        database.get_pool().close_all()
+    return results
+
+def compare(results, baseline, threshold, min_delta_ms=1.0):
+    """Return (size, case, baseline_ms, current_ms) for every regression.
+
+    A case that ran in the baseline and fails now is a regression with a
+    current_ms of None. Slowdowns smaller than min_delta_ms are treated as
+    timer noise.
+    """
+    regressions = []
+    for size, cases in results.items():
+        for name, timing in cases.items():
+            before = baseline.get(size, {}).get(name)
+            if not before or 'error' in before:
+                continue
+            if 'error' in timing:
+                regressions.append((size, name, before['median_ms'], None))
+                continue
+            if (timing['median_ms'] > before['median_ms'] * (1 + threshold)
+                    and timing['median_ms'] - before['median_ms'] >= min_delta_ms):
+                regressions.append((size, name, before['median_ms'], timing['median_ms']))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark database_utils and page renders")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="property counts to seed")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per case")
+    parser.add_argument('--no-pages', action='store_true', help="skip the AppTest page renders")
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the results")
+    parser.add_argument('--baseline', help="results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown before flagging, e.g. 0.25 = 25%%")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help="ignore slowdowns smaller than this")
+    parser.add_argument('--cache', action='store_true', help="keep the shared read cache enabled")
+    args = parser.parse_args()
+
+    read_cache.enabled = args.cache
+    # Keep the price models of the working copies out of the app's model directory
+    du.MODEL_DIR = os.path.join(BENCH_DIR, 'models')
+
+    results = run_benchmarks(args.sizes, args.repeat, not args.no_pages)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        for size, name, before, after in regressions:
+            if after is None:
+                print(f"REGRESSION {size} {name}: {before:.2f} ms -> failed: {results[size][name]['error']}")
+            else:
+                print(f"REGRESSION {size} {name}: {before:.2f} ms -> {after:.2f} ms")
+        if regressions:
+            return 1
+        print("No regressions.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""Run EXPLAIN QUERY PLAN on every query issued by database_utils.py and analytics.py.
+
+Seeds a throwaway database, calls each helper while tracing the SQL it
+sends (reads, writes, and the re-reads that keep the in-memory indexes
+current after a write), and exits with a non-zero status if any statement
+is planned as a full table scan. Run it after touching the schema, the indexes or a query:
+
+    python check_query_plans.py
+"""
+import os
+import re
+import sys
+import tempfile
+
+import analytics
+import database
+import database_utils as du
+from generate_dummy_data import generate_real_estate_data, generate_buyer_data, generate_marketer_data
+from utils.cache import read_cache
+
+ADMINS = 10
+PROPERTIES = 500
+BUYERS = 100
+MARKETERS = 20
+
+def seed(admin_id):
+    """Give admin_id a share of properties, buyers, marketers and links"""
+    for real_estate in (generate_real_estate_data(admin_id) for _ in range(PROPERTIES)):
+        du.add_property(real_estate)
+    for buyer in generate_buyer_data(BUYERS):
+        buyer['admin_id'] = admin_id
+        du.add_buyer(buyer)
+    for marketer in generate_marketer_data(MARKETERS):
+        marketer['admin_id'] = admin_id
+        du.add_marketer(marketer)
+    first_property = (admin_id - 1) * PROPERTIES + 1
+    for i in range(BUYERS):
+        du.add_buyer_real_estate((admin_id - 1) * BUYERS + i + 1, first_property + i, admin_id)
+    for i in range(MARKETERS):
+        du.add_marketer_real_estate((admin_id - 1) * MARKETERS + i + 1, first_property + i, admin_id)
+
+def query_cases(admin_id):
+    """(name, callable) pairs covering every query in database_utils.py and analytics.py"""
+    property_data = dict(generate_real_estate_data(admin_id), id=10)
+    new_property = generate_real_estate_data(admin_id)
+    buyer_data = {'id': 10, 'name': 'x', 'phone': '0500000000', 'email': None,
+                  'budget': 1000000, 'interests': 'مسبح', 'preferred_region': 'الرياض',
+                  'preferred_city': 'الرياض', 'preferred_district': None, 'admin_id': admin_id}
+    marketer_data = {'id': 10, 'name': 'x', 'phone': '0500000000', 'email': None,
+                     'marketer_type': 'وسيط', 'admin_id': admin_id}
+    return [
+        ('verify_admin', lambda: du.verify_admin('admin1', 'admin')),
+        ('register_admin', lambda: du.register_admin('admin1', 'admin')),
+        ('search_properties', lambda: du.search_properties(admin_id)),
+        ('search_properties(term)', lambda: du.search_properties(admin_id, search_term='فيلا')),
+        ('search_properties(type, price)', lambda: du.search_properties(admin_id, property_type='سكني', min_price=0, max_price=10000000)),
+        ('search_properties(area)', lambda: du.search_properties(admin_id, min_area=0, max_area=10000)),
+        ('search_properties(city, district)', lambda: du.search_properties(admin_id, city='جدة', district='الروضة')),
+        ('search_properties(bbox)', lambda: du.search_properties(admin_id, bbox=(24.6, 46.6, 24.8, 46.8))),
+        ('search_properties(within, type)', lambda: du.search_properties(admin_id, within=(24.7136, 46.6753, 5), property_type='سكني')),
+        ('nearest_properties', lambda: du.nearest_properties(admin_id, 24.7136, 46.6753, k=5)),
+        ('nearest_properties(growing boxes)', lambda: du.nearest_properties(admin_id, 0.0, 0.0, k=PROPERTIES * 2, property_type='سكني')),
+        ('search_properties_page(within)', lambda: du.search_properties_page(admin_id, cursor=('9999', 10**9), within=(21.4858, 39.1925, 10))),
+        ('map_clusters', lambda: du.map_clusters(admin_id, 9, 24.2, 46.0, 25.2, 47.4)),
+        ('map_clusters(points)', lambda: du.map_clusters(admin_id, 16, 24.70, 46.66, 24.72, 46.69)),
+        ('comparable_properties', lambda: du.comparable_properties(admin_id, (admin_id - 1) * PROPERTIES + 1)),
+        ('find_duplicates', lambda: du.find_duplicates(admin_id, du.execute_query(
+            "SELECT * FROM RealEstate WHERE id = ?", [(admin_id - 1) * PROPERTIES + 1])[0]._asdict() | {'id': None})),
+        ('duplicate_clusters', lambda: du.duplicate_clusters(admin_id)),
+        ('get_property_index', lambda: du.get_property_index(admin_id)),
+        ('estimate_prices', lambda: du.estimate_prices(admin_id, [(admin_id - 1) * PROPERTIES + 1])),
+        ('price_outliers', lambda: du.price_outliers(admin_id)),
+        ('search_properties(amenities, price)', lambda: du.search_properties(admin_id, amenities=['مسبح', 'حديقة'], max_price=2000000)),
+        ('search_properties_page(newest)', lambda: du.search_properties_page(admin_id, cursor=('9999', 10**9), with_total=True)),
+        ('search_properties_page(price)', lambda: du.search_properties_page(admin_id, sort='price_desc', cursor=(10**9, 10**9), min_price=0)),
+        ('search_properties_page(relevance)', lambda: du.search_properties_page(admin_id, sort='relevance', cursor=(-100.0, 1), search_term='فيلا')),
+        ('search_buyers', lambda: du.search_buyers(admin_id)),
+        ('search_buyers_page', lambda: du.search_buyers_page(admin_id, cursor=('', 0), with_total=True)),
+        ('search_buyers_page(budget)', lambda: du.search_buyers_page(admin_id, sort='budget_desc', cursor=(10**9, 0))),
+        ('search_marketers_page', lambda: du.search_marketers_page(admin_id, cursor=('', 0), with_total=True)),
+        ('search_buyers(term, budget)', lambda: du.search_buyers(admin_id, search_term='مسبح', min_budget=0, max_budget=10000000)),
+        ('search_buyers(interests, city, budget)', lambda: du.search_buyers(admin_id, interests=['مسبح', 'حديقة'], preferred_city='جدة', max_budget=2000000)),
+        ('get_interest_terms', lambda: du.get_interest_terms(admin_id)),
+        ('search_marketers', lambda: du.search_marketers(admin_id, search_term='وسيط')),
+        ('get_all_real_estates', lambda: du.get_all_real_estates(admin_id)),
+        ('get_buyer_real_estates', lambda: du.get_buyer_real_estates(1, admin_id)),
+        ('get_marketer_real_estates', lambda: du.get_marketer_real_estates(1, admin_id)),
+        ('get_marketer_buyers', lambda: du.get_marketer_buyers(1)),
+        ('get_real_estates_for_buyers', lambda: du.get_real_estates_for_buyers([1, 2, 3], admin_id)),
+        ('get_real_estates_for_marketers', lambda: du.get_real_estates_for_marketers([1, 2, 3], admin_id)),
+        ('export_properties', lambda: list(du.export_properties(admin_id, chunk_size=100))),
+        ('export_properties(term, city)', lambda: list(du.export_properties(admin_id, chunk_size=100, search_term='فيلا', city='جدة'))),
+        ('export_buyers', lambda: list(du.export_buyers(admin_id, chunk_size=100, min_budget=0))),
+        ('export_buyers(interests)', lambda: list(du.export_buyers(admin_id, chunk_size=100, interests='مسبح، حديقة'))),
+        ('export_marketers', lambda: list(du.export_marketers(admin_id, chunk_size=100))),
+        ('export_buyer_real_estates', lambda: list(du.export_buyer_real_estates(admin_id, chunk_size=50))),
+        ('export_marketer_real_estates', lambda: list(du.export_marketer_real_estates(admin_id, chunk_size=50))),
+        ('analytics.get_totals', lambda: analytics.get_totals(admin_id)),
+        ('analytics.properties_by_status', lambda: analytics.properties_by_status(admin_id)),
+        ('analytics.properties_by_city', lambda: analytics.properties_by_city(admin_id)),
+        ('analytics.properties_by_price_range', lambda: analytics.properties_by_price_range(admin_id)),
+        ('analytics.properties_by_area_range', lambda: analytics.properties_by_area_range(admin_id)),
+        ('analytics.top_buyers_by_budget', lambda: analytics.top_buyers_by_budget(admin_id)),
+        ('analytics.marketers_by_type', lambda: analytics.marketers_by_type(admin_id)),
+        # Writes come after the cases above, so they also re-read the loaded indexes
+        ('add_property', lambda: du.add_property(new_property, check_duplicates=True)),
+        ('add_properties_bulk', lambda: du.add_properties_bulk([generate_real_estate_data(admin_id) for _ in range(3)])),
+        ('add_buyer', lambda: du.add_buyer(buyer_data)),
+        ('add_buyers_bulk', lambda: du.add_buyers_bulk([buyer_data] * 3)),
+        ('add_marketer', lambda: du.add_marketer(marketer_data)),
+        ('add_marketers_bulk', lambda: du.add_marketers_bulk([marketer_data] * 3)),
+        ('add_buyer_real_estate', lambda: du.add_buyer_real_estate(5, 6, admin_id)),
+        ('add_buyer_real_estates_bulk', lambda: du.add_buyer_real_estates_bulk([(6, 7, admin_id), (7, 8, admin_id)])),
+        ('add_marketer_real_estate', lambda: du.add_marketer_real_estate(5, 6, admin_id)),
+        ('add_marketer_real_estates_bulk', lambda: du.add_marketer_real_estates_bulk([(6, 7, admin_id), (7, 8, admin_id)])),
+        ('update_property', lambda: du.update_property(property_data)),
+        ('update_buyer', lambda: du.update_buyer(buyer_data)),
+        ('update_marketer', lambda: du.update_marketer(marketer_data)),
+        ('delete_buyer_real_estate', lambda: du.delete_buyer_real_estate(2, 2, admin_id)),
+        ('delete_marketer_real_estate', lambda: du.delete_marketer_real_estate(2, 2, admin_id)),
+        ('delete_property', lambda: du.delete_property(3, admin_id)),
+        ('delete_buyer', lambda: du.delete_buyer(4, admin_id)),
+        ('delete_marketer', lambda: du.delete_marketer(5, admin_id)),
+    ]
+
+def traced_statements(conn, func):
+    """Call func and return the SELECT/INSERT/UPDATE/DELETE statements it ran on conn"""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        func()
+    finally:
+        conn.set_trace_callback(None)
+    return [s for s in statements if s.lstrip().split(None, 1)[0].upper() in ('SELECT', 'INSERT', 'UPDATE', 'DELETE')]
+
+# Virtual tables report their lookups as SCAN ... VIRTUAL TABLE INDEX n:constraints,
+# e.g. INDEX 0:M1 (FTS5 MATCH) or INDEX 2:E0C1 (R*Tree box). Without constraints it
+# scans the whole table, except INDEX 1:, the R*Tree rowid lookup
+_VIRTUAL_SCAN_RE = re.compile(r"VIRTUAL TABLE INDEX (\d+):$")
+
+def _scans_table(detail):
+    if not detail.startswith('SCAN ') or 'CONSTANT ROW' in detail:
+        return False
+    # Reading a table's CHECK constraints scans the small schema table
+    if detail == 'SCAN sqlite_master':
+        return False
+    if 'VIRTUAL TABLE' in detail:
+        match = _VIRTUAL_SCAN_RE.search(detail)
+        return match is not None and match.group(1) != '1'
+    return True
+
+def full_scans(conn, statement):
+    """Return the query-plan lines of statement that scan a whole table"""
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+    return [detail for _, _, _, detail in plan if _scans_table(detail)]
+
+def check_query_plans():
+    """Return a list of (case, statement, scans) for every regressed query"""
+    failures = []
+    with database.db_connection() as conn:
+        for name, func in query_cases(1):
+            for statement in traced_statements(conn, func):
+                scans = full_scans(conn, statement)
+                if scans:
+                    failures.append((name, statement, scans))
+    return failures
+
+def seed_admins():
+    """Give the current database ADMINS seeded admins and planner statistics"""
+    for admin_id in range(1, ADMINS + 1):
+        du.register_admin(f'admin{admin_id}', 'admin')
+        seed(admin_id)
+    database.analyze_db()
+
+def main():
+    # Every statement has to reach SQLite to be traced
+    read_cache.enabled = False
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_pool(os.path.join(tmp, 'plans.db'))
+        # Keep the price models trained here out of the app's model directory
+        du.MODEL_DIR = tmp
+        du.PRICE_MODEL_SAVE_DELAY = 0
+        database.init_db()
+        seed_admins()
+        failures = check_query_plans()
+        database.get_pool().close_all()
+    for name, statement, scans in failures:
+        print(f"FULL SCAN in {name}: {'; '.join(scans)}")
+        print(f"    {' '.join(statement.split())}")
+    if failures:
+        return 1
+    print("All queries use an index.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,145 @@
 import sqlite3
+import os
+import re
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from utils.arabic import normalize_arabic, sql_normalize_arabic
+from utils.geo import locate
+from utils.query_trace import connection_factory
+
+DB_PATH = os.environ.get('AQARDASH_DB_PATH', 'aqardash.db')
+POOL_SIZE = int(os.environ.get('AQARDASH_DB_POOL_SIZE', '8'))
+
+# Pragmas applied to every connection when it is opened. journal_mode is
+# persistent in the database file, the rest are per-connection settings.
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 268435456,  # 256 MB
+    'cache_size': -65536,    # negative means KiB, i.e. 64 MB
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+    'busy_timeout': 5000,
+}
+
+def open_connection(db_path=None, pragmas=None):
+    """Open a new connection and apply the pragma profile"""
+    conn = sqlite3.connect(db_path or DB_PATH, check_same_thread=False, factory=connection_factory())
+    for name, value in (PRAGMAS if pragmas is None else pragmas).items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+class ConnectionPool:
+    """Pool of long-lived connections handed out one per thread.
+
+    A thread keeps the same connection for nested acquire() calls and gives
+    it back to the pool when the outermost release() happens. At most
+    pool_size idle connections are kept open, extra ones are closed.
+    """
+
+    def __init__(self, db_path=None, pool_size=None, pragmas=None):
+        self.db_path = db_path or DB_PATH
+        self.pool_size = POOL_SIZE if pool_size is None else pool_size
+        self.pragmas = PRAGMAS if pragmas is None else pragmas
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def acquire(self):
+        """Return the calling thread's connection, checking one out if needed"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.depth += 1
+            return conn
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = open_connection(self.db_path, self.pragmas)
+        self._local.conn = conn
+        self._local.depth = 1
+        return conn
+
+    def release(self, conn):
+        """Give a connection back once the thread's outermost user is done"""
+        if getattr(self._local, 'conn', None) is not conn:
+            conn.close()
+            return
+        self._local.depth -= 1
+        if self._local.depth > 0:
+            return
+        self._local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Context manager around acquire()/release() that rolls back on error"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+_pool = ConnectionPool()
+
+def configure_pool(db_path=None, pool_size=None, pragmas=None):
+    """Replace the global pool, e.g. to point the app at another database file"""
+    global _pool
+    _pool.close_all()
+    _pool = ConnectionPool(db_path, pool_size, pragmas)
+    return _pool
+
+def get_pool():
+    return _pool
+
+def db_connection():
+    """Borrow the current thread's pooled connection: `with db_connection() as conn:`"""
+    return _pool.connection()
 
 def init_db():
-    conn = get_db_connection()
+    with db_connection() as conn:
+        _create_tables(conn)
+
+# Columns added after the first release; older databases get them on startup
+BUYER_LOCATION_COLUMNS = {
+    'preferred_region': 'TEXT',
+    'preferred_city': 'TEXT',
+    'preferred_district': 'TEXT',
+}
+
+PROPERTY_COORDINATE_COLUMNS = {
+    'latitude': 'REAL',
+    'longitude': 'REAL',
+}
+
+JOB_HEARTBEAT_COLUMNS = {
+    'heartbeat_at': 'REAL',
+}
+
+def _add_missing_columns(cursor, table, columns):
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    for name, declaration in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+
+def _create_tables(conn):
     cursor = conn.cursor()
     
     # Create tables if they don't exist
@@ -44,6 +181,8 @@ def init_db():
         district TEXT NOT NULL,
         city TEXT NOT NULL,
         location_link TEXT,
+        latitude REAL,
+        longitude REAL,
         source_link TEXT,
         location_details TEXT,
         description TEXT,
@@ -61,6 +200,9 @@ def init_db():
         email TEXT,
         budget REAL NOT NULL,
         interests TEXT,
+        preferred_region TEXT,
+        preferred_city TEXT,
+        preferred_district TEXT,
         admin_id INTEGER NOT NULL,
         FOREIGN KEY (admin_id) REFERENCES Admin(id)
     )
@@ -92,30 +234,668 @@ def init_db():
     )
     ''')
     
+    _add_missing_columns(cursor, 'RealEstate', PROPERTY_COORDINATE_COLUMNS)
+    _add_missing_columns(cursor, 'Buyer', BUYER_LOCATION_COLUMNS)
+    
+    # Background jobs run by jobs.py; params and result are JSON
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Job (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        admin_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        params TEXT NOT NULL DEFAULT '{}',
+        status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed', 'cancelled')),
+        progress REAL NOT NULL DEFAULT 0,
+        message TEXT,
+        result TEXT,
+        result_file TEXT,
+        error TEXT,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        started_at TEXT,
+        finished_at TEXT,
+        heartbeat_at REAL,
+        FOREIGN KEY (admin_id) REFERENCES Admin(id)
+    )
+    ''')
+    _add_missing_columns(cursor, 'Job', JOB_HEARTBEAT_COLUMNS)
+    
+    create_indexes(conn)
+    create_search_index(conn)
+    create_term_index(conn)
+    create_geo_index(conn)
+    create_map_clusters(conn)
+    create_summary_tables(conn)
     conn.commit()
-    conn.close()
 
-def get_db_connection():
-    return sqlite3.connect('aqardash.db')
+# Secondary indexes backing the hot queries in database_utils.py.
+# check_query_plans.py fails if any of those queries falls back to a full scan.
+# Lookups by BuyerRealEstate.buyer_id and MarketerRealEstate.marketer_id are
+# already served by the indexes behind their UNIQUE constraints.
+INDEXES = {
+    'idx_realestate_admin_city_district_price': 'RealEstate(admin_id, city, district, price)',
+    'idx_realestate_admin_date': 'RealEstate(admin_id, announcement_date)',
+    'idx_realestate_admin_title': 'RealEstate(admin_id, title)',
+    'idx_realestate_admin_price': 'RealEstate(admin_id, price)',
+    'idx_buyer_admin_budget': 'Buyer(admin_id, budget)',
+    'idx_buyer_admin_name': 'Buyer(admin_id, name)',
+    'idx_marketer_admin_name': 'Marketer(admin_id, name)',
+    'idx_buyerrealestate_realestate': 'BuyerRealEstate(real_estate_id)',
+    'idx_marketerrealestate_realestate': 'MarketerRealEstate(real_estate_id)',
+    'idx_job_admin': 'Job(admin_id)',
+    'idx_job_status': 'Job(status)',
+}
 
-def recreate_db():
-    """Drop all tables and recreate them with the updated schema"""
-    conn = get_db_connection()
+def create_indexes(conn):
+    """Create the maintained index set if it is missing"""
     cursor = conn.cursor()
-    
-    # Drop all tables
-    cursor.execute("DROP TABLE IF EXISTS BuyerRealEstate")
-    cursor.execute("DROP TABLE IF EXISTS MarketerRealEstate")
-    cursor.execute("DROP TABLE IF EXISTS Buyer")
-    cursor.execute("DROP TABLE IF EXISTS RealEstate")
-    cursor.execute("DROP TABLE IF EXISTS Marketer")
-    cursor.execute("DROP TABLE IF EXISTS Admin")
-    
-    # Recreate tables
-    init_db()
-    
+    for name, target in INDEXES.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+    conn.commit()
+
+# Columns of RealEstate covered by the full-text index. RealEstateFTS is a
+# contentless FTS5 table holding the Arabic-normalized text of each listing
+# under the listing's id; the triggers below keep it in sync.
+SEARCH_COLUMNS = ['title', 'description', 'location_details']
+
+def _search_values(prefix):
+    return ', '.join(sql_normalize_arabic(f"{prefix}.{column}") for column in SEARCH_COLUMNS)
+
+def create_search_index(conn):
+    """Create the RealEstateFTS table and its sync triggers, filling it if new"""
+    cursor = conn.cursor()
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'RealEstateFTS'"
+    ).fetchone()
+    columns = ', '.join(SEARCH_COLUMNS)
+    cursor.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS RealEstateFTS USING fts5(
+        {columns}, content=''
+    )
+    """)
+    delete_old = f"""
+        INSERT INTO RealEstateFTS (RealEstateFTS, rowid, {columns})
+        VALUES ('delete', old.id, {_search_values('old')});
+    """
+    insert_new = f"""
+        INSERT INTO RealEstateFTS (rowid, {columns})
+        VALUES (new.id, {_search_values('new')});
+    """
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS RealEstateFTS_insert AFTER INSERT ON RealEstate BEGIN
+        {insert_new}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS RealEstateFTS_delete AFTER DELETE ON RealEstate BEGIN
+        {delete_old}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS RealEstateFTS_update AFTER UPDATE OF {columns} ON RealEstate BEGIN
+        {delete_old}
+        {insert_new}
+    END
+    """)
+    if not exists:
+        _fill_search_index(cursor)
     conn.commit()
-    conn.close()
+
+def _fill_search_index(cursor):
+    cursor.execute(f"""
+    INSERT INTO RealEstateFTS (rowid, {', '.join(SEARCH_COLUMNS)})
+    SELECT r.id, {_search_values('r')} FROM RealEstate r
+    """)
+
+def rebuild_search_index():
+    """Rebuild RealEstateFTS from RealEstate, e.g. after changing the normalization"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO RealEstateFTS (RealEstateFTS) VALUES ('delete-all')")
+        _fill_search_index(cursor)
+        conn.commit()
+
+# Amenities recognized in listing text, as canonical term -> other phrases
+# naming it. Buyer interests mentioning any of these phrases get the same
+# term, so buyers and properties share one vocabulary.
+AMENITIES = {
+    'مسبح': ['حمام سباحة', 'بركة سباحة'],
+    'حديقة': ['حدائق'],
+    'موقف سيارات': ['مواقف سيارات', 'موقف خاص', 'كراج'],
+    'مكيفات سبليت': ['مكيف سبليت', 'سبليت'],
+    'مدفأة': ['تدفئة'],
+    'نظام أمن': ['كاميرات مراقبة', 'حراسة'],
+    'مطبخ مجهز': ['مطبخ راكب'],
+    'غرفة خادمة': ['غرفة عاملة', 'غرفة سائق'],
+    'مستودع': ['مخزن'],
+    'مصعد': ['اسانسير'],
+    'ملحق': [],
+    'شرفة': ['بلكونة'],
+}
+
+# Columns of RealEstate scanned for amenity phrases
+AMENITY_COLUMNS = ['title', 'description']
+
+# Inverted index from normalized terms to the buyers and properties having
+# them. Term holds the vocabulary, TermAlias maps every amenity phrase to its
+# canonical term. BuyerTerm gets the items of Buyer.interests plus the
+# amenities they mention, RealEstateTerm the amenities mentioned in
+# AMENITY_COLUMNS; the triggers below keep both in sync.
+TERM_TABLES = ['BuyerTerm', 'RealEstateTerm', 'TermAlias', 'Term']
+
+def _interest_items(prefix):
+    """json_each() over the comma-separated items of {prefix}.interests, normalized.
+
+    json_quote() escapes the whole text, so joining the items with '","'
+    gives a valid JSON array whatever characters they contain.
+    """
+    text = f"replace({sql_normalize_arabic(f'{prefix}.interests')}, ',', '،')"
+    return f"json_each('[' || replace(json_quote({text}), '،', '\",\"') || ']')"
+
+def _normalized(text):
+    # A one-row table-valued function, joined with CROSS JOIN so it stays the
+    # outer loop, evaluates the normalization once per row instead of once
+    # per alias it is matched against
+    return f"json_each(json_array({text}))"
+
+def _buyer_terms(prefix, source=''):
+    """Statements indexing the buyers of source, or the trigger row if empty"""
+    item = "trim(i.value, char(32, 9, 10, 13))"
+    return [
+        f"""
+        INSERT OR IGNORE INTO Term (term)
+        SELECT {item} FROM {source}{_interest_items(prefix)} i
+        WHERE {item} != '' AND {item} NOT IN (SELECT alias FROM TermAlias);
+        """,
+        f"""
+        INSERT OR IGNORE INTO BuyerTerm (admin_id, term_id, buyer_id)
+        SELECT {prefix}.admin_id, coalesce(a.term_id, t.id), {prefix}.id
+        FROM {source}{_interest_items(prefix)} i
+        LEFT JOIN TermAlias a ON a.alias = {item}
+        LEFT JOIN Term t ON t.term = {item}
+        WHERE {item} != '';
+        """,
+        f"""
+        INSERT OR IGNORE INTO BuyerTerm (admin_id, term_id, buyer_id)
+        SELECT {prefix}.admin_id, a.term_id, {prefix}.id
+        FROM {source}{_normalized(sql_normalize_arabic(f'{prefix}.interests'))} n CROSS JOIN TermAlias a
+        WHERE instr(n.value, a.alias) > 0;
+        """,
+    ]
+
+def _property_terms(prefix, source=''):
+    """Statements indexing the properties of source, or the trigger row if empty"""
+    text = " || ' ' || ".join(sql_normalize_arabic(f"{prefix}.{column}") for column in AMENITY_COLUMNS)
+    return [
+        f"""
+        INSERT OR IGNORE INTO RealEstateTerm (admin_id, term_id, real_estate_id)
+        SELECT {prefix}.admin_id, a.term_id, {prefix}.id
+        FROM {source}{_normalized(text)} n CROSS JOIN TermAlias a
+        WHERE instr(n.value, a.alias) > 0;
+        """,
+    ]
+
+def create_term_index(conn):
+    """Create the term tables and their sync triggers, filling them if new"""
+    cursor = conn.cursor()
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'Term'"
+    ).fetchone()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Term (
+        id INTEGER PRIMARY KEY,
+        term TEXT NOT NULL UNIQUE
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS TermAlias (
+        alias TEXT PRIMARY KEY,
+        term_id INTEGER NOT NULL REFERENCES Term(id)
+    ) WITHOUT ROWID
+    ''')
+    # Postings are clustered by (admin, term) so a term lookup is one range
+    # read, the secondary indexes serve the deletes in the triggers
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS BuyerTerm (
+        admin_id INTEGER NOT NULL,
+        term_id INTEGER NOT NULL,
+        buyer_id INTEGER NOT NULL,
+        PRIMARY KEY (admin_id, term_id, buyer_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS RealEstateTerm (
+        admin_id INTEGER NOT NULL,
+        term_id INTEGER NOT NULL,
+        real_estate_id INTEGER NOT NULL,
+        PRIMARY KEY (admin_id, term_id, real_estate_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_buyerterm_buyer ON BuyerTerm(buyer_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_realestateterm_realestate ON RealEstateTerm(real_estate_id)")
+    _seed_amenities(cursor)
+
+    for table, columns, postings, key, terms in (
+        ('Buyer', 'interests', 'BuyerTerm', 'buyer_id', _buyer_terms),
+        ('RealEstate', ', '.join(AMENITY_COLUMNS), 'RealEstateTerm', 'real_estate_id', _property_terms),
+    ):
+        delete_old = f"DELETE FROM {postings} WHERE {key} = old.id;"
+        insert_new = ''.join(terms('new'))
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS Term_{table}_insert AFTER INSERT ON {table} BEGIN
+            {insert_new}
+        END
+        """)
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS Term_{table}_delete AFTER DELETE ON {table} BEGIN
+            {delete_old}
+        END
+        """)
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS Term_{table}_update AFTER UPDATE OF {columns}, admin_id ON {table} BEGIN
+            {delete_old}
+            {insert_new}
+        END
+        """)
+    if not exists:
+        _fill_term_index(cursor)
+    conn.commit()
+
+def _seed_amenities(cursor):
+    for term, phrases in AMENITIES.items():
+        term = normalize_arabic(term)
+        cursor.execute("INSERT OR IGNORE INTO Term (term) VALUES (?)", (term,))
+        for phrase in [term, *phrases]:
+            cursor.execute(
+                "INSERT OR IGNORE INTO TermAlias (alias, term_id) SELECT ?, id FROM Term WHERE term = ?",
+                (normalize_arabic(phrase), term)
+            )
+
+def _fill_term_index(cursor):
+    for statement in _buyer_terms('b', 'Buyer b, ') + _property_terms('r', 'RealEstate r, '):
+        cursor.execute(statement)
+
+def rebuild_term_index():
+    """Rebuild the term tables from AMENITIES, Buyer and RealEstate, e.g. after editing AMENITIES"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for table in TERM_TABLES:
+            cursor.execute(f"DELETE FROM {table}")
+        _seed_amenities(cursor)
+        _fill_term_index(cursor)
+        conn.commit()
+
+# R*Tree over the coordinates of RealEstate, keyed by listing id. admin_id is
+# its first dimension (a zero-width range per row) so a box query only visits
+# the admin's own listings. The R*Tree keeps 32-bit floats rounded outward,
+# so queries re-check the exact coordinates on RealEstate.
+def create_geo_index(conn):
+    """Create the RealEstateGeo R*Tree and its sync triggers, filling it if new"""
+    cursor = conn.cursor()
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'RealEstateGeo'"
+    ).fetchone()
+    if not exists:
+        _locate_properties(cursor)
+    cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS RealEstateGeo USING rtree(
+        id, min_admin, max_admin, min_lat, max_lat, min_lon, max_lon
+    )
+    """)
+    delete_old = "DELETE FROM RealEstateGeo WHERE id = old.id;"
+    insert_new = """
+        INSERT INTO RealEstateGeo
+        SELECT new.id, new.admin_id, new.admin_id, new.latitude, new.latitude, new.longitude, new.longitude
+        WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+    """
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS RealEstateGeo_insert AFTER INSERT ON RealEstate BEGIN
+        {insert_new}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS RealEstateGeo_delete AFTER DELETE ON RealEstate BEGIN
+        {delete_old}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS RealEstateGeo_update AFTER UPDATE OF latitude, longitude, admin_id ON RealEstate BEGIN
+        {delete_old}
+        {insert_new}
+    END
+    """)
+    if not exists:
+        _fill_geo_index(cursor)
+    conn.commit()
+
+def _locate_properties(cursor, batch_size=10000):
+    """Give listings without coordinates those of their link or gazetteer entry"""
+    last_id = 0
+    while True:
+        rows = cursor.execute("""
+            SELECT id, location_link, city, district FROM RealEstate
+            WHERE id > ? AND latitude IS NULL ORDER BY id LIMIT ?
+        """, (last_id, batch_size)).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        points = [
+            (*locate({'location_link': link, 'city': city, 'district': district}), property_id)
+            for property_id, link, city, district in rows
+        ]
+        cursor.executemany(
+            "UPDATE RealEstate SET latitude = ?, longitude = ? WHERE id = ?",
+            [point for point in points if point[0] is not None]
+        )
+
+# Height in degrees of the latitude strips RealEstateGeo is filled in
+GEO_FILL_STRIP = 0.05
+
+def _fill_geo_index(cursor):
+    # SQLite's R*Tree packs its nodes well only if nearby points arrive
+    # together; in id order a box query at a million listings visits 100x
+    # more nodes. Strip by strip, west to east, keeps the nodes compact.
+    cursor.execute(f"""
+    INSERT INTO RealEstateGeo
+    SELECT id, admin_id, admin_id, latitude, latitude, longitude, longitude
+    FROM RealEstate WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    ORDER BY admin_id, CAST(latitude / {GEO_FILL_STRIP} AS INTEGER), longitude
+    """)
+
+def rebuild_geo_index():
+    """Locate listings still missing coordinates and repack RealEstateGeo.
+
+    Run it after bulk loads, which insert points in no spatial order, or
+    after extending the gazetteer.
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        _locate_properties(cursor)
+        cursor.execute("DELETE FROM RealEstateGeo")
+        _fill_geo_index(cursor)
+        cursor.execute("DELETE FROM MapCluster")
+        _fill_map_clusters(cursor)
+        conn.commit()
+
+# Map clustering pyramid: at each level L the world is cut into square cells
+# of 360 / 2^L / MAP_CELLS_PER_TILE degrees, so a map tile of zoom L is
+# MAP_CELLS_PER_TILE cells wide, and each cell is split into 16 cells two
+# levels down. MapCluster keeps per admin the count and coordinate sums of
+# every non-empty cell, so a viewport reads O(cells) rows at any zoom.
+MAP_CLUSTER_LEVELS = (2, 4, 6, 8, 10, 12, 14)
+MAP_CELLS_PER_TILE = 16
+
+def map_cell_degrees(level):
+    """Side in degrees of the cells of a clustering level"""
+    return 360 / 2 ** level / MAP_CELLS_PER_TILE
+
+def _map_cell(prefix, level):
+    """SQL (cell_x, cell_y) of a row's coordinates, offset to stay non-negative"""
+    size = map_cell_degrees(level)
+    expr = f"{prefix}." if prefix else ''
+    return (f"CAST(({expr}longitude + 180) / {size!r} AS INTEGER)",
+            f"CAST(({expr}latitude + 90) / {size!r} AS INTEGER)")
+
+def _map_cluster_increment(level):
+    cell_x, cell_y = _map_cell('new', level)
+    return f"""
+        INSERT INTO MapCluster (admin_id, level, cell_x, cell_y, count, sum_lat, sum_lon)
+        SELECT new.admin_id, {level}, {cell_x}, {cell_y}, 1, new.latitude, new.longitude
+        WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL
+        ON CONFLICT (admin_id, level, cell_x, cell_y) DO UPDATE SET
+            count = count + 1, sum_lat = sum_lat + excluded.sum_lat, sum_lon = sum_lon + excluded.sum_lon;
+    """
+
+def _map_cluster_decrement(level):
+    cell_x, cell_y = _map_cell('old', level)
+    return f"""
+        UPDATE MapCluster SET
+            count = count - 1, sum_lat = sum_lat - old.latitude, sum_lon = sum_lon - old.longitude
+        WHERE admin_id = old.admin_id AND level = {level}
+          AND cell_x = {cell_x} AND cell_y = {cell_y}
+          AND old.latitude IS NOT NULL AND old.longitude IS NOT NULL;
+    """
+
+def create_map_clusters(conn):
+    """Create MapCluster and its triggers, filling it if new"""
+    cursor = conn.cursor()
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'MapCluster'"
+    ).fetchone()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS MapCluster (
+        admin_id INTEGER NOT NULL,
+        level INTEGER NOT NULL,
+        cell_x INTEGER NOT NULL,
+        cell_y INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        sum_lat REAL NOT NULL,
+        sum_lon REAL NOT NULL,
+        PRIMARY KEY (admin_id, level, cell_x, cell_y)
+    ) WITHOUT ROWID
+    ''')
+    increments = ''.join(_map_cluster_increment(level) for level in MAP_CLUSTER_LEVELS)
+    decrements = ''.join(_map_cluster_decrement(level) for level in MAP_CLUSTER_LEVELS)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS MapCluster_insert AFTER INSERT ON RealEstate BEGIN
+        {increments}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS MapCluster_delete AFTER DELETE ON RealEstate BEGIN
+        {decrements}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS MapCluster_update AFTER UPDATE OF latitude, longitude, admin_id ON RealEstate
+    WHEN old.admin_id IS NOT new.admin_id
+      OR old.latitude IS NOT new.latitude OR old.longitude IS NOT new.longitude
+    BEGIN
+        {decrements}
+        {increments}
+    END
+    """)
+    if not exists:
+        _fill_map_clusters(cursor)
+    conn.commit()
+
+def _fill_map_clusters(cursor):
+    # Only the finest level is read from RealEstate; each coarser level sums
+    # the cells of the one below, which nest exactly in its own
+    finest = MAP_CLUSTER_LEVELS[-1]
+    cell_x, cell_y = _map_cell(None, finest)
+    cursor.execute(f"""
+    INSERT INTO MapCluster (admin_id, level, cell_x, cell_y, count, sum_lat, sum_lon)
+    SELECT admin_id, {finest}, {cell_x} AS x, {cell_y} AS y, COUNT(*), SUM(latitude), SUM(longitude)
+    FROM RealEstate WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    GROUP BY admin_id, x, y
+    """)
+    for level, finer in zip(MAP_CLUSTER_LEVELS[-2::-1], MAP_CLUSTER_LEVELS[::-1]):
+        shift = finer - level
+        cursor.execute(f"""
+        INSERT INTO MapCluster (admin_id, level, cell_x, cell_y, count, sum_lat, sum_lon)
+        SELECT admin_id, {level}, cell_x >> {shift} AS x, cell_y >> {shift} AS y,
+               SUM(count), SUM(sum_lat), SUM(sum_lon)
+        FROM MapCluster WHERE level = {finer} AND count > 0
+        GROUP BY admin_id, x, y
+        """)
+
+# Dashboard bucket bounds: (exclusive upper bound, label), the last bucket
+# has no upper bound.
+PRICE_BUCKETS = [
+    (100000, "0-100K"),
+    (200000, "100K-200K"),
+    (300000, "200K-300K"),
+    (400000, "300K-400K"),
+    (None, "400K+"),
+]
+
+AREA_BUCKETS = [
+    (100, "0-100"),
+    (200, "100-200"),
+    (300, "200-300"),
+    (400, "300-400"),
+    (None, "400+"),
+]
+
+BUDGET_BUCKETS = [
+    (1000000, "0-1M"),
+    (2000000, "1M-2M"),
+    (3000000, "2M-3M"),
+    (4000000, "3M-4M"),
+    (5000000, "4M-5M"),
+    (None, "5M+"),
+]
+
+def bucket_case(column, buckets):
+    """SQL CASE expression mapping column to its bucket label"""
+    whens = ' '.join(f"WHEN {column} < {bound} THEN '{label}'" for bound, label in buckets if bound is not None)
+    return f"CASE {whens} ELSE '{buckets[-1][1]}' END"
+
+# Per-admin counters kept in DashboardSummary by triggers, as
+# table -> metric -> (column, buckets or None to count distinct values).
+SUMMARIES = {
+    'RealEstate': {
+        'property_status': ('status', None),
+        'property_city': ('city', None),
+        'property_type': ('property_type', None),
+        'price_bucket': ('price', PRICE_BUCKETS),
+        'area_bucket': ('area', AREA_BUCKETS),
+    },
+    'Buyer': {
+        'buyer_budget': ('budget', BUDGET_BUCKETS),
+    },
+    'Marketer': {
+        'marketer_type': ('marketer_type', None),
+    },
+}
+
+def _summary_bucket(prefix, column, buckets):
+    expr = f"{prefix}.{column}" if prefix else column
+    return bucket_case(expr, buckets) if buckets else expr
+
+def _summary_increment(metric, column, buckets):
+    return f"""
+        INSERT INTO DashboardSummary (admin_id, metric, bucket, count)
+        VALUES (new.admin_id, '{metric}', {_summary_bucket('new', column, buckets)}, 1)
+        ON CONFLICT (admin_id, metric, bucket) DO UPDATE SET count = count + 1;
+    """
+
+def _summary_decrement(metric, column, buckets):
+    return f"""
+        UPDATE DashboardSummary SET count = count - 1
+        WHERE admin_id = old.admin_id AND metric = '{metric}'
+          AND bucket = {_summary_bucket('old', column, buckets)};
+    """
+
+def create_summary_tables(conn):
+    """Create DashboardSummary and its triggers, filling it if new"""
+    cursor = conn.cursor()
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'DashboardSummary'"
+    ).fetchone()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS DashboardSummary (
+        admin_id INTEGER NOT NULL,
+        metric TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (admin_id, metric, bucket)
+    ) WITHOUT ROWID
+    ''')
+    for table, metrics in SUMMARIES.items():
+        increments = ''.join(_summary_increment(m, c, b) for m, (c, b) in metrics.items())
+        decrements = ''.join(_summary_decrement(m, c, b) for m, (c, b) in metrics.items())
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS Summary_{table}_insert AFTER INSERT ON {table} BEGIN
+            {increments}
+        END
+        """)
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS Summary_{table}_delete AFTER DELETE ON {table} BEGIN
+            {decrements}
+        END
+        """)
+        # One update trigger per metric so unchanged buckets cost nothing
+        for metric, (column, buckets) in metrics.items():
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS Summary_{table}_{metric}_update
+            AFTER UPDATE OF {column}, admin_id ON {table}
+            WHEN old.admin_id IS NOT new.admin_id
+              OR {_summary_bucket('old', column, buckets)} IS NOT {_summary_bucket('new', column, buckets)}
+            BEGIN
+                {_summary_decrement(metric, column, buckets)}
+                {_summary_increment(metric, column, buckets)}
+            END
+            """)
+    if not exists:
+        _fill_summaries(cursor)
+    conn.commit()
+
+def _fill_summaries(cursor):
+    for table, metrics in SUMMARIES.items():
+        for metric, (column, buckets) in metrics.items():
+            cursor.execute(f"""
+            INSERT INTO DashboardSummary (admin_id, metric, bucket, count)
+            SELECT admin_id, '{metric}', {_summary_bucket(None, column, buckets)} AS bucket, COUNT(*)
+            FROM {table}
+            GROUP BY admin_id, bucket
+            """)
+
+def rebuild_summaries():
+    """Recompute DashboardSummary from the base tables, e.g. after a manual edit"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM DashboardSummary")
+        _fill_summaries(cursor)
+        conn.commit()
+
+_CHECK_IN_RE = re.compile(r"CHECK \((\w+) IN \(([^)]*)\)\)")
+
+def check_choices(table):
+    """Allowed values of each column of table constrained by CHECK (column IN (...)).
+
+    Read from the live schema so validation outside SQLite cannot drift
+    from the constraints.
+    """
+    with db_connection() as conn:
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    if row is None:
+        return {}
+    return {
+        column: [value.strip().strip("'") for value in values.split(',')]
+        for column, values in _CHECK_IN_RE.findall(row[0])
+    }
+
+def analyze_db():
+    """Refresh the planner statistics, run this after bulk loads"""
+    with db_connection() as conn:
+        conn.execute("ANALYZE")
+        conn.commit()
+
+def recreate_db():
+    """Drop all tables and recreate them with the updated schema"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        # Drop all tables
+        cursor.execute("DROP TABLE IF EXISTS RealEstateFTS")
+        cursor.execute("DROP TABLE IF EXISTS RealEstateGeo")
+        cursor.execute("DROP TABLE IF EXISTS MapCluster")
+        for table in TERM_TABLES:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        cursor.execute("DROP TABLE IF EXISTS DashboardSummary")
+        cursor.execute("DROP TABLE IF EXISTS Job")
+        cursor.execute("DROP TABLE IF EXISTS BuyerRealEstate")
+        cursor.execute("DROP TABLE IF EXISTS MarketerRealEstate")
+        cursor.execute("DROP TABLE IF EXISTS Buyer")
+        cursor.execute("DROP TABLE IF EXISTS RealEstate")
+        cursor.execute("DROP TABLE IF EXISTS Marketer")
+        cursor.execute("DROP TABLE IF EXISTS Admin")
+        conn.commit()
+        
+        # Recreate tables
+        _create_tables(conn)
 
 if __name__ == "__main__":
     init_db()
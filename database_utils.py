@@ -1,45 +1,190 @@
-from database import get_db_connection
-from typing import List, Dict, Any, Optional, Union, Tuple
+from database import check_choices, db_connection, get_pool, MAP_CELLS_PER_TILE, MAP_CLUSTER_LEVELS
+from utils.arabic import split_terms, tokenize
+from utils.cache import read_cache
+from utils.geo import bounding_box, distance_km, km_per_degree_longitude, KM_PER_DEGREE_LATITUDE, locate
+from utils.comps_index import CompsIndex
+from utils.dedup_index import DedupIndex, Match
+from utils.price_model import OUTLIER_SCORE, Estimates, PriceModel
+from utils.property_index import PropertyIndex
+from typing import List, Dict, Any, Optional, Union, Tuple, NamedTuple, Iterable, Iterator, Sequence
+from collections import namedtuple
+from functools import lru_cache
+from itertools import islice
 import sqlite3
+import atexit
 import os
+import re
+import threading
+import time
 
-def get_db_connection():
-    """Create and return a database connection."""
-    return sqlite3.connect('aqardash.db')
+class Record(tuple):
+    """Base of the row records returned by execute_query().
 
-def execute_query(query: str, params: List[Any] = None) -> List[tuple]:
-    """Execute a query and return results."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
+    Concrete classes are namedtuples generated from the column names of a
+    result, so a record costs no more than the plain tuple and is read as
+    row.title, row['title'] or row[1].
+    """
+    __slots__ = ()
+    _index: Dict[str, int] = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+@lru_cache(maxsize=None)
+def record_class(fields: Tuple[str, ...]) -> type:
+    """Record class for a result with the given column names.
+
+    Names that are not valid identifiers or repeat (e.g. COUNT(*)) become
+    _0, _1, ... as with namedtuple(rename=True).
+    """
+    base = namedtuple('Row', fields, rename=True)
+    return type('Record', (base, Record), {
+        '__slots__': (),
+        '_index': {name: i for i, name in enumerate(base._fields)},
+    })
+
+def _record_factory(description):
+    record = record_class(tuple(column[0] for column in description))
+    new = tuple.__new__
+    return lambda cursor, row: new(record, row)
+
+def to_columns(records: Sequence[tuple], fields: Optional[Sequence[str]] = None) -> Dict[str, tuple]:
+    """Transpose records into {column: values} for pd.DataFrame or np.asarray.
+
+    The values are the records' own objects, not copies.
+    """
+    if not records:
+        return {name: () for name in fields or ()}
+    return dict(zip(fields or records[0]._fields, zip(*records)))
+
+def execute_query(query: str, params: List[Any] = None) -> List[Record]:
+    """Execute a query and return its rows as records."""
+    with db_connection() as conn:
+        cursor = conn.cursor()
         if params:
             cursor.execute(query, params)
         else:
             cursor.execute(query)
+        if cursor.description:
+            cursor.row_factory = _record_factory(cursor.description)
         return cursor.fetchall()
-    finally:
-        conn.close()
 
 def execute_update(query: str, params: List[Any]) -> int:
     """Execute an update query and return the last row ID."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
+    with db_connection() as conn:
+        cursor = conn.cursor()
         cursor.execute(query, params)
         conn.commit()
         return cursor.lastrowid
-    finally:
-        conn.close()
 
 def execute_delete(query: str, params: List[Any]) -> None:
     """Execute a delete query."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
+    with db_connection() as conn:
+        cursor = conn.cursor()
         cursor.execute(query, params)
         conn.commit()
-    finally:
-        conn.close()
+
+def execute_cached_query(query: str, params: List[Any], admin_id: Optional[int], tables: Tuple[str, ...]) -> List[Record]:
+    """execute_query() through the shared read cache.
+
+    tables lists every table the query reads; a write to any of them for
+    admin_id (or for any admin when admin_id is None) invalidates the entry.
+    The returned rows are shared between sessions and must not be mutated.
+    """
+    return read_cache.get_or_load(admin_id, tables, (query, tuple(params)), lambda: execute_query(query, params))
+
+def invalidate(admin_id: Optional[int], *tables: str) -> None:
+    """Mark cached reads of tables stale after a committed write"""
+    read_cache.bump(admin_id, *tables)
+
+BULK_CHUNK_SIZE = 5000
+
+def _chunks(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def execute_bulk_insert(table: str, columns: List[str], records: Iterable[dict],
+                        chunk_size: int = BULK_CHUNK_SIZE) -> List[range]:
+    """Insert records with executemany in a single transaction.
+
+    records may be any iterable (e.g. a generator); it is consumed chunk_size
+    rows at a time. Returns the inserted ids as one range per chunk.
+    """
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    id_ranges = []
+    admin_ids = set()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for chunk in _chunks(records, chunk_size):
+            cursor.executemany(query, [[record[column] for column in columns] for record in chunk])
+            # The transaction holds the write lock, so the chunk's ids are consecutive
+            last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+            id_ranges.append(range(last_id - len(chunk) + 1, last_id + 1))
+            admin_ids.update(record['admin_id'] for record in chunk)
+        conn.commit()
+    for admin_id in admin_ids:
+        invalidate(admin_id, table)
+    return id_ranges
+
+def execute_bulk_link(table: str, columns: List[str], links: Iterable[tuple],
+                      chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """Insert association rows in one transaction, skipping existing pairs.
+
+    Returns the number of rows actually inserted.
+    """
+    query = f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    admin_ids = set()
+    with db_connection() as conn:
+        before = conn.total_changes
+        cursor = conn.cursor()
+        for chunk in _chunks(links, chunk_size):
+            cursor.executemany(query, chunk)
+            admin_ids.update(link[-1] for link in chunk)
+        conn.commit()
+        inserted = conn.total_changes - before
+    for admin_id in admin_ids:
+        invalidate(admin_id, table)
+    return inserted
+
+class Page(NamedTuple):
+    """One page of a keyset-paginated listing"""
+    rows: List[Record]
+    next_cursor: Optional[tuple]  # None on the last page
+    total: Optional[int] = None   # only filled when requested
+
+def _fetch_page(columns: str, id_column: str, from_where: str, params: List[Any],
+                sort: Tuple[str, str], cursor: Optional[tuple], limit: int,
+                with_total: bool, admin_id: int, tables: Tuple[str, ...]) -> Page:
+    """Run a seek query: rows after cursor in (sort key, id) order.
+
+    The cursor is the (sort value, id) pair of the last row of the previous
+    page, so each page costs an index seek instead of an OFFSET scan.
+    """
+    sort_expr, direction = sort
+    query = f"SELECT {sort_expr} AS page_sort, {id_column} AS page_id, {columns} {from_where}"
+    page_params = list(params)
+    if cursor is not None:
+        query += f" AND ({sort_expr}, {id_column}) {'<' if direction == 'DESC' else '>'} (?, ?)"
+        page_params.extend(cursor)
+    query += f" ORDER BY {sort_expr} {direction}, {id_column} {direction} LIMIT ?"
+    page_params.append(limit + 1)
+    
+    rows = execute_cached_query(query, page_params, admin_id, tables)
+    next_cursor = (rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+    total = execute_cached_query(f"SELECT COUNT(*) {from_where}", params, admin_id, tables)[0][0] if with_total else None
+    if not rows:
+        return Page([], None, total)
+    record = record_class(rows[0]._fields[2:])
+    return Page([record._make(row[2:]) for row in rows[:limit]], next_cursor, total)
 
 def register_admin(username: str, password: str) -> Tuple[bool, str]:
     """Register a new admin user."""
@@ -93,70 +238,384 @@ def verify_admin(username: str, password: str) -> Tuple[bool, Optional[int]]:
         raise e
 
 # Real Estate functions
-def search_properties(admin_id, search_term=None, property_type=None, min_price=None, max_price=None, min_area=None, max_area=None, city=None, district=None):
-    """Search for properties with various filters"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
+EXPORT_CHUNK_SIZE = 5000
+
+def _iter_chunks(columns: str, id_column: str, from_where: str, params: List[Any],
+                 chunk_size: int) -> Iterator[List[Record]]:
+    """Yield every row of a listing in id order, chunk_size rows at a time.
+
+    Each chunk is its own seek query (id after the last exported id), so no
+    connection or cursor stays open between chunks and the rows bypass the
+    read cache.
+    """
+    query = (f"SELECT {id_column} AS chunk_id, {columns} {from_where} AND {id_column} > ? "
+             f"ORDER BY {id_column} LIMIT ?")
+    last_id = 0
+    while True:
+        rows = execute_query(query, list(params) + [last_id, chunk_size])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        record = record_class(rows[0]._fields[1:])
+        yield [record._make(row[1:]) for row in rows]
+        if len(rows) < chunk_size:
+            return
+
+def _scan_by_id(from_where: str, table: str) -> str:
+    """Make a filter clause walk the table in rowid order.
+
+    Otherwise SQLite seeks the (admin_id, ...) indexes and re-sorts every
+    matching row for each chunk; a rowid scan reads the table once per export.
+    """
+    return from_where.replace(f"FROM {table}", f"FROM {table} NOT INDEXED", 1)
+
+def fts_query(search_term: str) -> str:
+    """Turn free text into an FTS5 query prefix-matching every normalized word"""
+    return ' AND '.join(f'"{token}"*' for token in tokenize(search_term))
+
+def _term_filter(column: str, postings: str, key: str, admin_id: int, terms: Union[str, Sequence[str]]) -> Tuple[str, List[Any]]:
+    """Condition keeping rows whose id is in the postings of every term, and its params.
+
+    terms is a list or a comma-separated text. Each term resolves to its
+    canonical id through TermAlias, or through Term for free-text
+    interests; a term nobody has matches nothing.
+    """
+    terms = split_terms(terms if isinstance(terms, str) else '،'.join(terms))
+    if not terms:
+        return "", []
+    lookup = f"""
+        SELECT {key} FROM {postings}
+        WHERE admin_id = ? AND term_id = coalesce(
+            (SELECT term_id FROM TermAlias WHERE alias = ?),
+            (SELECT id FROM Term WHERE term = ?)
+        )
+    """
+    params = []
+    for term in terms:
+        params.extend([admin_id, term, term])
+    return f" AND {column} IN ({' INTERSECT '.join([lookup] * len(terms))})", params
+
+def _floats(value: Union[str, Sequence[float]]) -> List[float]:
+    """Numbers of a sequence or of a comma-separated text (as passed by exporter.py)"""
+    return [float(part) for part in (value.split(',') if isinstance(value, str) else value)]
+
+def _box_filter(admin_id: int, south: float, west: float, north: float, east: float) -> Tuple[str, List[Any]]:
+    """Condition keeping properties inside the box, and its params.
+
+    The RealEstateGeo R*Tree finds the candidates, the exact coordinates
+    on RealEstate settle the edges.
+    """
+    return """
+        AND r.id IN (
+            SELECT id FROM RealEstateGeo
+            WHERE min_admin <= ? AND max_admin >= ?
+              AND max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?
+        )
+        AND r.latitude BETWEEN ? AND ? AND r.longitude BETWEEN ? AND ?
+    """, [admin_id, admin_id, south, north, west, east, south, north, west, east]
+
+def _squared_distance(latitude: float, longitude: float, columns=('r.latitude', 'r.longitude')) -> Tuple[str, List[Any]]:
+    """SQL expression of the squared utils.geo.distance_km() from a point to columns, and its params"""
+    return (
+        f"({columns[0]} - ?) * ({columns[0]} - ?) * ? + ({columns[1]} - ?) * ({columns[1]} - ?) * ?",
+        [latitude, latitude, KM_PER_DEGREE_LATITUDE ** 2,
+         longitude, longitude, km_per_degree_longitude(latitude) ** 2]
+    )
+
+# Added to radii tested on the R*Tree's 32-bit coordinates, which may be off
+# by a few metres; the exact test runs on RealEstate
+GEO_SLACK_KM = 0.01
+
+def _radius_filter(admin_id: int, latitude: float, longitude: float, km: float) -> Tuple[str, List[Any]]:
+    """Condition keeping properties within km of a point, and its params.
+
+    The R*Tree drops the corners of the bounding box itself, so only
+    listings inside the circle are looked up in RealEstate.
+    """
+    south, west, north, east = bounding_box(latitude, longitude, km + GEO_SLACK_KM)
+    coarse, coarse_params = _squared_distance(latitude, longitude, ('min_lat', 'min_lon'))
+    exact, exact_params = _squared_distance(latitude, longitude)
+    return f"""
+        AND r.id IN (
+            SELECT id FROM RealEstateGeo
+            WHERE min_admin <= ? AND max_admin >= ?
+              AND max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?
+              AND {coarse} <= ?
+        )
+        AND {exact} <= ?
+    """, ([admin_id, admin_id, south, north, west, east] + coarse_params + [(km + GEO_SLACK_KM) ** 2]
+          + exact_params + [km * km])
+
+def _property_filters(admin_id, search_term=None, property_type=None, min_price=None, max_price=None, min_area=None, max_area=None, city=None, district=None, amenities=None, bbox=None, within=None):
+    """Build the FROM/WHERE clause shared by the property searches.
+
+    bbox is (south, west, north, east) and within (latitude, longitude, km).
+    Returns (sql, params, match) where match is the FTS query, or None when
+    there is no text filter. RealEstate is aliased as r, RealEstateFTS as f.
+    """
+    match = fts_query(search_term) if search_term else None
+    if match:
+        # Ranked full-text search over the normalized RealEstateFTS index
         query = """
-            SELECT * FROM RealEstate 
-            WHERE admin_id = ?
+            FROM RealEstateFTS f
+            JOIN RealEstate r ON r.id = f.rowid
+            WHERE f.RealEstateFTS MATCH ? AND r.admin_id = ?
+        """
+        params = [match, admin_id]
+    else:
+        query = """
+            FROM RealEstate r
+            WHERE r.admin_id = ?
         """
         params = [admin_id]
-        
-        if search_term:
-            query += " AND (title LIKE ? OR description LIKE ? OR location_details LIKE ?)"
-            params.extend([f"%{search_term}%"] * 3)
-        
-        if property_type:
-            query += " AND property_type = ?"
-            params.append(property_type)
-        
-        if min_price is not None:
-            query += " AND price >= ?"
-            params.append(min_price)
-        
-        if max_price is not None:
-            query += " AND price <= ?"
-            params.append(max_price)
-        
-        if min_area is not None:
-            query += " AND area >= ?"
-            params.append(min_area)
-        
-        if max_area is not None:
-            query += " AND area <= ?"
-            params.append(max_area)
-        
-        if city:
-            query += " AND city = ?"
-            params.append(city)
-        
-        if district:
-            query += " AND district = ?"
-            params.append(district)
-        
-        cursor.execute(query, params)
-        properties = cursor.fetchall()
-        
-        return properties
+    
+    if property_type:
+        query += " AND r.property_type = ?"
+        params.append(property_type)
+    
+    if min_price is not None:
+        query += " AND r.price >= ?"
+        params.append(min_price)
+    
+    if max_price is not None:
+        query += " AND r.price <= ?"
+        params.append(max_price)
+    
+    if min_area is not None:
+        query += " AND r.area >= ?"
+        params.append(min_area)
+    
+    if max_area is not None:
+        query += " AND r.area <= ?"
+        params.append(max_area)
+    
+    if city:
+        query += " AND r.city = ?"
+        params.append(city)
+    
+    if district:
+        query += " AND r.district = ?"
+        params.append(district)
+    
+    if amenities:
+        condition, condition_params = _term_filter('r.id', 'RealEstateTerm', 'real_estate_id', admin_id, amenities)
+        query += condition
+        params.extend(condition_params)
+    
+    if bbox:
+        condition, condition_params = _box_filter(admin_id, *_floats(bbox))
+        query += condition
+        params.extend(condition_params)
+    
+    if within:
+        condition, condition_params = _radius_filter(admin_id, *_floats(within))
+        query += condition
+        params.extend(condition_params)
+    
+    return query, params, match
+
+def search_properties(admin_id, search_term=None, property_type=None, min_price=None, max_price=None, min_area=None, max_area=None, city=None, district=None, amenities=None, bbox=None, within=None):
+    """Search for properties with various filters"""
+    try:
+        query, params, match = _property_filters(
+            admin_id, search_term, property_type, min_price, max_price,
+            min_area, max_area, city, district, amenities, bbox, within
+        )
+        query = "SELECT r.* " + query
+        if match:
+            query += " ORDER BY f.rank"
+        return execute_cached_query(query, params, admin_id, ('RealEstate',))
     except Exception as e:
         print(f"Error searching properties: {str(e)}")
         return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
-def add_property(property_data: dict) -> int:
-    """Add a new property"""
+# Radius of the first box nearest_properties() tries; it doubles until the
+# box holds k listings
+NEAREST_START_KM = 0.25
+# Half the Earth's circumference, a box this size covers every listing
+NEAREST_MAX_KM = 20040
+# Bisection steps narrowing the radius once a box holds k listings, so a
+# point far from everything does not pull in whole cities
+NEAREST_REFINE_STEPS = 6
+
+def _box_holds(admin_id: int, km: float, latitude: float, longitude: float, k: int) -> bool:
+    """Whether the box around a point holds k listings of admin_id, read from the R*Tree alone"""
+    south, west, north, east = bounding_box(latitude, longitude, km)
+    return execute_cached_query("""
+        SELECT EXISTS (
+            SELECT 1 FROM RealEstateGeo
+            WHERE min_admin <= ? AND max_admin >= ?
+              AND max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?
+            LIMIT 1 OFFSET ?
+        )
+    """, [admin_id, admin_id, south, north, west, east, k - 1], admin_id, ('RealEstate',))[0][0] == 1
+
+def nearest_properties(admin_id, latitude, longitude, k=10, **filters) -> List[Tuple[Record, float]]:
+    """The k properties closest to a point as (record, km), nearest first.
+
+    filters are those of search_properties(). The smallest box found on
+    the R*Tree counts that holds k matches gives a k-th distance to beat;
+    one radius query of that distance then gives the exact answer. Boxes
+    grow again when the filters leave fewer than k matches.
+    """
+    try:
+        distance, distance_params = _squared_distance(latitude, longitude)
+
+        def closest(**area):
+            query, params, _ = _property_filters(admin_id, **area, **filters)
+            return execute_cached_query(
+                f"SELECT r.* {query} ORDER BY {distance}, r.id LIMIT ?",
+                params + distance_params + [k], admin_id, ('RealEstate',)
+            )
+
+        low, km, refine = 0, NEAREST_START_KM, True
+        while km < NEAREST_MAX_KM:
+            if not _box_holds(admin_id, km, latitude, longitude, k):
+                low, km = km, km * 2
+                continue
+            if refine:
+                for _ in range(NEAREST_REFINE_STEPS):
+                    middle = (low + km) / 2
+                    if _box_holds(admin_id, middle, latitude, longitude, k):
+                        km = middle
+                    else:
+                        low = middle
+                refine = False
+            rows = closest(bbox=bounding_box(latitude, longitude, km))
+            if len(rows) == k:
+                # Slack keeps the k-th itself despite rounding, extra rows only lose the sort
+                last = rows[-1]
+                radius = distance_km(latitude, longitude, last.latitude, last.longitude) + GEO_SLACK_KM
+                rows = closest(within=(latitude, longitude, radius))
+                break
+            km *= 2
+        else:
+            rows = closest(bbox=(-90, -180, 90, 180))
+        return [(row, distance_km(latitude, longitude, row.latitude, row.longitude)) for row in rows]
+    except Exception as e:
+        print(f"Error finding nearest properties: {str(e)}")
+        return []
+
+# Past the finest clustering level, a viewport holding at most this many
+# listings shows them one by one
+MAP_MAX_POINTS = 500
+
+def map_cluster_level(zoom: float) -> int:
+    """Finest clustering level not finer than the map zoom"""
+    return max([level for level in MAP_CLUSTER_LEVELS if level <= zoom] or MAP_CLUSTER_LEVELS[:1])
+
+def _tile_clusters(admin_id: int, level: int, tile_x: int, tile_y: int) -> List[Record]:
+    """(latitude, longitude, count) of the non-empty cells of one tile"""
+    first_x, first_y = tile_x * MAP_CELLS_PER_TILE, tile_y * MAP_CELLS_PER_TILE
+    return execute_cached_query("""
+        SELECT sum_lat / count AS latitude, sum_lon / count AS longitude, count
+        FROM MapCluster
+        WHERE admin_id = ? AND level = ?
+          AND cell_x BETWEEN ? AND ? AND cell_y BETWEEN ? AND ?
+          AND count > 0
+    """, [admin_id, level, first_x, first_x + MAP_CELLS_PER_TILE - 1,
+          first_y, first_y + MAP_CELLS_PER_TILE - 1], admin_id, ('RealEstate',))
+
+def _viewport_points(admin_id: int, south: float, west: float, north: float, east: float) -> List[Record]:
+    """(latitude, longitude, 1) of each listing in the box, read from the R*Tree"""
+    return execute_cached_query("""
+        SELECT min_lat AS latitude, min_lon AS longitude, 1 AS count
+        FROM RealEstateGeo
+        WHERE min_admin <= ? AND max_admin >= ?
+          AND max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?
+        LIMIT ?
+    """, [admin_id, admin_id, south, north, west, east, MAP_MAX_POINTS + 1], admin_id, ('RealEstate',))
+
+def map_clusters(admin_id, zoom, south, west, north, east) -> List[Record]:
+    """Clusters of the admin's listings in a map viewport as (latitude, longitude, count).
+
+    Clusters are the cells of the MapCluster level matching the zoom, read
+    and cached tile by tile, so panning only reads the tiles that come into
+    view. Each cluster is placed at the mean position of its listings.
+    Zoomed in past the finest level, a viewport with few enough listings
+    returns them individually with a count of 1.
+    """
+    try:
+        if zoom > MAP_CLUSTER_LEVELS[-1]:
+            points = _viewport_points(admin_id, south, west, north, east)
+            if len(points) <= MAP_MAX_POINTS:
+                return points
+        level = map_cluster_level(zoom)
+        span = 360 / 2 ** level
+        columns, rows = 2 ** level - 1, 2 ** (level - 1) - 1
+        clusters = []
+        for tile_x in range(int((west + 180) // span), min(int((east + 180) // span), columns) + 1):
+            for tile_y in range(int((south + 90) // span), min(int((north + 90) // span), rows) + 1):
+                clusters.extend(
+                    cluster for cluster in _tile_clusters(admin_id, level, tile_x, tile_y)
+                    if south <= cluster.latitude <= north and west <= cluster.longitude <= east
+                )
+        return clusters
+    except Exception as e:
+        print(f"Error reading map clusters: {str(e)}")
+        return []
+
+# Sort keys accepted by search_properties_page: name -> (expression, direction)
+PROPERTY_SORTS = {
+    'newest': ('r.announcement_date', 'DESC'),
+    'oldest': ('r.announcement_date', 'ASC'),
+    'price_asc': ('r.price', 'ASC'),
+    'price_desc': ('r.price', 'DESC'),
+    'relevance': ('f.rank', 'ASC'),  # only with a search term
+}
+
+def search_properties_page(admin_id, sort='newest', cursor=None, limit=20, with_total=False, **filters) -> Page:
+    """One page of search_properties() results using keyset pagination.
+
+    filters are the keyword arguments of search_properties(). Pass the
+    returned next_cursor back as cursor to get the following page.
+    """
+    try:
+        query, params, match = _property_filters(admin_id, **filters)
+        if sort == 'relevance' and not match:
+            sort = 'newest'
+        return _fetch_page('r.*', 'r.id', query, params, PROPERTY_SORTS[sort], cursor, limit, with_total, admin_id, ('RealEstate',))
+    except Exception as e:
+        print(f"Error searching properties: {str(e)}")
+        return Page([], None, 0 if with_total else None)
+
+def export_properties(admin_id, chunk_size=EXPORT_CHUNK_SIZE, **filters) -> Iterator[List[Record]]:
+    """All search_properties() results in chunks, ordered by id"""
+    query, params, match = _property_filters(admin_id, **filters)
+    if match:
+        # Seek on the FTS rowid so each chunk resumes inside the index
+        return _iter_chunks('r.*', 'f.rowid', query, params, chunk_size)
+    return _iter_chunks('r.*', 'r.id', _scan_by_id(query, 'RealEstate r'), params, chunk_size)
+
+def _with_coordinates(property_data: dict) -> dict:
+    """property_data with latitude/longitude from utils.geo.locate()"""
+    latitude, longitude = locate(property_data)
+    return dict(property_data, latitude=latitude, longitude=longitude)
+
+class DuplicatePropertyError(Exception):
+    """Raised by add_property(check_duplicates=True) for a listing that is already in the database"""
+    def __init__(self, duplicates: List[Tuple[Record, str, float]]):
+        super().__init__(f"العقار مكرر لـ {len(duplicates)} عقار موجود")
+        self.duplicates = duplicates
+
+def add_property(property_data: dict, check_duplicates: bool = False) -> int:
+    """Add a new property.
+
+    With check_duplicates, a property that find_duplicates() matches to
+    existing ones is not added; DuplicatePropertyError lists them instead.
+    """
+    if check_duplicates:
+        duplicates = find_duplicates(property_data['admin_id'], property_data)
+        if duplicates:
+            raise DuplicatePropertyError(duplicates)
+    property_data = _with_coordinates(property_data)
     query = """
     INSERT INTO RealEstate (
         title, property_type, property_scale, area, category,
         floors, bedrooms, bathrooms, living_rooms, price,
-        region, district, city, location_link, source_link,
+        region, district, city, location_link, latitude, longitude, source_link,
         location_details, description, status, admin_id
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """
     params = [
         property_data['title'],
@@ -173,123 +632,186 @@ def add_property(property_data: dict) -> int:
         property_data['district'],
         property_data['city'],
         property_data['location_link'],
+        property_data['latitude'],
+        property_data['longitude'],
         property_data['source_link'],
         property_data['location_details'],
         property_data['description'],
         property_data['status'],
         property_data['admin_id']
     ]
-    return execute_update(query, params)
+    property_id = execute_update(query, params)
+    invalidate(property_data['admin_id'], 'RealEstate')
+    _refresh_property_indexes([range(property_id, property_id + 1)], [property_data['admin_id']])
+    return property_id
+
+PROPERTY_COLUMNS = [
+    'title', 'property_type', 'property_scale', 'area', 'category',
+    'floors', 'bedrooms', 'bathrooms', 'living_rooms', 'price',
+    'region', 'district', 'city', 'location_link', 'latitude', 'longitude',
+    'source_link', 'location_details', 'description', 'status', 'admin_id'
+]
+
+def add_properties_bulk(properties: Iterable[dict], chunk_size: int = BULK_CHUNK_SIZE) -> List[range]:
+    """Add many properties in one transaction and return their id ranges"""
+    admin_ids = set()
+
+    def rows():
+        for property_data in properties:
+            admin_ids.add(property_data['admin_id'])
+            yield _with_coordinates(property_data)
+
+    id_ranges = execute_bulk_insert('RealEstate', PROPERTY_COLUMNS, rows(), chunk_size)
+    _refresh_property_indexes(id_ranges, admin_ids)
+    return id_ranges
 
 def update_property(property_data):
     """Update an existing property"""
+    property_data = _with_coordinates(property_data)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute("""
-            UPDATE RealEstate
-            SET title = ?, property_type = ?, property_scale = ?, area = ?,
-                category = ?, floors = ?, bedrooms = ?, bathrooms = ?,
-                living_rooms = ?, price = ?, region = ?, district = ?,
-                city = ?, location_link = ?, source_link = ?,
-                location_details = ?, description = ?, status = ?
-            WHERE id = ? AND admin_id = ?
-        """, (
-            property_data['title'],
-            property_data['property_type'],
-            property_data['property_scale'],
-            property_data['area'],
-            property_data['category'],
-            property_data['floors'],
-            property_data['bedrooms'],
-            property_data['bathrooms'],
-            property_data['living_rooms'],
-            property_data['price'],
-            property_data['region'],
-            property_data['district'],
-            property_data['city'],
-            property_data['location_link'],
-            property_data['source_link'],
-            property_data['location_details'],
-            property_data['description'],
-            property_data['status'],
-            property_data['id'],
-            property_data['admin_id']
-        ))
-        conn.commit()
+            cursor.execute("""
+                UPDATE RealEstate
+                SET title = ?, property_type = ?, property_scale = ?, area = ?,
+                    category = ?, floors = ?, bedrooms = ?, bathrooms = ?,
+                    living_rooms = ?, price = ?, region = ?, district = ?,
+                    city = ?, location_link = ?, latitude = ?, longitude = ?,
+                    source_link = ?, location_details = ?, description = ?, status = ?
+                WHERE id = ? AND admin_id = ?
+            """, (
+                property_data['title'],
+                property_data['property_type'],
+                property_data['property_scale'],
+                property_data['area'],
+                property_data['category'],
+                property_data['floors'],
+                property_data['bedrooms'],
+                property_data['bathrooms'],
+                property_data['living_rooms'],
+                property_data['price'],
+                property_data['region'],
+                property_data['district'],
+                property_data['city'],
+                property_data['location_link'],
+                property_data['latitude'],
+                property_data['longitude'],
+                property_data['source_link'],
+                property_data['location_details'],
+                property_data['description'],
+                property_data['status'],
+                property_data['id'],
+                property_data['admin_id']
+            ))
+            conn.commit()
+        invalidate(property_data['admin_id'], 'RealEstate')
+        _refresh_property_indexes([range(property_data['id'], property_data['id'] + 1)], [property_data['admin_id']])
     except Exception as e:
         print(f"Error updating property: {str(e)}")
         raise e
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 def delete_property(property_id, admin_id=1):
     """Delete a property"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
         
-        # First delete associated records
-        cursor.execute("DELETE FROM MarketerRealEstate WHERE real_estate_id = ? AND admin_id = ?", (property_id, admin_id))
-        cursor.execute("DELETE FROM BuyerRealEstate WHERE real_estate_id = ? AND admin_id = ?", (property_id, admin_id))
-        # Then delete the property
-        cursor.execute("DELETE FROM RealEstate WHERE id = ? AND admin_id = ?", (property_id, admin_id))
-        conn.commit()
+            # First delete associated records
+            cursor.execute("DELETE FROM MarketerRealEstate WHERE real_estate_id = ? AND admin_id = ?", (property_id, admin_id))
+            cursor.execute("DELETE FROM BuyerRealEstate WHERE real_estate_id = ? AND admin_id = ?", (property_id, admin_id))
+            # Then delete the property
+            cursor.execute("DELETE FROM RealEstate WHERE id = ? AND admin_id = ?", (property_id, admin_id))
+            conn.commit()
+        invalidate(admin_id, 'RealEstate', 'MarketerRealEstate', 'BuyerRealEstate')
+        _refresh_property_indexes([range(property_id, property_id + 1)], [admin_id])
     except Exception as e:
         print(f"Error deleting property: {str(e)}")
         raise e
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 # Buyer functions
-def search_buyers(admin_id, search_term=None, min_budget=None, max_budget=None, preferred_city=None):
+def _buyer_filters(admin_id, search_term=None, min_budget=None, max_budget=None, preferred_city=None, interests=None):
+    """Build the FROM/WHERE clause shared by the buyer searches"""
+    query = """
+        FROM Buyer 
+        WHERE admin_id = ?
+    """
+    params = [admin_id]
+    
+    if search_term:
+        query += " AND (name LIKE ? OR phone LIKE ? OR email LIKE ? OR interests LIKE ?)"
+        params.extend([f"%{search_term}%"] * 4)
+    
+    if min_budget is not None:
+        query += " AND budget >= ?"
+        params.append(min_budget)
+    
+    if max_budget is not None:
+        query += " AND budget <= ?"
+        params.append(max_budget)
+    
+    if preferred_city:
+        query += " AND preferred_city = ?"
+        params.append(preferred_city)
+    
+    if interests:
+        condition, condition_params = _term_filter('id', 'BuyerTerm', 'buyer_id', admin_id, interests)
+        query += condition
+        params.extend(condition_params)
+    
+    return query, params
+
+def search_buyers(admin_id, search_term=None, min_budget=None, max_budget=None, preferred_city=None, interests=None):
     """Search for buyers with various filters"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        query = """
-            SELECT * FROM Buyer 
-            WHERE admin_id = ?
-        """
-        params = [admin_id]
-        
-        if search_term:
-            query += " AND (name LIKE ? OR phone LIKE ? OR email LIKE ? OR interests LIKE ?)"
-            params.extend([f"%{search_term}%"] * 4)
-        
-        if min_budget is not None:
-            query += " AND budget >= ?"
-            params.append(min_budget)
-        
-        if max_budget is not None:
-            query += " AND budget <= ?"
-            params.append(max_budget)
-        
-        if preferred_city:
-            query += " AND preferred_city = ?"
-            params.append(preferred_city)
-        
-        cursor.execute(query, params)
-        buyers = cursor.fetchall()
-        
-        return buyers
+        query, params = _buyer_filters(admin_id, search_term, min_budget, max_budget, preferred_city, interests)
+        return execute_cached_query("SELECT * " + query, params, admin_id, ('Buyer',))
     except Exception as e:
         print(f"Error searching buyers: {str(e)}")
         return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
+
+def get_interest_terms(admin_id) -> List[Record]:
+    """Terms of an admin's buyer interests with how many buyers have each, most common first"""
+    try:
+        return execute_cached_query("""
+            SELECT t.term, COUNT(*) AS buyers
+            FROM BuyerTerm bt
+            JOIN Term t ON t.id = bt.term_id
+            WHERE bt.admin_id = ?
+            GROUP BY bt.term_id
+            ORDER BY buyers DESC, t.term
+        """, [admin_id], admin_id, ('Buyer',))
+    except Exception as e:
+        print(f"Error getting interest terms: {str(e)}")
+        return []
+
+BUYER_SORTS = {
+    'name': ('name', 'ASC'),
+    'budget_desc': ('budget', 'DESC'),
+    'budget_asc': ('budget', 'ASC'),
+}
+
+def search_buyers_page(admin_id, sort='name', cursor=None, limit=20, with_total=False, **filters) -> Page:
+    """One page of search_buyers() results using keyset pagination"""
+    try:
+        query, params = _buyer_filters(admin_id, **filters)
+        return _fetch_page('*', 'id', query, params, BUYER_SORTS[sort], cursor, limit, with_total, admin_id, ('Buyer',))
+    except Exception as e:
+        print(f"Error searching buyers: {str(e)}")
+        return Page([], None, 0 if with_total else None)
+
+def export_buyers(admin_id, chunk_size=EXPORT_CHUNK_SIZE, **filters) -> Iterator[List[Record]]:
+    """All search_buyers() results in chunks, ordered by id"""
+    query, params = _buyer_filters(admin_id, **filters)
+    return _iter_chunks('*', 'id', _scan_by_id(query, 'Buyer'), params, chunk_size)
 
 def add_buyer(buyer_data: dict) -> int:
     """Add a new buyer"""
     query = """
     INSERT INTO Buyer (
-        name, phone, email, budget, interests, admin_id
-    ) VALUES (?, ?, ?, ?, ?, ?)
+        name, phone, email, budget, interests,
+        preferred_region, preferred_city, preferred_district, admin_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
     """
     params = [
         buyer_data['name'],
@@ -297,15 +819,28 @@ def add_buyer(buyer_data: dict) -> int:
         buyer_data['email'],
         buyer_data['budget'],
         buyer_data['interests'],
+        buyer_data.get('preferred_region'),
+        buyer_data.get('preferred_city'),
+        buyer_data.get('preferred_district'),
         buyer_data['admin_id']
     ]
-    return execute_update(query, params)
+    buyer_id = execute_update(query, params)
+    invalidate(buyer_data['admin_id'], 'Buyer')
+    return buyer_id
+
+BUYER_COLUMNS = [
+    'name', 'phone', 'email', 'budget', 'interests',
+    'preferred_region', 'preferred_city', 'preferred_district', 'admin_id'
+]
+
+def add_buyers_bulk(buyers: Iterable[dict], chunk_size: int = BULK_CHUNK_SIZE) -> List[range]:
+    """Add many buyers in one transaction and return their id ranges"""
+    return execute_bulk_insert('Buyer', BUYER_COLUMNS, buyers, chunk_size)
 
 def update_buyer(buyer_data):
     """Update an existing buyer"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
+    with db_connection() as conn:
+        cursor = conn.cursor()
         cursor.execute("""
             UPDATE Buyer
             SET name = ?, phone = ?, email = ?, budget = ?,
@@ -325,55 +860,67 @@ def update_buyer(buyer_data):
             buyer_data['admin_id']
         ))
         conn.commit()
-    finally:
-        conn.close()
+    invalidate(buyer_data['admin_id'], 'Buyer')
 
 def delete_buyer(buyer_id, admin_id=1):
     """Delete a buyer"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
         
-        # First delete associated records
-        cursor.execute("DELETE FROM BuyerRealEstate WHERE buyer_id = ? AND admin_id = ?", (buyer_id, admin_id))
-        # Then delete the buyer
-        cursor.execute("DELETE FROM Buyer WHERE id = ? AND admin_id = ?", (buyer_id, admin_id))
-        conn.commit()
+            # First delete associated records
+            cursor.execute("DELETE FROM BuyerRealEstate WHERE buyer_id = ? AND admin_id = ?", (buyer_id, admin_id))
+            # Then delete the buyer
+            cursor.execute("DELETE FROM Buyer WHERE id = ? AND admin_id = ?", (buyer_id, admin_id))
+            conn.commit()
+        invalidate(admin_id, 'Buyer', 'BuyerRealEstate')
     except Exception as e:
         print(f"Error deleting buyer: {str(e)}")
         raise e
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 # Marketer functions
+def _marketer_filters(admin_id, search_term=None, city=None):
+    """Build the FROM/WHERE clause shared by the marketer searches"""
+    query = """
+        FROM Marketer 
+        WHERE admin_id = ?
+    """
+    params = [admin_id]
+    
+    if search_term:
+        query += " AND (name LIKE ? OR phone LIKE ? OR email LIKE ? OR marketer_type LIKE ?)"
+        params.extend([f"%{search_term}%"] * 4)
+    
+    return query, params
+
+MARKETER_COLUMNS = "id, name, phone, email, marketer_type, admin_id"
+
 def search_marketers(admin_id, search_term=None, city=None):
     """Search for marketers with various filters"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        query = """
-            SELECT id, name, phone, email, marketer_type, admin_id 
-            FROM Marketer 
-            WHERE admin_id = ?
-        """
-        params = [admin_id]
-        
-        if search_term:
-            query += " AND (name LIKE ? OR phone LIKE ? OR email LIKE ? OR marketer_type LIKE ?)"
-            params.extend([f"%{search_term}%"] * 4)
-        
-        cursor.execute(query, params)
-        marketers = cursor.fetchall()
-        
-        return marketers
+        query, params = _marketer_filters(admin_id, search_term, city)
+        return execute_cached_query(f"SELECT {MARKETER_COLUMNS} " + query, params, admin_id, ('Marketer',))
     except Exception as e:
         print(f"Error searching marketers: {str(e)}")
         return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
+
+MARKETER_SORTS = {
+    'name': ('name', 'ASC'),
+}
+
+def search_marketers_page(admin_id, sort='name', cursor=None, limit=20, with_total=False, **filters) -> Page:
+    """One page of search_marketers() results using keyset pagination"""
+    try:
+        query, params = _marketer_filters(admin_id, **filters)
+        return _fetch_page(MARKETER_COLUMNS, 'id', query, params, MARKETER_SORTS[sort], cursor, limit, with_total, admin_id, ('Marketer',))
+    except Exception as e:
+        print(f"Error searching marketers: {str(e)}")
+        return Page([], None, 0 if with_total else None)
+
+def export_marketers(admin_id, chunk_size=EXPORT_CHUNK_SIZE, **filters) -> Iterator[List[Record]]:
+    """All search_marketers() results in chunks, ordered by id"""
+    query, params = _marketer_filters(admin_id, **filters)
+    return _iter_chunks(MARKETER_COLUMNS, 'id', _scan_by_id(query, 'Marketer'), params, chunk_size)
 
 def add_marketer(marketer_data: dict) -> int:
     """Add a new marketer"""
@@ -389,13 +936,18 @@ def add_marketer(marketer_data: dict) -> int:
         marketer_data['email'],
         marketer_data['admin_id']
     ]
-    return execute_update(query, params)
+    marketer_id = execute_update(query, params)
+    invalidate(marketer_data['admin_id'], 'Marketer')
+    return marketer_id
+
+def add_marketers_bulk(marketers: Iterable[dict], chunk_size: int = BULK_CHUNK_SIZE) -> List[range]:
+    """Add many marketers in one transaction and return their id ranges"""
+    return execute_bulk_insert('Marketer', ['name', 'phone', 'marketer_type', 'email', 'admin_id'], marketers, chunk_size)
 
 def update_marketer(marketer_data):
     """Update an existing marketer"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
+    with db_connection() as conn:
+        cursor = conn.cursor()
         cursor.execute("""
             UPDATE Marketer
             SET name = ?, phone = ?, email = ?, marketer_type = ?
@@ -409,26 +961,23 @@ def update_marketer(marketer_data):
             marketer_data['admin_id']
         ))
         conn.commit()
-    finally:
-        conn.close()
+    invalidate(marketer_data['admin_id'], 'Marketer')
 
 def delete_marketer(marketer_id, admin_id=1):
     """Delete a marketer"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
         
-        # First delete associated records
-        cursor.execute("DELETE FROM MarketerRealEstate WHERE marketer_id = ? AND admin_id = ?", (marketer_id, admin_id))
-        # Then delete the marketer
-        cursor.execute("DELETE FROM Marketer WHERE id = ? AND admin_id = ?", (marketer_id, admin_id))
-        conn.commit()
+            # First delete associated records
+            cursor.execute("DELETE FROM MarketerRealEstate WHERE marketer_id = ? AND admin_id = ?", (marketer_id, admin_id))
+            # Then delete the marketer
+            cursor.execute("DELETE FROM Marketer WHERE id = ? AND admin_id = ?", (marketer_id, admin_id))
+            conn.commit()
+        invalidate(admin_id, 'Marketer', 'MarketerRealEstate')
     except Exception as e:
         print(f"Error deleting marketer: {str(e)}")
         raise e
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 def get_marketer_real_estates(marketer_id, admin_id=1):
     """Get all real estates associated with a marketer"""
@@ -439,9 +988,9 @@ def get_marketer_real_estates(marketer_id, admin_id=1):
     WHERE mr.marketer_id = ? AND mr.admin_id = ?
     ORDER BY r.announcement_date DESC
     """
-    return execute_query(query, [marketer_id, admin_id])
+    return execute_cached_query(query, [marketer_id, admin_id], admin_id, ('RealEstate', 'MarketerRealEstate'))
 
-def get_marketer_buyers(marketer_id: int) -> List[tuple]:
+def get_marketer_buyers(marketer_id: int) -> List[Record]:
     """Get all buyers associated with a marketer's real estates"""
     query = """
     SELECT DISTINCT b.*, 
@@ -456,9 +1005,9 @@ def get_marketer_buyers(marketer_id: int) -> List[tuple]:
     GROUP BY b.id
     ORDER BY b.name
     """
-    return execute_query(query, [marketer_id])
+    return execute_cached_query(query, [marketer_id], None, ('Buyer', 'BuyerRealEstate', 'RealEstate', 'MarketerRealEstate'))
 
-def get_buyer_real_estates(buyer_id: int, admin_id=1) -> List[tuple]:
+def get_buyer_real_estates(buyer_id: int, admin_id=1) -> List[Record]:
     """Get all real estates associated with a buyer that he is intrested in buying"""
     # query = """
     # SELECT r.*, 
@@ -480,26 +1029,56 @@ def get_buyer_real_estates(buyer_id: int, admin_id=1) -> List[tuple]:
     WHERE br.buyer_id = ? AND r.admin_id = ?
     ORDER BY r.announcement_date DESC
     """
-    return execute_query(query, [buyer_id, admin_id])
+    return execute_cached_query(query, [buyer_id, admin_id], admin_id, ('RealEstate', 'BuyerRealEstate'))
+
+LINKED_REAL_ESTATE_FIELDS = ['id', 'title', 'property_type', 'region', 'city', 'district', 'price']
+# Keeps IN (...) lists well under SQLite's bound-parameter limit
+LINK_BATCH_SIZE = 500
+
+def _real_estates_for(link_table: str, owner_column: str, owner_ids: Iterable[int], admin_id: int) -> Dict[int, List[Record]]:
+    """Linked real estates of many owners, newest first, in one query per batch"""
+    owner_ids = list(dict.fromkeys(owner_ids))
+    linked = {owner_id: [] for owner_id in owner_ids}
+    record = record_class(tuple(LINKED_REAL_ESTATE_FIELDS))
+    for batch in _chunks(owner_ids, LINK_BATCH_SIZE):
+        rows = execute_cached_query(f"""
+            SELECT l.{owner_column}, {', '.join('r.' + field for field in LINKED_REAL_ESTATE_FIELDS)}
+            FROM {link_table} l
+            JOIN RealEstate r ON r.id = l.real_estate_id
+            WHERE l.{owner_column} IN ({', '.join('?' * len(batch))}) AND l.admin_id = ?
+            ORDER BY r.announcement_date DESC
+        """, batch + [admin_id], admin_id, ('RealEstate', link_table))
+        for row in rows:
+            linked[row[0]].append(record._make(row[1:]))
+    return linked
+
+def get_real_estates_for_buyers(buyer_ids: Iterable[int], admin_id: int) -> Dict[int, List[Record]]:
+    """Map each buyer id to the real estates linked to it"""
+    return _real_estates_for('BuyerRealEstate', 'buyer_id', buyer_ids, admin_id)
+
+def get_real_estates_for_marketers(marketer_ids: Iterable[int], admin_id: int) -> Dict[int, List[Record]]:
+    """Map each marketer id to the real estates linked to it"""
+    return _real_estates_for('MarketerRealEstate', 'marketer_id', marketer_ids, admin_id)
 
 def add_buyer_real_estate(buyer_id, real_estate_id, admin_id=1):
     """Add a relationship between a buyer and a real estate"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute("""
-            INSERT INTO BuyerRealEstate (buyer_id, real_estate_id, admin_id)
-            VALUES (?, ?, ?)
-        """, (buyer_id, real_estate_id, admin_id))
-        conn.commit()
+            cursor.execute("""
+                INSERT INTO BuyerRealEstate (buyer_id, real_estate_id, admin_id)
+                VALUES (?, ?, ?)
+            """, (buyer_id, real_estate_id, admin_id))
+            conn.commit()
+        invalidate(admin_id, 'BuyerRealEstate')
     except Exception as e:
         print(f"Error adding buyer real estate: {str(e)}")
         raise e
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
+def add_buyer_real_estates_bulk(links: Iterable[Tuple[int, int, int]], chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """Add many (buyer_id, real_estate_id, admin_id) links, skipping existing ones"""
+    return execute_bulk_link('BuyerRealEstate', ['buyer_id', 'real_estate_id', 'admin_id'], links, chunk_size)
 
 def delete_buyer_real_estate(buyer_id: int, real_estate_id: int, admin_id=1) -> None:
     """Delete a relationship between a buyer and a real estate"""
@@ -508,6 +1087,7 @@ def delete_buyer_real_estate(buyer_id: int, real_estate_id: int, admin_id=1) ->
     WHERE buyer_id = ? AND real_estate_id = ? AND admin_id = ?
     """
     execute_delete(query, [buyer_id, real_estate_id, admin_id])
+    invalidate(admin_id, 'BuyerRealEstate')
 
 def add_marketer_real_estate(marketer_id: int, real_estate_id: int, admin_id=1) -> None:
     """Add a relationship between a marketer and a real estate"""
@@ -516,7 +1096,11 @@ def add_marketer_real_estate(marketer_id: int, real_estate_id: int, admin_id=1)
     VALUES (?, ?, ?)
     """
     execute_update(query, [marketer_id, real_estate_id, admin_id])
+    invalidate(admin_id, 'MarketerRealEstate')
 
+def add_marketer_real_estates_bulk(links: Iterable[Tuple[int, int, int]], chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """Add many (marketer_id, real_estate_id, admin_id) links, skipping existing ones"""
+    return execute_bulk_link('MarketerRealEstate', ['marketer_id', 'real_estate_id', 'admin_id'], links, chunk_size)
 
 def delete_marketer_real_estate(marketer_id: int, real_estate_id: int, admin_id=1) -> None:
     """Delete a relationship between a marketer and a real estate"""
@@ -525,33 +1109,311 @@ def delete_marketer_real_estate(marketer_id: int, real_estate_id: int, admin_id=
     WHERE marketer_id = ? AND real_estate_id = ? AND admin_id = ?
     """
     execute_delete(query, [marketer_id, real_estate_id, admin_id])
+    invalidate(admin_id, 'MarketerRealEstate')
+
+def _export_links(link_table: str, owner_table: str, owner_column: str, admin_id: int,
+                  chunk_size: int) -> Iterator[List[Record]]:
+    from_where = f"""
+        FROM {link_table} l
+        JOIN {owner_table} o ON o.id = l.{owner_column}
+        JOIN RealEstate r ON r.id = l.real_estate_id
+        WHERE l.admin_id = ?
+    """
+    columns = f"l.{owner_column}, o.name AS {owner_column[:-3]}_name, l.real_estate_id, r.title AS real_estate_title"
+    return _iter_chunks(columns, 'l.id', from_where, [admin_id], chunk_size)
+
+def export_buyer_real_estates(admin_id, chunk_size=EXPORT_CHUNK_SIZE) -> Iterator[List[Record]]:
+    """All buyer-property links of an admin in chunks"""
+    return _export_links('BuyerRealEstate', 'Buyer', 'buyer_id', admin_id, chunk_size)
+
+def export_marketer_real_estates(admin_id, chunk_size=EXPORT_CHUNK_SIZE) -> Iterator[List[Record]]:
+    """All marketer-property links of an admin in chunks"""
+    return _export_links('MarketerRealEstate', 'Marketer', 'marketer_id', admin_id, chunk_size)
 
 def get_all_real_estates(admin_id):
     """Get all real estates for a dropdown"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
+        return execute_cached_query("""
             SELECT id, title, property_type, region, city, district, price
             FROM RealEstate
             WHERE admin_id = ?
             ORDER BY title
-        """, (admin_id,))
-        
-        real_estates = cursor.fetchall()
-        return [{
-            'id': re[0],
-            'title': re[1],
-            'property_type': re[2],
-            'region': re[3],
-            'city': re[4],
-            'district': re[5],
-            'price': re[6]
-        } for re in real_estates]
+        """, [admin_id], admin_id, ('RealEstate',))
     except Exception as e:
         print(f"Error getting real estates: {str(e)}")
         return []
-    finally:
-        if 'conn' in locals():
-            conn.close() 
\ No newline at end of file
+
+# Picker indexes are shared by every session of the process, one per admin
+PROPERTY_INDEX_TTL = float(os.environ.get('AQARDASH_PICKER_TTL', '600'))
+PICKER_FIELDS = "id, title, city, district, price"
+_property_indexes: Dict[int, PropertyIndex] = {}
+_property_indexes_lock = threading.Lock()
+
+def get_property_index(admin_id) -> PropertyIndex:
+    """The picker index of an admin's properties, built on first use.
+
+    Property writes made through this module update it in place; it is
+    rebuilt every PROPERTY_INDEX_TTL seconds to pick up writes made by other
+    processes.
+    """
+    index = _property_indexes.get(admin_id)
+    if index is None or time.time() - index.built_at > PROPERTY_INDEX_TTL:
+        with _property_indexes_lock:
+            index = _property_indexes.get(admin_id)
+            if index is None or time.time() - index.built_at > PROPERTY_INDEX_TTL:
+                rows = execute_query(f"SELECT {PICKER_FIELDS} FROM RealEstate WHERE admin_id = ?", [admin_id])
+                index = _property_indexes[admin_id] = PropertyIndex(rows)
+    return index
+
+def _refresh_indexes(indexes: Dict[int, Any], lock: threading.Lock, fields: str, id_ranges: List[range]) -> None:
+    """Re-read the given property ids into the loaded indexes of one kind"""
+    if not indexes:
+        return
+    with lock:
+        for ids in id_ranges:
+            if not ids:
+                continue
+            rows = execute_query(
+                f"SELECT admin_id, {fields} FROM RealEstate WHERE id BETWEEN ? AND ?",
+                [ids[0], ids[-1]]
+            )
+            by_admin = {}
+            for row in rows:
+                by_admin.setdefault(row[0], []).append(row[1:])
+            for admin_id, admin_rows in by_admin.items():
+                if admin_id in indexes:
+                    indexes[admin_id].upsert(admin_rows)
+            found = {row[1] for row in rows}
+            deleted = [property_id for property_id in ids if property_id not in found]
+            if deleted:
+                for index in indexes.values():
+                    index.remove(deleted)
+
+def _refresh_property_indexes(id_ranges: List[range], admin_ids: Iterable[int]) -> None:
+    """Re-read the given property ids, written by the given admins, into the loaded picker, comps, duplicate and price indexes"""
+    _refresh_indexes(_property_indexes, _property_indexes_lock, PICKER_FIELDS, id_ranges)
+    _refresh_indexes(_comps_indexes, _comps_indexes_lock, COMPS_FIELDS, id_ranges)
+    _refresh_indexes(_dedup_indexes, _dedup_indexes_lock, DEDUP_FIELDS, id_ranges)
+    _refresh_indexes(_current_price_models(admin_ids), _price_models_lock, PRICE_MODEL_FIELDS, id_ranges)
+    _schedule_price_model_save()
+
+# Comps indexes follow the picker indexes: one per admin, updated in place
+# by property writes and rebuilt every COMPS_INDEX_TTL seconds
+COMPS_INDEX_TTL = float(os.environ.get('AQARDASH_COMPS_TTL', '600'))
+COMPS_FIELDS = "id, area, bedrooms, bathrooms, price, property_type, property_scale, city, district"
+_comps_indexes: Dict[int, CompsIndex] = {}
+_comps_indexes_lock = threading.Lock()
+
+def get_comps_index(admin_id) -> CompsIndex:
+    """The comparable-properties index of an admin, built on first use"""
+    index = _comps_indexes.get(admin_id)
+    if index is None or time.time() - index.built_at > COMPS_INDEX_TTL:
+        with _comps_indexes_lock:
+            index = _comps_indexes.get(admin_id)
+            if index is None or time.time() - index.built_at > COMPS_INDEX_TTL:
+                rows = execute_query(f"SELECT {COMPS_FIELDS} FROM RealEstate WHERE admin_id = ?", [admin_id])
+                index = _comps_indexes[admin_id] = CompsIndex(rows)
+    return index
+
+COMP_FIELDS = "id, title, property_type, property_scale, region, city, district, area, bedrooms, bathrooms, price, status"
+
+def comparable_properties(admin_id, property_id, k=5) -> List[Tuple[Record, float]]:
+    """The k properties most similar to one of the admin's properties as (record, distance), closest first.
+
+    Similarity weighs area, rooms and price per m² in standard deviations of
+    the portfolio, plus penalties for a different type, scale or district
+    (see utils/comps_index.py). A distance of 0 is an identical listing.
+    """
+    try:
+        nearest = get_comps_index(admin_id).nearest(property_id, k)
+        if not nearest:
+            return []
+        ids = [comp_id for comp_id, _ in nearest]
+        rows = execute_cached_query(f"""
+            SELECT {COMP_FIELDS} FROM RealEstate
+            WHERE admin_id = ? AND id IN ({', '.join('?' * len(ids))})
+        """, [admin_id, *ids], admin_id, ('RealEstate',))
+        by_id = {row.id: row for row in rows}
+        return [(by_id[comp_id], distance) for comp_id, distance in nearest if comp_id in by_id]
+    except Exception as e:
+        print(f"Error finding comparable properties: {str(e)}")
+        return []
+
+# Duplicate indexes follow the comps indexes: one per admin, updated in
+# place by property writes and rebuilt every DEDUP_INDEX_TTL seconds
+DEDUP_INDEX_TTL = float(os.environ.get('AQARDASH_DEDUP_TTL', '600'))
+DEDUP_FIELDS = "id, title, description, source_link, city, district, area, price"
+_dedup_indexes: Dict[int, DedupIndex] = {}
+_dedup_indexes_lock = threading.Lock()
+
+# Shown for Match.reason
+DUPLICATE_REASONS = {
+    'source_link': "نفس رابط المصدر",
+    'details': "نفس المدينة والحي والمساحة والسعر",
+    'text': "وصف متشابه",
+}
+
+def get_dedup_index(admin_id) -> DedupIndex:
+    """The duplicate-listing index of an admin, built on first use"""
+    index = _dedup_indexes.get(admin_id)
+    if index is None or time.time() - index.built_at > DEDUP_INDEX_TTL:
+        with _dedup_indexes_lock:
+            index = _dedup_indexes.get(admin_id)
+            if index is None or time.time() - index.built_at > DEDUP_INDEX_TTL:
+                rows = execute_query(f"SELECT {DEDUP_FIELDS} FROM RealEstate WHERE admin_id = ?", [admin_id])
+                index = _dedup_indexes[admin_id] = DedupIndex(rows)
+    return index
+
+def dedup_row(property_data: dict, property_id=None) -> tuple:
+    """property_data as a DedupIndex row; property_id defaults to its 'id', if any"""
+    return (
+        property_data.get('id') if property_id is None else property_id,
+        property_data.get('title'), property_data.get('description'), property_data.get('source_link'),
+        property_data.get('city'), property_data.get('district'), property_data.get('area'), property_data.get('price'),
+    )
+
+def duplicate_matches(admin_id, properties: Iterable[dict]) -> List[List[Match]]:
+    """Existing properties each of properties duplicates, strongest reason first"""
+    return get_dedup_index(admin_id).match([dedup_row(property_data) for property_data in properties])
+
+DUPLICATE_FIELDS = "id, title, property_type, region, city, district, area, price, source_link, status"
+
+def find_duplicates(admin_id, property_data: dict) -> List[Tuple[Record, str, float]]:
+    """Existing properties a new or edited property duplicates, as (record, reason, text similarity).
+
+    A duplicate has the same source_link, the same city, district, area and
+    price, or a nearly identical title and description with an area within
+    5% (see utils/dedup_index.py). Reasons are keys of DUPLICATE_REASONS.
+    """
+    try:
+        matches = duplicate_matches(admin_id, [property_data])[0]
+        if not matches:
+            return []
+        ids = [match.id for match in matches]
+        rows = execute_cached_query(f"""
+            SELECT {DUPLICATE_FIELDS} FROM RealEstate
+            WHERE admin_id = ? AND id IN ({', '.join('?' * len(ids))})
+        """, [admin_id, *ids], admin_id, ('RealEstate',))
+        by_id = {row.id: row for row in rows}
+        return [(by_id[match.id], match.reason, match.similarity) for match in matches if match.id in by_id]
+    except Exception as e:
+        print(f"Error finding duplicate properties: {str(e)}")
+        return []
+
+def duplicate_clusters(admin_id) -> List[List[Match]]:
+    """Groups of properties that duplicate each other, largest first"""
+    return get_dedup_index(admin_id).clusters()
+
+# Price models are trained like the comps indexes but also saved under
+# MODEL_DIR, one directory per database file, so a restarted app or a job
+# worker starts from the last model instead of re-reading every listing. A
+# saved model older than PRICE_MODEL_TTL seconds is retrained from the database.
+# Property writes save the models they change PRICE_MODEL_SAVE_DELAY seconds
+# later in the background, so a burst of writes saves each model once.
+MODEL_DIR = os.environ.get('AQARDASH_MODEL_DIR', 'models')
+PRICE_MODEL_TTL = float(os.environ.get('AQARDASH_PRICE_MODEL_TTL', '3600'))
+PRICE_MODEL_SAVE_DELAY = float(os.environ.get('AQARDASH_PRICE_MODEL_SAVE_DELAY', '30'))
+PRICE_MODEL_FIELDS = "id, area, bedrooms, bathrooms, living_rooms, floors, price, property_type, city, district"
+_price_models: Dict[Tuple[str, int], PriceModel] = {}  # (model directory, admin id) -> model
+_price_models_lock = threading.Lock()
+_price_models_saver: Optional[threading.Timer] = None
+
+def price_model_dir() -> str:
+    """Directory of the saved price models of the current database"""
+    return os.path.join(MODEL_DIR, os.path.splitext(os.path.basename(get_pool().db_path))[0])
+
+def price_model_path(admin_id, directory=None) -> str:
+    return os.path.join(directory or price_model_dir(), f"price_model_{admin_id}.npz")
+
+def _load_price_model(path) -> Optional[PriceModel]:
+    try:
+        return PriceModel.load(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error loading price model: {str(e)}")
+        return None
+
+def get_price_model(admin_id) -> PriceModel:
+    """The price model of an admin, loaded from disk or trained on first use"""
+    def current(model):
+        return model is not None and time.time() - model.built_at <= PRICE_MODEL_TTL
+
+    key = (price_model_dir(), admin_id)
+    model = _price_models.get(key)
+    if not current(model):
+        with _price_models_lock:
+            model = _price_models.get(key)
+            if not current(model):
+                model = _load_price_model(price_model_path(admin_id, key[0]))
+                if not current(model):
+                    rows = execute_query(f"SELECT {PRICE_MODEL_FIELDS} FROM RealEstate WHERE admin_id = ?", [admin_id])
+                    model = PriceModel(check_choices('RealEstate')['property_type'], rows)
+                    model.save(price_model_path(admin_id, key[0]))
+                _price_models[key] = model
+    return model
+
+def _current_price_models(admin_ids: Iterable[int]) -> Dict[int, PriceModel]:
+    """{admin id: model} of the current database's loaded models, after loading the saved models of admin_ids.
+
+    Loading the models of the admins that write lets their writes keep the
+    files on disk current too. Expired models are loaded as well;
+    get_price_model() retrains them on next use.
+    """
+    directory = price_model_dir()
+    with _price_models_lock:
+        for admin_id in admin_ids:
+            key = (directory, admin_id)
+            if key not in _price_models:
+                model = _load_price_model(price_model_path(admin_id, directory))
+                if model is not None:
+                    _price_models[key] = model
+        return {admin_id: model for (path, admin_id), model in _price_models.items() if path == directory}
+
+def _schedule_price_model_save() -> None:
+    """Save the changed price models in PRICE_MODEL_SAVE_DELAY seconds, unless a save is already due"""
+    global _price_models_saver
+    if PRICE_MODEL_SAVE_DELAY <= 0:
+        _save_price_models()
+        return
+    with _price_models_lock:
+        if _price_models_saver is None:
+            _price_models_saver = threading.Timer(PRICE_MODEL_SAVE_DELAY, _save_price_models)
+            _price_models_saver.daemon = True
+            _price_models_saver.start()
+
+@atexit.register
+def _save_price_models() -> None:
+    """Persist the loaded price models changed by property writes"""
+    global _price_models_saver
+    with _price_models_lock:
+        # Writes from now on schedule another save
+        _price_models_saver = None
+        changed = [(key, model) for key, model in _price_models.items() if model.unsaved]
+    for (directory, admin_id), model in changed:
+        try:
+            model.save(price_model_path(admin_id, directory))
+        except Exception as e:
+            print(f"Error saving price model: {str(e)}")
+
+def estimate_prices(admin_id, property_ids) -> Dict[int, Tuple[float, float]]:
+    """{property id: (estimated price, deviation score)} for properties the model can price.
+
+    The deviation score is how many residual standard deviations the log
+    price is above (positive) or below the estimate of the listing's
+    segment; beyond OUTLIER_SCORE either way the price is an outlier.
+    """
+    try:
+        found = get_price_model(admin_id).estimate(property_ids)
+        return {
+            property_id: (estimate, score)
+            for property_id, estimate, score in zip(found.ids.tolist(), found.estimates.tolist(), found.scores.tolist())
+            if estimate == estimate  # not NaN
+        }
+    except Exception as e:
+        print(f"Error estimating prices: {str(e)}")
+        return {}
+
+def price_outliers(admin_id, threshold=OUTLIER_SCORE) -> Estimates:
+    """Ids, estimates and scores of every listing priced beyond threshold, largest deviation first"""
+    return get_price_model(admin_id).outliers(threshold)
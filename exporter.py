@@ -0,0 +1,141 @@
+"""Chunked export of portfolio data to CSV, JSONL and Parquet.
+
+Rows are read from the database in fixed-size chunks and written out as
+they arrive, so exports run with constant memory whatever their size.
+Parquet is offered when pyarrow is installed:
+
+    python exporter.py properties --admin 1 --format jsonl -o properties.jsonl --filter city=الرياض
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from database import configure_pool
+from database_utils import (
+    EXPORT_CHUNK_SIZE, export_properties, export_buyers, export_marketers,
+    export_buyer_real_estates, export_marketer_real_estates, to_columns
+)
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# name -> function(admin_id, chunk_size, **filters) returning chunks of records
+DATASETS: Dict[str, Callable[..., Iterator[List[tuple]]]] = {
+    'properties': export_properties,
+    'buyers': export_buyers,
+    'marketers': export_marketers,
+    'buyer_real_estates': export_buyer_real_estates,
+    'marketer_real_estates': export_marketer_real_estates,
+}
+
+def write_csv(chunks: Iterable[List[tuple]], file) -> int:
+    """Write chunks of records to a binary file as UTF-8 CSV (with BOM for Excel)"""
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text)
+    count = 0
+    for chunk in chunks:
+        if not count:
+            writer.writerow(chunk[0]._fields)
+        writer.writerows(chunk)
+        count += len(chunk)
+    text.flush()
+    text.detach()
+    return count
+
+def write_jsonl(chunks: Iterable[List[tuple]], file) -> int:
+    """Write chunks of records to a binary file as one JSON object per line"""
+    count = 0
+    for chunk in chunks:
+        fields = chunk[0]._fields
+        file.write(''.join(
+            json.dumps(dict(zip(fields, row)), ensure_ascii=False) + '\n' for row in chunk
+        ).encode('utf-8'))
+        count += len(chunk)
+    return count
+
+def write_parquet(chunks: Iterable[List[tuple]], file) -> int:
+    """Write chunks of records to a binary file as Parquet, one row group per chunk"""
+    writer = None
+    count = 0
+    try:
+        for chunk in chunks:
+            table = pyarrow.Table.from_pydict({name: list(values) for name, values in to_columns(chunk).items()})
+            if writer is None:
+                # Columns that are all NULL in the first chunk have no type yet
+                schema = pyarrow.schema(
+                    field.with_type(pyarrow.string()) if pyarrow.types.is_null(field.type) else field
+                    for field in table.schema
+                )
+                writer = pyarrow.parquet.ParquetWriter(file, schema)
+            writer.write_table(table.cast(writer.schema))
+            count += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+# format -> (writer, file extension, mime type)
+FORMATS = {
+    'csv': (write_csv, 'csv', 'text/csv'),
+    'jsonl': (write_jsonl, 'jsonl', 'application/x-ndjson'),
+}
+if pyarrow is not None:
+    FORMATS['parquet'] = (write_parquet, 'parquet', 'application/vnd.apache.parquet')
+
+def _reporting(chunks: Iterable[List[tuple]], on_progress: Callable[[int], None]) -> Iterator[List[tuple]]:
+    count = 0
+    for chunk in chunks:
+        yield chunk
+        count += len(chunk)
+        on_progress(count)
+
+def export(dataset: str, admin_id: int, fmt: str, file, chunk_size: int = EXPORT_CHUNK_SIZE,
+           on_progress: Optional[Callable[[int], None]] = None, **filters) -> int:
+    """Stream one dataset of an admin to a binary file; returns the row count.
+
+    on_progress(rows written so far) is called after every chunk.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt} (available: {', '.join(FORMATS)})")
+    write = FORMATS[fmt][0]
+    chunks = DATASETS[dataset](admin_id, chunk_size=chunk_size, **filters)
+    return write(_reporting(chunks, on_progress) if on_progress else chunks, file)
+
+def _filter_value(value):
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def main():
+    parser = argparse.ArgumentParser(description="Export portfolio data in chunks")
+    parser.add_argument('dataset', choices=list(DATASETS))
+    parser.add_argument('--admin', type=int, required=True, help="admin id whose data is exported")
+    parser.add_argument('--format', choices=list(FORMATS), default='csv')
+    parser.add_argument('-o', '--output', required=True, help="output file")
+    parser.add_argument('--filter', action='append', default=[], metavar='NAME=VALUE',
+                        help="search filter, e.g. city=الرياض or min_price=500000 (repeatable)")
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help="rows per query")
+    parser.add_argument('--db', help="database file (default: AQARDASH_DB_PATH or aqardash.db)")
+    args = parser.parse_args()
+
+    if args.db:
+        configure_pool(args.db)
+    filters = {}
+    for item in args.filter:
+        name, _, value = item.partition('=')
+        filters[name] = _filter_value(value) if name.startswith(('min_', 'max_')) else value
+
+    with open(args.output, 'wb') as file:
+        count = export(args.dataset, args.admin, args.format, file, args.chunk_size, **filters)
+    print(f"Exported {count} rows to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
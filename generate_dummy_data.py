@@ -1,6 +1,19 @@
+import argparse
+import bisect
+import math
+import multiprocessing
 import random
+import time
+from collections import deque
 from datetime import datetime, timedelta
-from database_utils import execute_query, execute_update, register_admin, add_property, add_marketer, add_buyer
+from itertools import accumulate
+from database import AMENITIES, analyze_db, configure_pool, init_db, rebuild_geo_index
+from database_utils import (
+    execute_query, execute_update, execute_bulk_insert, register_admin,
+    add_properties_bulk, add_marketers_bulk, add_buyers_bulk,
+    add_buyer_real_estates_bulk, add_marketer_real_estates_bulk, PROPERTY_COLUMNS
+)
+from utils.geo import gazetteer_point
 
 # Constants for property types and scales
 PROPERTY_TYPES = ['تجاري', 'صناعي', 'زراعي', 'سكني']
@@ -34,30 +47,47 @@ DISTRICTS = {
     'عسير': ['الخالدية', 'الربوة', 'اليرموك', 'الروضة', 'المناخ']
 }
 
-def generate_real_estate_data(admin_id):
-    """Generate realistic real estate data"""
+def generate_real_estate_data(admin_id, rng=random, location=None):
+    """Generate realistic real estate data
+
+    rng is a random.Random instance for reproducible runs and location an
+    optional (region, city) pair to place the property in.
+    """
     # Select random location
-    region = random.choice(list(CITIES.keys()))
-    city = random.choice(CITIES[region])
-    district = random.choice(DISTRICTS.get(city, ["غير محدد"]))
+    if location:
+        region, city = location
+    else:
+        region = rng.choice(list(CITIES.keys()))
+        city = rng.choice(CITIES[region])
+    district = rng.choice(DISTRICTS.get(city, ["غير محدد"]))
     
     # Generate property details
-    property_type = random.choice(PROPERTY_TYPES)
-    property_scale = random.choice(PROPERTY_SCALES)
-    area = random.randint(50, 500)  # Realistic area in m²
-    category = random.choice(CATEGORIES)
-    floors = random.randint(1, 5)
-    bedrooms = random.randint(1, 6)
-    bathrooms = random.randint(1, 4)
-    living_rooms = random.randint(1, 3)
+    property_type = rng.choice(PROPERTY_TYPES)
+    property_scale = rng.choice(PROPERTY_SCALES)
+    area = rng.randint(50, 500)  # Realistic area in m²
+    category = rng.choice(CATEGORIES)
+    floors = rng.randint(1, 5)
+    bedrooms = rng.randint(1, 6)
+    bathrooms = rng.randint(1, 4)
+    living_rooms = rng.randint(1, 3)
     
     # Generate realistic price based on property type and area
-    base_price = area * random.randint(1000, 5000)  # Price per m²
+    base_price = area * rng.randint(1000, 5000)  # Price per m²
     if property_type == "تجاري":
         base_price *= 1.5
     elif property_type == "صناعي":
         base_price *= 0.8
     price = round(base_price, 2)
+    amenities = rng.sample(list(AMENITIES), rng.randint(0, 4))
+    
+    # Scatter listings a few kilometres around their district or city centre
+    latitude, longitude = gazetteer_point(city, district) or (None, None)
+    if latitude is not None:
+        latitude = round(latitude + rng.uniform(-0.03, 0.03), 6)
+        longitude = round(longitude + rng.uniform(-0.03, 0.03), 6)
+        location_link = f"https://maps.google.com/?q={latitude},{longitude}"
+    else:
+        location_link = f"https://maps.google.com/?q={city},{district}"
     
     # Generate title if not provided
     title = f"{property_type} في {region} - {city}, {district}"
@@ -77,43 +107,45 @@ def generate_real_estate_data(admin_id):
         'region': region,
         'district': district,
         'city': city,
-        'location_link': f"https://maps.google.com/?q={city},{district}",
+        'location_link': location_link,
+        'latitude': latitude,
+        'longitude': longitude,
         'source_link': "https://example.com",
         'location_details': f"عقار {property_type} في {district}، {city}، {region}",
-        'description': f"عقار {property_type} {property_scale} في {district}، {city}. المساحة {area} م²، {bedrooms} غرف نوم، {bathrooms} حمامات، {living_rooms} صالات.",
-        'status': random.choice(STATUSES),
+        'description': f"عقار {property_type} {property_scale} في {district}، {city}. المساحة {area} م²، {bedrooms} غرف نوم، {bathrooms} حمامات، {living_rooms} صالات." + (f" المميزات: {'، '.join(amenities)}." if amenities else ""),
+        'status': rng.choice(STATUSES),
         'admin_id': admin_id
     }
 
-def generate_marketer_data(count: int) -> list:
+def generate_marketer_data(count: int, rng=random) -> list:
     marketers = []
     first_names = ['أحمد', 'محمد', 'عبدالله', 'عبدالرحمن', 'خالد', 'سعود', 'ناصر', 'علي', 'حسن', 'سعد']
     middle_names = ['محمد', 'عبدالله', 'سعود', 'ناصر', 'علي', 'حسن', 'سعد', 'خالد', 'عبدالرحمن', 'أحمد']
     last_names = ['السديري', 'الغامدي', 'الحربي', 'الشهري', 'القرشي', 'الزهراني', 'العتيبي', 'العسيري', 'القحطاني']
     
     for _ in range(count):
-        name = f"{random.choice(first_names)} {random.choice(middle_names)} {random.choice(last_names)}"
-        phone = f"05{random.randint(0, 9)}{random.randint(10000000, 99999999)}"
+        name = f"{rng.choice(first_names)} {rng.choice(middle_names)} {rng.choice(last_names)}"
+        phone = f"05{rng.randint(0, 9)}{rng.randint(10000000, 99999999)}"
         email = f"{name.replace(' ', '.')}@example.com"
         
         marketer_data = {
             'name': name,
             'phone': phone,
-            'marketer_type': random.choice(MARKETER_TYPES),
+            'marketer_type': rng.choice(MARKETER_TYPES),
             'email': email
         }
         marketers.append(marketer_data)
     return marketers
 
-def generate_buyer_data(count: int) -> list:
+def generate_buyer_data(count: int, rng=random) -> list:
     buyers = []
     first_names = ['أحمد', 'محمد', 'عبدالله', 'عبدالرحمن', 'خالد', 'سعود', 'ناصر', 'علي', 'حسن', 'سعد', 'نورة', 'لطيفة', 'سارة', 'فاطمة']
     middle_names = ['محمد', 'عبدالله', 'سعود', 'ناصر', 'علي', 'حسن', 'سعد', 'خالد', 'عبدالرحمن', 'أحمد']
     last_names = ['السديري', 'الغامدي', 'الحربي', 'الشهري', 'القرشي', 'الزهراني', 'العتيبي', 'العسيري', 'القحطاني']
     
     for _ in range(count):
-        name = f"{random.choice(first_names)} {random.choice(middle_names)} {random.choice(last_names)}"
-        phone = f"05{random.randint(0, 9)}{random.randint(10000000, 99999999)}"
+        name = f"{rng.choice(first_names)} {rng.choice(middle_names)} {rng.choice(last_names)}"
+        phone = f"05{rng.randint(0, 9)}{rng.randint(10000000, 99999999)}"
         email = f"{name.replace(' ', '.')}@example.com"
         
         # Generate interests
@@ -128,14 +160,22 @@ def generate_buyer_data(count: int) -> list:
             "غرفة خادمة",
             "مستودع"
         ]
-        selected_interests = random.sample(interests, random.randint(2, 5))
+        selected_interests = rng.sample(interests, rng.randint(2, 5))
+        
+        # Preferred location, drawn like a property's; half the buyers name a district
+        region = rng.choice(list(CITIES.keys()))
+        city = rng.choice(CITIES[region])
+        district = rng.choice(DISTRICTS[city]) if city in DISTRICTS and rng.random() < 0.5 else None
         
         buyer_data = {
             'name': name,
             'phone': phone,
             'email': email,
-            'budget': round(random.uniform(500000, 5000000), 2),
-            'interests': "، ".join(selected_interests)
+            'budget': round(rng.uniform(500000, 5000000), 2),
+            'interests': "، ".join(selected_interests),
+            'preferred_region': region,
+            'preferred_city': city,
+            'preferred_district': district
         }
         buyers.append(buyer_data)
     return buyers
@@ -173,39 +213,200 @@ def insert_dummy_data():
     # Generate and insert real estate data - evenly distributed among admins
     properties_per_admin = 12  # Each admin gets 12 properties
     for admin_id in admin_ids:
-        real_estates = [generate_real_estate_data(admin_id) for _ in range(properties_per_admin)]
-        for real_estate in real_estates:
-            try:
-                property_id = add_property(real_estate)
-                print(f"Successfully added property: {real_estate['title']} for admin {admin_id}")
-            except Exception as e:
-                print(f"Failed to add property: {str(e)}")
+        real_estates = (generate_real_estate_data(admin_id) for _ in range(properties_per_admin))
+        try:
+            id_ranges = add_properties_bulk(real_estates)
+            print(f"Successfully added {sum(len(r) for r in id_ranges)} properties for admin {admin_id}")
+        except Exception as e:
+            print(f"Failed to add properties: {str(e)}")
     
     # Generate and insert marketer data - evenly distributed among admins
     marketers_per_admin = 5  # Each admin gets 5 marketers
     for admin_id in admin_ids:
         marketers = generate_marketer_data(marketers_per_admin)
         for marketer in marketers:
-            try:
-                marketer['admin_id'] = admin_id
-                marketer_id = add_marketer(marketer)
-                print(f"Successfully added marketer: {marketer['name']} for admin {admin_id}")
-            except Exception as e:
-                print(f"Failed to add marketer: {str(e)}")
+            marketer['admin_id'] = admin_id
+        try:
+            id_ranges = add_marketers_bulk(marketers)
+            print(f"Successfully added {sum(len(r) for r in id_ranges)} marketers for admin {admin_id}")
+        except Exception as e:
+            print(f"Failed to add marketers: {str(e)}")
     
     # Generate and insert buyer data - evenly distributed among admins
     buyers_per_admin = 8
     for admin_id in admin_ids:
         buyers = generate_buyer_data(buyers_per_admin)
         for buyer in buyers:
-            try:
-                buyer['admin_id'] = admin_id
-                buyer_id = add_buyer(buyer)
-                print(f"Successfully added buyer: {buyer['name']} for admin {admin_id}")
-            except Exception as e:
-                print(f"Failed to add buyer: {str(e)}")
+            buyer['admin_id'] = admin_id
+        try:
+            id_ranges = add_buyers_bulk(buyers)
+            print(f"Successfully added {sum(len(r) for r in id_ranges)} buyers for admin {admin_id}")
+        except Exception as e:
+            print(f"Failed to add buyers: {str(e)}")
     
+    # Refresh planner statistics after the bulk load
+    analyze_db()
     print("Dummy data has been generated and inserted into the database.")
 
+# Large-scale load-test data. Every unit of scale is BASE_PROPERTIES
+# properties, with buyers and marketers in fixed proportion. Work is split
+# into shards that worker processes generate from their own seeded RNG;
+# the parent writes the shards in order, so a given seed always produces
+# the same database.
+BASE_PROPERTIES = 100000
+SHARD_SIZE = 20000
+BUYERS_PER_PROPERTY = 0.1
+MARKETERS_PER_PROPERTY = 0.01
+LOAD_TEST_END_DATE = datetime(2025, 1, 1)
+LOAD_TEST_DAYS = 730
+
+def _skewed_locations():
+    """(region, city) pairs with Zipf-like weights, region capitals first"""
+    locations = [(region, cities[0]) for region, cities in CITIES.items()]
+    locations += [(region, city) for region, cities in CITIES.items() for city in cities[1:]]
+    weights = [1 / (rank + 1) ** 1.2 for rank in range(len(locations))]
+    return locations, list(accumulate(weights))
+
+LOCATIONS, LOCATION_CUM_WEIGHTS = _skewed_locations()
+
+def _poisson(rng, mean):
+    """Knuth's Poisson sampler, fine for the small means used here"""
+    limit = math.exp(-mean)
+    count = 0
+    product = rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+def generate_shard(task):
+    """Generate one shard of an admin's data; runs in a worker process.
+
+    Returns the property, buyer and marketer records plus the buyer and
+    marketer links as (index, property index) pairs into those lists.
+    """
+    seed, admin_id, shard, n_properties, n_buyers, n_marketers, link_density = task
+    rng = random.Random(f"{seed}:{admin_id}:{shard}")
+    
+    properties = []
+    for location in rng.choices(LOCATIONS, cum_weights=LOCATION_CUM_WEIGHTS, k=n_properties):
+        real_estate = generate_real_estate_data(admin_id, rng, location)
+        announced = LOAD_TEST_END_DATE - timedelta(seconds=rng.randrange(LOAD_TEST_DAYS * 86400))
+        real_estate['announcement_date'] = announced.strftime('%Y-%m-%d %H:%M:%S')
+        properties.append(real_estate)
+    buyers = generate_buyer_data(n_buyers, rng)
+    marketers = generate_marketer_data(n_marketers, rng)
+    for record in buyers + marketers:
+        record['admin_id'] = admin_id
+    
+    # Buyers are interested in affordable properties in one preferred city
+    by_city = {}
+    for index, real_estate in enumerate(properties):
+        by_city.setdefault(real_estate['city'], []).append((real_estate['price'], index))
+    for listing in by_city.values():
+        listing.sort()
+    buyer_links = []
+    links_per_buyer = link_density * n_properties / n_buyers
+    for buyer_index, buyer in enumerate(buyers):
+        region, city = rng.choices(LOCATIONS, cum_weights=LOCATION_CUM_WEIGHTS)[0]
+        listing = by_city.get(city, [])
+        affordable = bisect.bisect_right(listing, (buyer['budget'], n_properties))
+        count = min(_poisson(rng, links_per_buyer), affordable)
+        for position in rng.sample(range(affordable), count):
+            buyer_links.append((buyer_index, listing[position][1]))
+    
+    # A few busy marketers list most properties
+    marketer_cum_weights = list(accumulate(1 / (rank + 1) for rank in range(n_marketers)))
+    marketer_links = []
+    for index in range(n_properties):
+        count = _poisson(rng, link_density)
+        chosen = set(rng.choices(range(n_marketers), cum_weights=marketer_cum_weights, k=count))
+        marketer_links.extend((marketer_index, index) for marketer_index in sorted(chosen))
+    
+    return properties, buyers, marketers, buyer_links, marketer_links
+
+def _load_test_tasks(seed, scale, admin_ids, link_density):
+    total = int(BASE_PROPERTIES * scale)
+    tasks = []
+    for position, admin_id in enumerate(admin_ids):
+        remaining = total // len(admin_ids) + (1 if position < total % len(admin_ids) else 0)
+        shard = 0
+        while remaining > 0:
+            n_properties = min(SHARD_SIZE, remaining)
+            tasks.append((
+                seed, admin_id, shard, n_properties,
+                max(1, round(n_properties * BUYERS_PER_PROPERTY)),
+                max(1, round(n_properties * MARKETERS_PER_PROPERTY)),
+                link_density
+            ))
+            remaining -= n_properties
+            shard += 1
+    return tasks
+
+def _write_shard(admin_id, shard):
+    properties, buyers, marketers, buyer_links, marketer_links = shard
+    property_ids = [i for ids in execute_bulk_insert('RealEstate', PROPERTY_COLUMNS + ['announcement_date'], properties) for i in ids]
+    buyer_ids = [i for ids in add_buyers_bulk(buyers) for i in ids]
+    marketer_ids = [i for ids in add_marketers_bulk(marketers) for i in ids]
+    add_buyer_real_estates_bulk((buyer_ids[b], property_ids[p], admin_id) for b, p in buyer_links)
+    add_marketer_real_estates_bulk((marketer_ids[m], property_ids[p], admin_id) for m, p in marketer_links)
+    return len(properties), len(buyer_links) + len(marketer_links)
+
+def generate_load_test_data(seed=0, scale=1.0, admins=3, link_density=0.5, workers=None):
+    """Fill the database with a reproducible production-sized dataset.
+
+    scale is in units of BASE_PROPERTIES properties, split evenly across
+    `admins` admins (loadtest1, loadtest2, ...). link_density is the mean
+    number of buyer links and of marketer links per property.
+    """
+    started = time.time()
+    admin_ids = []
+    for number in range(1, admins + 1):
+        username = f"loadtest{number}"
+        register_admin(username, username)
+        admin_ids.append(get_admin_id(username))
+    
+    tasks = _load_test_tasks(seed, scale, admin_ids, link_density)
+    workers = workers or multiprocessing.cpu_count()
+    written = links = 0
+    with multiprocessing.Pool(workers) as pool:
+        # Keep a bounded window of shards in flight and write them in order
+        pending = deque()
+        for task in tasks:
+            pending.append((task[1], pool.apply_async(generate_shard, (task,))))
+            if len(pending) > workers * 2:
+                admin_id, result = pending.popleft()
+                counts = _write_shard(admin_id, result.get())
+                written, links = written + counts[0], links + counts[1]
+                print(f"Wrote {written} properties and {links} links ({time.time() - started:.1f}s)")
+        while pending:
+            admin_id, result = pending.popleft()
+            counts = _write_shard(admin_id, result.get())
+            written, links = written + counts[0], links + counts[1]
+            print(f"Wrote {written} properties and {links} links ({time.time() - started:.1f}s)")
+    
+    # Listings arrive in random places; repack the R*Tree in spatial order
+    rebuild_geo_index()
+    analyze_db()
+    print(f"Load-test data generated in {time.time() - started:.1f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the AqarDash database with dummy data")
+    parser.add_argument('--scale', type=float, help=f"generate load-test data, in units of {BASE_PROPERTIES} properties")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for load-test data")
+    parser.add_argument('--admins', type=int, default=3, help="number of load-test admins")
+    parser.add_argument('--link-density', type=float, default=0.5, help="mean buyer and marketer links per property")
+    parser.add_argument('--workers', type=int, help="generator processes (default: CPU count)")
+    parser.add_argument('--db', help="database file to fill (default: AQARDASH_DB_PATH or aqardash.db)")
+    args = parser.parse_args()
+    
+    if args.db:
+        configure_pool(args.db)
+    if args.scale is None:
+        insert_dummy_data()
+        return
+    init_db()
+    generate_load_test_data(args.seed, args.scale, args.admins, args.link_density, args.workers)
+
 if __name__ == "__main__":
-    insert_dummy_data() 
\ No newline at end of file
+    main() 
\ No newline at end of file
@@ -0,0 +1,288 @@
+"""Streaming import of property listings from CSV and XLSX files.
+
+Rows are read one at a time, validated against the RealEstate CHECK
+constraints and inserted in chunked transactions, so memory stays flat
+whatever the size of the file. Rejected rows are written to a CSV error
+report with their line number and the reasons. With --skip-duplicates,
+rows that duplicate an existing listing or an earlier row are rejected too:
+
+    python importer.py listings.xlsx --admin 1 --errors rejected.csv --skip-duplicates
+"""
+import argparse
+import csv
+import io
+import math
+import os
+import sys
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from database import check_choices, configure_pool
+from database_utils import DUPLICATE_REASONS, PROPERTY_COLUMNS, add_properties_bulk, dedup_row, duplicate_matches
+from utils.dedup_index import DedupIndex
+
+IMPORT_CHUNK_SIZE = 5000
+
+# Headers are matched on the column names or on the labels of the property form
+HEADER_ALIASES = {
+    'عنوان العقار': 'title',
+    'العنوان': 'title',
+    'نوع العقار': 'property_type',
+    'النوع': 'property_type',
+    'نطاق العقار': 'property_scale',
+    'المساحة (م²)': 'area',
+    'المساحة': 'area',
+    'الفئة': 'category',
+    'عدد الطوابق': 'floors',
+    'عدد غرف النوم': 'bedrooms',
+    'غرف النوم': 'bedrooms',
+    'عدد الحمامات': 'bathrooms',
+    'الحمامات': 'bathrooms',
+    'عدد الصالات': 'living_rooms',
+    'الصالات': 'living_rooms',
+    'السعر (ريال)': 'price',
+    'السعر': 'price',
+    'المنطقة': 'region',
+    'الحي': 'district',
+    'المدينة': 'city',
+    'رابط الموقع': 'location_link',
+    'خط العرض': 'latitude',
+    'خط الطول': 'longitude',
+    'رابط المصدر': 'source_link',
+    'تفاصيل الموقع': 'location_details',
+    'الوصف': 'description',
+    'الحالة': 'status',
+}
+
+REQUIRED_COLUMNS = ['property_type', 'property_scale', 'area', 'category', 'price', 'region', 'district', 'city', 'status']
+REAL_COLUMNS = ['area', 'price']
+INTEGER_COLUMNS = ['floors', 'bedrooms', 'bathrooms', 'living_rooms']
+# Optional, located from the link or the gazetteer when missing; column -> largest absolute value
+COORDINATE_RANGES = {'latitude': 90, 'longitude': 180}
+# Same default as the property form
+DEFAULTS = {'status': 'متاح'}
+
+# Largest integer SQLite stores
+MAX_INTEGER = 2**63 - 1
+
+# Arabic-Indic digits and separators as typed in Arabic spreadsheets
+_NUMBER_TRANSLATION = str.maketrans('٠١٢٣٤٥٦٧٨٩٫', '0123456789.', '٬, ')
+
+def column_name(header):
+    """Map a file header to a RealEstate column, or None if unknown"""
+    header = str(header or '').strip()
+    if header in PROPERTY_COLUMNS:
+        return header
+    return HEADER_ALIASES.get(header)
+
+def read_csv(file) -> Iterator[Dict[str, object]]:
+    """Rows of a UTF-8 CSV file (binary file object) as header -> value dicts"""
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.DictReader(text)
+    finally:
+        # Leave the caller's file open (it is already closed if reading stopped early)
+        if not text.closed:
+            text.detach()
+
+def read_xlsx(file) -> Iterator[Dict[str, object]]:
+    """Rows of the first sheet of an XLSX file as header -> value dicts"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportError("Reading XLSX files requires openpyxl (pip install openpyxl)")
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        headers = next(rows, None)
+        if headers is None:
+            return
+        for values in rows:
+            if any(value is not None for value in values):
+                yield dict(zip(headers, values))
+    finally:
+        workbook.close()
+
+def read_rows(file, filename) -> Iterator[Dict[str, object]]:
+    """Dispatch on the file extension"""
+    if filename.lower().endswith('.xlsx'):
+        return read_xlsx(file)
+    if filename.lower().endswith('.csv'):
+        return read_csv(file)
+    raise ValueError(f"Unsupported file type: {filename}")
+
+def _number(value, integer=False):
+    """value as a finite float (or int); ValueError or OverflowError if it is not one"""
+    if isinstance(value, (int, float)):
+        number = value
+    else:
+        number = float(str(value).translate(_NUMBER_TRANSLATION))
+    # NaN would be stored as NULL, and inf cannot be converted to int
+    if not math.isfinite(number):
+        raise ValueError
+    if integer:
+        if number != int(number) or abs(int(number)) > MAX_INTEGER:
+            raise ValueError
+        return int(number)
+    return float(number)
+
+def validate_property(row: Dict[str, object], admin_id: int, choices: Dict[str, List[str]]) -> Tuple[Optional[dict], List[str]]:
+    """Return (record ready for add_properties_bulk, []) or (None, errors)"""
+    values = {}
+    for header, value in row.items():
+        column = column_name(header)
+        if column and column != 'admin_id':
+            values[column] = value.strip() if isinstance(value, str) else value
+
+    errors = []
+    record = {}
+    for column in PROPERTY_COLUMNS:
+        if column == 'admin_id':
+            continue
+        value = values.get(column)
+        if value is None or value == '':
+            value = DEFAULTS.get(column)
+        if value is None:
+            if column in REQUIRED_COLUMNS:
+                errors.append(f"{column}: قيمة مطلوبة")
+            record[column] = None
+            continue
+
+        if column in REAL_COLUMNS or column in INTEGER_COLUMNS or column in COORDINATE_RANGES:
+            try:
+                value = _number(value, integer=column in INTEGER_COLUMNS)
+            except (ValueError, OverflowError):
+                errors.append(f"{column}: رقم غير صالح ({value})")
+                continue
+            if column in COORDINATE_RANGES:
+                if abs(value) > COORDINATE_RANGES[column]:
+                    errors.append(f"{column}: خارج النطاق ({value})")
+                    continue
+            elif value < 0:
+                errors.append(f"{column}: يجب ألا يكون سالباً")
+                continue
+        else:
+            value = str(value)
+            if column in choices and value not in choices[column]:
+                errors.append(f"{column}: قيمة غير مسموحة ({value})، المسموح: {'، '.join(choices[column])}")
+                continue
+        record[column] = value
+
+    if errors:
+        return None, errors
+    record['admin_id'] = admin_id
+    return record, []
+
+def duplicate_errors(records: List[dict], lines: List[int], admin_id: int) -> List[List[str]]:
+    """Why each record duplicates an existing listing or a record on an earlier line ([] if it does not)"""
+    existing = duplicate_matches(admin_id, records)
+    batch = [dedup_row(record, line) for record, line in zip(records, lines)]
+    within = DedupIndex(batch).match(batch)
+    errors = []
+    for found, found_within, line in zip(existing, within, lines):
+        earlier = [match for match in found_within if match.id < line]
+        if found:
+            errors.append([f"مكرر للعقار رقم {found[0].id}: {DUPLICATE_REASONS[found[0].reason]}"])
+        elif earlier:
+            errors.append([f"مكرر للسطر {earlier[0].id}: {DUPLICATE_REASONS[earlier[0].reason]}"])
+        else:
+            errors.append([])
+    return errors
+
+class ImportResult(NamedTuple):
+    imported: int
+    rejected: int
+    seconds: float
+    duplicates: int = 0  # rejected as duplicates, included in rejected
+
+def import_properties(rows: Iterable[Dict[str, object]], admin_id: int, error_report=None,
+                      chunk_size: int = IMPORT_CHUNK_SIZE,
+                      on_progress: Optional[Callable[[int, int], None]] = None,
+                      skip_duplicates: bool = False) -> ImportResult:
+    """Validate and insert rows chunk by chunk.
+
+    Each chunk of valid rows is committed in its own transaction. Rejected
+    rows are written to error_report (a text file) as CSV with their line
+    number, reasons and original values. With skip_duplicates, rows that
+    duplicate an existing listing or an earlier row of the file (see
+    duplicate_errors()) are rejected as well. on_progress(imported, rejected)
+    is called after every chunk.
+    """
+    started = time.time()
+    choices = check_choices('RealEstate')
+    imported = rejected = duplicates = 0
+    writer = None
+    chunk, pending = [], []  # valid records, and their (line, row)
+
+    def reject(line, row, errors):
+        nonlocal rejected, writer
+        rejected += 1
+        if error_report is not None:
+            if writer is None:
+                writer = csv.DictWriter(error_report, fieldnames=['line', 'errors'] + [str(h) for h in row],
+                                        extrasaction='ignore', restval='')
+                writer.writeheader()
+            writer.writerow({'line': line, 'errors': ' | '.join(errors), **{str(h): v for h, v in row.items()}})
+
+    def flush():
+        nonlocal imported, duplicates
+        if chunk and skip_duplicates:
+            errors = duplicate_errors(chunk, [line for line, _ in pending], admin_id)
+            for (line, row), row_errors in zip(pending, errors):
+                if row_errors:
+                    reject(line, row, row_errors)
+                    duplicates += 1
+            chunk[:] = [record for record, row_errors in zip(chunk, errors) if not row_errors]
+        if chunk:
+            add_properties_bulk(chunk, chunk_size)
+            imported += len(chunk)
+        chunk.clear()
+        pending.clear()
+        if on_progress:
+            on_progress(imported, rejected)
+
+    # Line 1 of the file is the header row
+    for line, row in enumerate(rows, start=2):
+        record, errors = validate_property(row, admin_id, choices)
+        if record is not None:
+            chunk.append(record)
+            pending.append((line, row))
+            if len(chunk) >= chunk_size:
+                flush()
+            continue
+
+        reject(line, row, errors)
+        if rejected % chunk_size == 0 and on_progress:
+            on_progress(imported, rejected)
+    flush()
+    return ImportResult(imported, rejected, time.time() - started, duplicates)
+
+def main():
+    parser = argparse.ArgumentParser(description="Import property listings from a CSV or XLSX file")
+    parser.add_argument('file', help="CSV (UTF-8) or XLSX file; headers are column names or form labels")
+    parser.add_argument('--admin', type=int, required=True, help="admin id that will own the properties")
+    parser.add_argument('--errors', default='import_errors.csv', help="where to write rejected rows")
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help="rows per transaction")
+    parser.add_argument('--skip-duplicates', action='store_true', help="reject rows duplicating an existing listing or an earlier row")
+    parser.add_argument('--db', help="database file (default: AQARDASH_DB_PATH or aqardash.db)")
+    args = parser.parse_args()
+
+    if args.db:
+        configure_pool(args.db)
+
+    def progress(imported, rejected):
+        print(f"\r{imported} imported, {rejected} rejected", end='', flush=True)
+
+    with open(args.file, 'rb') as source, open(args.errors, 'w', encoding='utf-8-sig', newline='') as report:
+        result = import_properties(read_rows(source, args.file), args.admin, report, args.chunk_size, progress,
+                                   skip_duplicates=args.skip_duplicates)
+    print(f"\nImported {result.imported} properties in {result.seconds:.1f}s, rejected {result.rejected}"
+          + (f" ({result.duplicates} duplicates)" if args.skip_duplicates else ""))
+    if result.rejected:
+        print(f"Rejected rows written to {args.errors}")
+    else:
+        os.remove(args.errors)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,414 @@
+"""Background jobs for work that is too slow for a Streamlit rerun.
+
+Jobs are rows of the Job table, so their status, progress and results
+survive reruns and page changes. They run on a shared thread pool, or on
+a process pool for CPU-bound work that only reads the database (process
+workers have their own read cache and picker index, so writes made there
+would not reach the app's). Cancellation is cooperative: a running job
+stops the next time it reports progress.
+
+A job kind is a function registered with @job_kind that takes a
+JobContext (which knows the job's admin) plus the job's params and returns
+a JSON-serializable result.
+"""
+import csv
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from database import configure_pool, db_connection, get_pool
+from database_utils import (
+    DUPLICATE_REASONS, Record, duplicate_clusters, execute_query, execute_update, export_properties, price_outliers
+)
+from exporter import FORMATS, export
+from importer import import_properties, read_rows
+from matching import DEFAULT_K, get_matching_index
+
+JOB_THREADS = int(os.environ.get('AQARDASH_JOB_THREADS', '2'))
+JOB_PROCESSES = int(os.environ.get('AQARDASH_JOB_PROCESSES', '2'))
+# Uploaded inputs and result files, one directory per job
+JOB_DIR = os.environ.get('AQARDASH_JOB_DIR', 'jobs')
+# Progress is written at most this often (seconds), cancellation is checked at the same time
+PROGRESS_INTERVAL = 0.5
+# Each runner stamps the jobs it submitted this often (seconds); queued or running
+# jobs not stamped for JOB_HEARTBEAT_TIMEOUT seconds belong to a server that stopped
+JOB_HEARTBEAT_INTERVAL = 10
+JOB_HEARTBEAT_TIMEOUT = 60
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation has been requested"""
+
+class JobKind(NamedTuple):
+    func: Callable[..., Any]
+    pool: str   # 'thread' or 'process'
+    label: str  # shown in the UI
+
+JOB_KINDS: Dict[str, JobKind] = {}
+
+def job_kind(name, label, pool='thread'):
+    """Register a function as a job kind"""
+    def register(func):
+        JOB_KINDS[name] = JobKind(func, pool, label)
+        return func
+    return register
+
+def stage_upload(file, filename):
+    """Copy an uploaded file to disk for a job to read; returns its path"""
+    path = os.path.join(job_dir('uploads'), f"{uuid.uuid4().hex}{os.path.splitext(filename)[1]}")
+    with open(path, 'wb') as staged:
+        shutil.copyfileobj(file, staged)
+    return path
+
+def job_dir(job_id):
+    path = os.path.join(JOB_DIR, str(job_id))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+class JobContext:
+    """Handed to a running job to report progress and store result files"""
+
+    def __init__(self, job_id, admin_id):
+        self.job_id = job_id
+        self.admin_id = admin_id
+        self.result_file = None
+        self._reported_at = 0.0
+
+    def progress(self, fraction=None, message=None, force=False):
+        """Record progress (0..1) and a status message; raises JobCancelled if requested"""
+        now = time.time()
+        if not force and now - self._reported_at < PROGRESS_INTERVAL:
+            return
+        self._reported_at = now
+        with db_connection() as conn:
+            conn.execute(
+                "UPDATE Job SET progress = COALESCE(?, progress), message = COALESCE(?, message) WHERE id = ?",
+                [fraction, message, self.job_id]
+            )
+            conn.commit()
+            cancelled = conn.execute("SELECT cancel_requested FROM Job WHERE id = ?", [self.job_id]).fetchone()[0]
+        if cancelled:
+            raise JobCancelled()
+
+    def output_path(self, filename):
+        """Path for the job's downloadable result file"""
+        self.result_file = os.path.join(job_dir(self.job_id), filename)
+        return self.result_file
+
+def _finish(job_id, status, ctx=None, result=None, error=None):
+    execute_update("""
+        UPDATE Job
+        SET status = ?, result = ?, result_file = ?, error = ?, finished_at = CURRENT_TIMESTAMP,
+            progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END,
+            message = CASE WHEN ? = 'done' THEN NULL ELSE message END
+        WHERE id = ?
+    """, [status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+          ctx.result_file if ctx else None, error, status, status, job_id])
+
+def _run(job_id, admin_id, func, params):
+    """Run one job to completion in the current worker"""
+    with db_connection() as conn:
+        started = conn.execute(
+            "UPDATE Job SET status = 'running', started_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'queued'",
+            [job_id]
+        ).rowcount
+        conn.commit()
+    if not started:
+        return  # cancelled while queued
+    ctx = JobContext(job_id, admin_id)
+    try:
+        result = func(ctx, **params)
+        _finish(job_id, 'done', ctx, result)
+    except JobCancelled:
+        _finish(job_id, 'cancelled', ctx)
+    except Exception as e:
+        print(f"Error in job {job_id}: {str(e)}")
+        _finish(job_id, 'failed', ctx, error=str(e))
+
+def _run_in_process(db_path, job_id, admin_id, func, params):
+    """Process pool entry point: point the worker's pool at the app database first"""
+    if get_pool().db_path != db_path:
+        configure_pool(db_path)
+    _run(job_id, admin_id, func, params)
+
+class JobRunner:
+    """Owns the worker pools and the futures of the jobs submitted by this process"""
+
+    def __init__(self, threads=JOB_THREADS, processes=JOB_PROCESSES):
+        self._threads = ThreadPoolExecutor(threads, thread_name_prefix='aqardash-job')
+        self._process_count = processes
+        self._processes = None
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._fail_abandoned()
+        threading.Thread(target=self._heartbeat, name='aqardash-job-heartbeat', daemon=True).start()
+
+    def _fail_abandoned(self):
+        """Fail the jobs left queued or running by a server process that stopped; they will never finish.
+
+        Jobs of other live servers sharing the database keep their heartbeat
+        current and are left alone.
+        """
+        execute_update(
+            "UPDATE Job SET status = 'failed', error = 'توقف الخادم قبل اكتمال المهمة', finished_at = CURRENT_TIMESTAMP "
+            "WHERE status IN ('queued', 'running') AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+            [time.time() - JOB_HEARTBEAT_TIMEOUT]
+        )
+
+    def _heartbeat(self):
+        """Stamp the unfinished jobs of this runner, and fail those of stopped servers, every JOB_HEARTBEAT_INTERVAL seconds"""
+        while True:
+            time.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                with self._lock:
+                    job_ids = list(self._futures)
+                if job_ids:
+                    execute_update(
+                        f"UPDATE Job SET heartbeat_at = ? WHERE id IN ({', '.join('?' * len(job_ids))})",
+                        [time.time(), *job_ids]
+                    )
+                self._fail_abandoned()
+            except Exception as e:
+                print(f"Error updating job heartbeats: {str(e)}")
+
+    def _process_pool(self):
+        if self._processes is None:
+            # spawn: forked workers would inherit the parent's open SQLite connections
+            self._processes = ProcessPoolExecutor(self._process_count, mp_context=multiprocessing.get_context('spawn'))
+        return self._processes
+
+    def submit(self, admin_id, kind, **params):
+        """Queue a job and return its id"""
+        job = JOB_KINDS[kind]
+        job_id = execute_update(
+            "INSERT INTO Job (admin_id, kind, params, heartbeat_at) VALUES (?, ?, ?, ?)",
+            [admin_id, kind, json.dumps(params, ensure_ascii=False), time.time()]
+        )
+        with self._lock:
+            if job.pool == 'process':
+                future = self._process_pool().submit(_run_in_process, get_pool().db_path, job_id, admin_id, job.func, params)
+            else:
+                future = self._threads.submit(_run, job_id, admin_id, job.func, params)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda done: self._done(job_id, done))
+        return job_id
+
+    def _done(self, job_id, future):
+        with self._lock:
+            self._futures.pop(job_id, None)
+        error = None if future.cancelled() else future.exception()
+        if error is None:
+            return
+        # The worker died before _run could record the outcome, e.g. a crashed process
+        print(f"Error in job {job_id}: {str(error)}")
+        execute_update(
+            "UPDATE Job SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP "
+            "WHERE id = ? AND status IN ('queued', 'running')",
+            [str(error) or type(error).__name__, job_id]
+        )
+        if isinstance(error, BrokenProcessPool):
+            with self._lock:
+                self._processes = None
+
+    def cancel(self, job_id, admin_id):
+        """Cancel a queued job now, or ask a running one to stop"""
+        with db_connection() as conn:
+            conn.execute(
+                "UPDATE Job SET cancel_requested = 1 WHERE id = ? AND admin_id = ? AND status IN ('queued', 'running')",
+                [job_id, admin_id]
+            )
+            conn.execute(
+                "UPDATE Job SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP WHERE id = ? AND admin_id = ? AND status = 'queued'",
+                [job_id, admin_id]
+            )
+            conn.commit()
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.cancel()
+
+_runner = None
+_runner_lock = threading.Lock()
+
+def get_runner() -> JobRunner:
+    """The process-wide job runner, started on first use"""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = JobRunner()
+    return _runner
+
+def submit_job(admin_id, kind, **params) -> int:
+    return get_runner().submit(admin_id, kind, **params)
+
+def cancel_job(job_id, admin_id):
+    get_runner().cancel(job_id, admin_id)
+
+def list_jobs(admin_id, limit=20) -> List[Record]:
+    """An admin's most recent jobs, newest first (never cached: workers update them)"""
+    return execute_query("SELECT * FROM Job WHERE admin_id = ? ORDER BY id DESC LIMIT ?", [admin_id, limit])
+
+def get_job(job_id, admin_id) -> Optional[Record]:
+    rows = execute_query("SELECT * FROM Job WHERE id = ? AND admin_id = ?", [job_id, admin_id])
+    return rows[0] if rows else None
+
+def delete_job(job_id, admin_id):
+    """Remove a finished job and its files"""
+    with db_connection() as conn:
+        deleted = conn.execute(
+            "DELETE FROM Job WHERE id = ? AND admin_id = ? AND status NOT IN ('queued', 'running')",
+            [job_id, admin_id]
+        ).rowcount
+        conn.commit()
+    if deleted:
+        shutil.rmtree(os.path.join(JOB_DIR, str(job_id)), ignore_errors=True)
+
+# Job kinds
+
+@job_kind('import', "استيراد عقارات")
+def import_job(ctx, path, filename, skip_duplicates=False):
+    """Import a listings file staged at path; the staged copy is removed afterwards"""
+    size = os.path.getsize(path) or 1
+    try:
+        with open(path, 'rb') as source, open(ctx.output_path('import_errors.csv'), 'w', encoding='utf-8-sig', newline='') as report:
+            def on_progress(imported, rejected):
+                ctx.progress(min(source.tell() / size, 1.0), f"تم استيراد {imported} ورفض {rejected}")
+            result = import_properties(read_rows(source, filename), ctx.admin_id, report, on_progress=on_progress,
+                                       skip_duplicates=skip_duplicates)
+    finally:
+        os.remove(path)
+    if not result.rejected:
+        os.remove(ctx.result_file)
+        ctx.result_file = None
+    return result._asdict()
+
+@job_kind('export', "تصدير بيانات")
+def export_job(ctx, dataset, fmt, filters=None):
+    """Export a dataset to a downloadable file"""
+    with open(ctx.output_path(f"{dataset}.{FORMATS[fmt][1]}"), 'wb') as file:
+        count = export(dataset, ctx.admin_id, fmt, file,
+                       on_progress=lambda rows: ctx.progress(None, f"تم تصدير {rows} صف"),
+                       **(filters or {}))
+    return {'rows': count}
+
+@job_kind('price_report', "تقرير الأسعار حسب المدينة", pool='process')
+def price_report_job(ctx):
+    """Count, median price and median price per m² of each city, as CSV"""
+    cities, prices, areas = [], [], []
+    for chunk in export_properties(ctx.admin_id):
+        for row in chunk:
+            cities.append(row.city)
+            prices.append(row.price)
+            areas.append(row.area)
+        ctx.progress(None, f"تمت قراءة {len(cities)} عقار")
+    if not cities:
+        return {'cities': 0}
+
+    names, city_index = np.unique(np.array(cities, dtype=object).astype(str), return_inverse=True)
+    prices = np.asarray(prices, dtype=float)
+    per_m2 = np.divide(prices, areas, out=np.full(len(prices), np.nan), where=np.asarray(areas, dtype=float) > 0)
+    order = np.argsort(city_index, kind='stable')
+    bounds = np.searchsorted(city_index[order], np.arange(len(names) + 1))
+    with open(ctx.output_path('price_report.csv'), 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["المدينة", "عدد العقارات", "متوسط السعر", "وسيط السعر", "وسيط سعر المتر"])
+        for i, name in enumerate(names):
+            rows = order[bounds[i]:bounds[i + 1]]
+            city_per_m2 = per_m2[rows][np.isfinite(per_m2[rows])]
+            writer.writerow([name, len(rows), round(prices[rows].mean()), round(np.median(prices[rows])),
+                             round(np.median(city_per_m2)) if len(city_per_m2) else None])
+    return {'cities': len(names), 'properties': len(cities)}
+
+@job_kind('matches', "مطابقة المشترين والعقارات", pool='process')
+def matches_job(ctx, k=DEFAULT_K):
+    """Best available properties of every buyer and best buyers of every available property, as CSV"""
+    ctx.progress(None, "جاري تجهيز بيانات المطابقة", force=True)
+    index = get_matching_index(ctx.admin_id)
+    names = dict(execute_query("SELECT id, name FROM Buyer WHERE admin_id = ?", [ctx.admin_id]))
+    titles = dict(execute_query("SELECT id, title FROM RealEstate WHERE admin_id = ?", [ctx.admin_id]))
+    with open(ctx.output_path('matches.csv'), 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["الاتجاه", "رقم المشتري", "اسم المشتري", "رقم العقار", "عنوان العقار", "الترتيب", "درجة التطابق"])
+        ctx.progress(0.2, "جاري البحث عن أفضل العقارات لكل مشتر", force=True)
+        found = index.top_properties(k)
+        for buyer_id, matched, scores in zip(found.ids.tolist(), found.matched.tolist(), found.scores.tolist()):
+            writer.writerows(
+                ("عقارات للمشتري", buyer_id, names.get(buyer_id), real_estate_id, titles.get(real_estate_id), rank, round(score, 3))
+                for rank, (real_estate_id, score) in enumerate(zip(matched, scores), 1) if real_estate_id >= 0
+            )
+        ctx.progress(0.6, "جاري البحث عن أفضل المشترين لكل عقار", force=True)
+        found = index.top_buyers(k)
+        for real_estate_id, matched, scores in zip(found.ids.tolist(), found.matched.tolist(), found.scores.tolist()):
+            writer.writerows(
+                ("مشترون للعقار", buyer_id, names.get(buyer_id), real_estate_id, titles.get(real_estate_id), rank, round(score, 3))
+                for rank, (buyer_id, score) in enumerate(zip(matched, scores), 1) if buyer_id >= 0
+            )
+    return {'buyers': len(index.buyer_ids), 'properties': len(index.property_ids)}
+
+# Listing details of a report are read this many ids at a time
+DETAILS_BATCH = 500
+
+def _listing_details(admin_id, ids, columns):
+    """{id: row} of the admin's listings among ids, read DETAILS_BATCH at a time"""
+    rows = {}
+    for start in range(0, len(ids), DETAILS_BATCH):
+        batch = ids[start:start + DETAILS_BATCH]
+        rows.update((row.id, row) for row in execute_query(f"""
+            SELECT {columns} FROM RealEstate
+            WHERE admin_id = ? AND id IN ({', '.join('?' * len(batch))})
+        """, [admin_id, *batch]))
+    return rows
+
+@job_kind('price_outliers', "العقارات ذات الأسعار الشاذة", pool='process')
+def price_outliers_job(ctx):
+    """Listings priced far from the estimate of their segment, as CSV"""
+    ctx.progress(None, "جاري تقدير الأسعار", force=True)
+    found = price_outliers(ctx.admin_id)
+    with open(ctx.output_path('price_outliers.csv'), 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["رقم العقار", "العنوان", "النوع", "المدينة", "الحي", "المساحة", "السعر", "السعر التقديري", "درجة الانحراف"])
+        for start in range(0, len(found.ids), DETAILS_BATCH):
+            ids = found.ids[start:start + DETAILS_BATCH].tolist()
+            rows = _listing_details(ctx.admin_id, ids, "id, title, property_type, city, district, area, price")
+            estimates = found.estimates[start:start + DETAILS_BATCH].tolist()
+            scores = found.scores[start:start + DETAILS_BATCH].tolist()
+            for property_id, estimate, score in zip(ids, estimates, scores):
+                row = rows.get(property_id)
+                if row:
+                    writer.writerow([*row, round(estimate), round(score, 2)])
+            ctx.progress((start + len(ids)) / len(found.ids))
+    return {'properties': len(found.ids)}
+
+@job_kind('duplicates', "العقارات المكررة", pool='process')
+def duplicates_job(ctx):
+    """Groups of listings that duplicate each other, as CSV for review"""
+    ctx.progress(None, "جاري البحث عن العقارات المكررة", force=True)
+    clusters = duplicate_clusters(ctx.admin_id)
+    with open(ctx.output_path('duplicates.csv'), 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["رقم المجموعة", "عدد العقارات", "رقم العقار", "العنوان", "المدينة", "الحي",
+                         "المساحة", "السعر", "رابط المصدر", "سبب التكرار", "تشابه الوصف"])
+        done = 0
+        for start in range(0, len(clusters), DETAILS_BATCH):
+            batch = clusters[start:start + DETAILS_BATCH]
+            rows = _listing_details(ctx.admin_id, [match.id for cluster in batch for match in cluster],
+                                    "id, title, city, district, area, price, source_link")
+            for number, cluster in enumerate(batch, start + 1):
+                for match in cluster:
+                    row = rows.get(match.id)
+                    if row:
+                        writer.writerow([number, len(cluster), *row, DUPLICATE_REASONS[match.reason], round(match.similarity, 2)])
+            done += len(batch)
+            ctx.progress(done / len(clusters))
+    return {'groups': len(clusters), 'properties': sum(len(cluster) for cluster in clusters)}
@@ -0,0 +1,300 @@
+"""Buyer-property matching.
+
+Every (buyer, available property) pair gets a score in [0, 1] that mixes
+three parts:
+
+- budget fit of the property price against the buyer budget, 1 at the
+  budget, falling slowly below it and quickly above it,
+- the share of the buyer's interests found in the property description,
+- location: preferred district, then city, then region.
+
+Scores are computed with NumPy over whole arrays. The top-K searches score
+every pair, a block of query rows against all targets at a time, so they
+return exactly the best K of each row in memory bounded by the block size.
+Interests and location take few distinct values, so their part of the
+score is computed once per distinct pair and looked up.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+from database_utils import execute_query
+from utils.arabic import normalize_arabic, split_terms
+from utils.cache import read_cache
+
+# Weights of the score components; they sum to 1
+BUDGET_WEIGHT = 0.45
+INTERESTS_WEIGHT = 0.3
+LOCATION_WEIGHT = 0.25
+# A property this fraction above the budget scores 0 on budget fit
+BUDGET_TOLERANCE = 0.2
+# Location scores by the most specific preference that matches
+DISTRICT_MATCH = 1.0
+CITY_MATCH = 0.7
+REGION_MATCH = 0.4
+# Score given for a component the buyer left empty (no interests or no location)
+NEUTRAL = 0.5
+# Interests are bit positions in a uint64 mask: the most common terms are kept
+MAX_INTEREST_TERMS = 64
+# Upper bound on the cells of the query x target score blocks
+MAX_BLOCK_CELLS = 262144
+DEFAULT_K = 10
+
+AVAILABLE = 'متاح'
+# Placeholder for a missing location part, matches nothing
+UNSPECIFIED = 'غير محدد'
+
+def interest_terms(interests):
+    """Normalized terms of a "، "-separated interests text"""
+    return split_terms(interests)
+
+def budget_fit(ratio):
+    """Budget component for price / budget ratios"""
+    # In place where possible: this runs over every pair of a score block
+    fit = 0.5 * np.asarray(ratio, dtype=np.float64)
+    fit += 0.5
+    above = (1 + BUDGET_TOLERANCE) - ratio
+    above /= BUDGET_TOLERANCE
+    np.minimum(fit, above, out=fit)
+    return np.maximum(fit, 0, out=fit)
+
+class Matches(NamedTuple):
+    ids: np.ndarray      # (Q,) buyer or property ids
+    matched: np.ndarray  # (Q, k) matched ids, best first; -1 where fewer than k
+    scores: np.ndarray   # (Q, k) scores; NaN where fewer than k
+
+class Features(NamedTuple):
+    """Rows of one side numbered by distinct interests and by distinct location"""
+    interests: np.ndarray  # first row of each distinct interest set
+    interest: np.ndarray   # interest set number of every row
+    places: np.ndarray     # the same for locations
+    place: np.ndarray
+
+def _distinct(values):
+    """First row of each distinct value and the distinct value number of every row"""
+    _, first, inverse = np.unique(values, axis=0, return_index=True, return_inverse=True)
+    return first, inverse.ravel()
+
+def _present(firsts, numbers, rows):
+    """First rows of the distinct values among rows (every row if None), and the number among those of each row's value"""
+    if rows is None:
+        return firsts, numbers
+    found, inverse = np.unique(numbers[rows], return_inverse=True)
+    return firsts[found], inverse
+
+def _top(scores, k):
+    """Columns and scores of the k best of each row, best first.
+
+    Ties are broken towards the lower column, as a stable sort would.
+    """
+    columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    values = np.take_along_axis(scores, columns, axis=1)
+    # Where more columns tie with the k-th best than were kept, keep the lowest ones
+    kth = values.min(axis=1, keepdims=True)
+    for row in np.flatnonzero((scores >= kth).sum(axis=1) > k):
+        better = np.flatnonzero(scores[row] > kth[row])
+        tied = np.flatnonzero(scores[row] == kth[row])[:k - len(better)]
+        columns[row] = np.concatenate([better, tied])
+        values[row] = scores[row, columns[row]]
+    order = np.lexsort((columns, -values))
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+class MatchingIndex:
+    """Feature arrays of one admin's buyers and available properties"""
+
+    def __init__(self, buyers, properties):
+        terms = {}
+        buyer_terms = [interest_terms(b.interests) for b in buyers]
+        for found in buyer_terms:
+            for term in found:
+                terms[term] = terms.get(term, 0) + 1
+        self.terms = sorted(terms, key=terms.get, reverse=True)[:MAX_INTEREST_TERMS]
+        bits = {term: np.uint64(1) << np.uint64(i) for i, term in enumerate(self.terms)}
+
+        # Location codes: regions and cities by name, districts by (city, district)
+        codes = ({}, {}, {})
+        places = {}
+        def location(region, city, district):
+            if (region, city, district) not in places:
+                names = [normalize_arabic(part) if part and part != UNSPECIFIED else None for part in (region, city, district)]
+                places[region, city, district] = tuple(
+                    codes[level].setdefault(key, len(codes[level])) if key and key[-1] else -1
+                    for level, key in enumerate(((names[0],), (names[1],), (names[1], names[2])))
+                )
+            return places[region, city, district]
+
+        self.property_ids = np.array([p.id for p in properties], dtype=np.int64)
+        self.prices = np.array([max(p.price or 0, 0) for p in properties], dtype=np.float64)
+        self.property_locations = np.array([location(p.region, p.city, p.district) for p in properties], dtype=np.int64).reshape(-1, 3)
+        # Listings often share their text, so each distinct text is searched once
+        texts, text_of = np.unique(np.array([f"{p.title or ''} {p.description or ''}" for p in properties],
+                                            dtype=np.dtypes.StringDType()), return_inverse=True)
+        texts = np.array([normalize_arabic(text) for text in texts], dtype=np.dtypes.StringDType())
+        text_masks = np.zeros(len(texts), dtype=np.uint64)
+        for term, bit in bits.items():
+            text_masks[np.strings.find(texts, term) >= 0] |= bit
+        self.property_masks = text_masks[text_of.ravel()]
+
+        self.buyer_ids = np.array([b.id for b in buyers], dtype=np.int64)
+        self.budgets = np.array([max(b.budget or 0, 1) for b in buyers], dtype=np.float64)
+        self.buyer_locations = np.array([
+            location(b.preferred_region, b.preferred_city, b.preferred_district) for b in buyers
+        ], dtype=np.int64).reshape(-1, 3)
+        self.buyer_masks = np.array([
+            sum((bits[term] for term in found if term in bits), np.uint64(0)) for found in buyer_terms
+        ], dtype=np.uint64)
+        # Interests outside the kept terms still count in the denominator
+        self.buyer_term_counts = np.array([len(found) for found in buyer_terms], dtype=np.int64)
+        self._buyer_features = self._property_features = None
+        self.built_at = time.time()
+
+    def interest_scores(self, buyer_rows, property_rows):
+        counts = self.buyer_term_counts[buyer_rows]
+        shared = np.bitwise_count(self.buyer_masks[buyer_rows] & self.property_masks[property_rows])
+        return np.where(counts > 0, shared / np.maximum(counts, 1), NEUTRAL)
+
+    def location_scores(self, buyer_rows, property_rows):
+        b_loc, p_loc = self.buyer_locations[buyer_rows], self.property_locations[property_rows]
+        location = np.where(b_loc[..., 0] == p_loc[..., 0], REGION_MATCH, 0.0)
+        location = np.where(b_loc[..., 1] == p_loc[..., 1], CITY_MATCH, location)
+        location = np.where(b_loc[..., 2] == p_loc[..., 2], DISTRICT_MATCH, location)
+        return np.where(b_loc.max(axis=-1) < 0, NEUTRAL, location)
+
+    def partial_scores(self, buyer_rows, property_rows):
+        """Interest and location part of the score, broadcasting buyer rows against property rows"""
+        return (INTERESTS_WEIGHT * self.interest_scores(buyer_rows, property_rows)
+                + LOCATION_WEIGHT * self.location_scores(buyer_rows, property_rows))
+
+    def buyer_features(self) -> Features:
+        if self._buyer_features is None:
+            self._buyer_features = Features(
+                *_distinct(np.column_stack([self.buyer_masks.view(np.int64), self.buyer_term_counts])),
+                *_distinct(self.buyer_locations),
+            )
+        return self._buyer_features
+
+    def property_features(self) -> Features:
+        if self._property_features is None:
+            self._property_features = Features(*_distinct(self.property_masks), *_distinct(self.property_locations))
+        return self._property_features
+
+    def partial_table(self, buyer_rows=None, property_rows=None, by_property=False):
+        """partial_scores of every buyer row against every property row (all rows of a side if None).
+
+        The table has a row per buyer, or a row per property with by_property.
+        Each component is computed once per distinct pair of its features and
+        then looked up, which is much cheaper than evaluating it per cell.
+        """
+        buyers, properties = self.buyer_features(), self.property_features()
+        buyer_interests, buyer_interest = _present(buyers.interests, buyers.interest, buyer_rows)
+        property_interests, property_interest = _present(properties.interests, properties.interest, property_rows)
+        buyer_places, buyer_place = _present(buyers.places, buyers.place, buyer_rows)
+        property_places, property_place = _present(properties.places, properties.place, property_rows)
+        interests = INTERESTS_WEIGHT * self.interest_scores(buyer_interests[:, None], property_interests)
+        locations = LOCATION_WEIGHT * self.location_scores(buyer_places[:, None], property_places)
+        # Weighting the small tables first and gathering whole rows, then columns, is cheapest
+        if by_property:
+            table = np.take(interests.T[property_interest], buyer_interest, axis=1)
+            table += np.take(locations.T[property_place], buyer_place, axis=1)
+        else:
+            table = np.take(interests[buyer_interest], property_interest, axis=1)
+            table += np.take(locations[buyer_place], property_place, axis=1)
+        return table
+
+    def score(self, buyer_rows, property_rows):
+        """Full scores, broadcasting buyer rows against property rows"""
+        ratio = self.prices[property_rows] / self.budgets[buyer_rows]
+        return BUDGET_WEIGHT * budget_fit(ratio) + self.partial_scores(buyer_rows, property_rows)
+
+    def top_properties(self, k=DEFAULT_K) -> Matches:
+        """The k best available properties for every buyer"""
+        matched, scores = self._search(k, buyers_query=True)
+        return Matches(self.buyer_ids, _ids(self.property_ids, matched), scores)
+
+    def top_buyers(self, k=DEFAULT_K) -> Matches:
+        """The k best buyers for every available property"""
+        matched, scores = self._search(k, buyers_query=False)
+        return Matches(self.property_ids, _ids(self.buyer_ids, matched), scores)
+
+    def _search(self, k, buyers_query):
+        """Rows of the k best targets (properties for buyers, or buyers for properties) of every query row.
+
+        Every pair is scored, a block of query rows against all targets at a time.
+        """
+        queries, targets = (len(self.buyer_ids), len(self.property_ids)) if buyers_query else (len(self.property_ids), len(self.buyer_ids))
+        matched = np.full((queries, k), -1, dtype=np.int64)
+        scores = np.full((queries, k), np.nan)
+        if not queries or not targets:
+            return matched, scores
+        found = min(k, targets)
+        block = max(1, MAX_BLOCK_CELLS // targets)
+        for start in range(0, queries, block):
+            rows = np.arange(start, min(start + block, queries))
+            if buyers_query:
+                table = self.partial_table(rows, None)
+                table += BUDGET_WEIGHT * budget_fit(self.prices / self.budgets[rows, None])
+            else:
+                table = self.partial_table(None, rows, by_property=True)
+                table += BUDGET_WEIGHT * budget_fit(self.prices[rows, None] / self.budgets)
+            matched[rows, :found], scores[rows, :found] = _top(table, found)
+        return matched, scores
+
+def _ids(ids, rows):
+    """Ids of the matched rows, keeping -1 for missing matches"""
+    found = rows >= 0
+    result = np.full(rows.shape, -1, dtype=np.int64)
+    result[found] = ids[rows[found]]
+    return result
+
+# Writes through database_utils rebuild an admin's index on its next use; it is
+# also rebuilt every MATCHING_INDEX_TTL seconds to pick up writes made by other processes
+MATCHING_INDEX_TTL = float(os.environ.get('AQARDASH_MATCHING_TTL', '600'))
+MATCHING_TABLES = ('RealEstate', 'Buyer')
+_indexes: Dict[int, Tuple[tuple, MatchingIndex]] = {}
+_indexes_lock = threading.Lock()
+
+def get_matching_index(admin_id) -> MatchingIndex:
+    """The matching index of an admin's buyers and available properties, built on first use"""
+    def current(cached):
+        return (cached is not None and cached[0] == read_cache.versions(admin_id, MATCHING_TABLES)
+                and time.time() - cached[1].built_at <= MATCHING_INDEX_TTL)
+
+    cached = _indexes.get(admin_id)
+    if not current(cached):
+        with _indexes_lock:
+            cached = _indexes.get(admin_id)
+            if not current(cached):
+                versions = read_cache.versions(admin_id, MATCHING_TABLES)
+                buyers = execute_query("""
+                    SELECT id, budget, interests, preferred_region, preferred_city, preferred_district
+                    FROM Buyer WHERE admin_id = ?
+                """, [admin_id])
+                properties = execute_query("""
+                    SELECT id, title, description, price, region, city, district
+                    FROM RealEstate WHERE admin_id = ? AND status = ?
+                """, [admin_id, AVAILABLE])
+                cached = _indexes[admin_id] = (versions, MatchingIndex(buyers, properties))
+    return cached[1]
+
+def properties_for_buyer(admin_id, buyer_id, k=DEFAULT_K) -> List[Tuple[int, float]]:
+    """(property id, score) pairs of the best available properties for one buyer"""
+    index = get_matching_index(admin_id)
+    rows = np.flatnonzero(index.buyer_ids == buyer_id)
+    if not len(rows) or not len(index.property_ids):
+        return []
+    scores = index.score(rows[0], np.arange(len(index.property_ids)))
+    best = np.argsort(-scores, kind='stable')[:k]
+    return [(int(index.property_ids[i]), float(scores[i])) for i in best]
+
+def buyers_for_property(admin_id, property_id, k=DEFAULT_K) -> List[Tuple[int, float]]:
+    """(buyer id, score) pairs of the best buyers for one available property"""
+    index = get_matching_index(admin_id)
+    rows = np.flatnonzero(index.property_ids == property_id)
+    if not len(rows) or not len(index.buyer_ids):
+        return []
+    scores = index.score(np.arange(len(index.buyer_ids)), rows[0])
+    best = np.argsort(-scores, kind='stable')[:k]
+    return [(int(index.buyer_ids[i]), float(scores[i])) for i in best]
@@ -5,10 +5,77 @@ from database_utils import search_properties, search_buyers
 import numpy as np
 import os
 from datetime import datetime
+from exporter import FORMATS
+from jobs import stage_upload, submit_job
+from utils.job_widgets import jobs_panel
+
+EXPORT_DATASETS = {
+    "العقارات": "properties",
+    "المشترين": "buyers",
+    "المعلنين": "marketers",
+    "روابط المشترين بالعقارات": "buyer_real_estates",
+    "روابط المعلنين بالعقارات": "marketer_real_estates",
+}
+
+def background_jobs_section():
+    """Start long-running work in the background and follow its progress"""
+    st.header("المهام في الخلفية")
+    admin_id = st.session_state.admin_id
+    col1, col2, col3, col4, col5, col6 = st.columns(6)
+    
+    with col1:
+        st.subheader("استيراد عقارات")
+        uploaded = st.file_uploader("ملف CSV أو XLSX", type=["csv", "xlsx"], key="job_import_file")
+        skip_duplicates = st.checkbox("تخطي العقارات المكررة", value=True, key="job_import_skip_duplicates")
+        if st.button("بدء الاستيراد", key="job_import", disabled=uploaded is None):
+            path = stage_upload(uploaded, uploaded.name)
+            submit_job(admin_id, 'import', path=path, filename=uploaded.name, skip_duplicates=skip_duplicates)
+            st.rerun()
+    
+    with col2:
+        st.subheader("تصدير بيانات")
+        dataset = EXPORT_DATASETS[st.selectbox("البيانات", list(EXPORT_DATASETS), key="job_export_dataset")]
+        fmt = st.selectbox("الصيغة", list(FORMATS), key="job_export_format")
+        if st.button("بدء التصدير", key="job_export"):
+            submit_job(admin_id, 'export', dataset=dataset, fmt=fmt)
+            st.rerun()
+    
+    with col3:
+        st.subheader("تقرير الأسعار")
+        st.caption("عدد العقارات ومتوسط ووسيط الأسعار وسعر المتر لكل مدينة")
+        if st.button("إنشاء التقرير", key="job_price_report"):
+            submit_job(admin_id, 'price_report')
+            st.rerun()
+    
+    with col4:
+        st.subheader("مطابقة المشترين")
+        st.caption("أفضل العقارات المتاحة لكل مشتر وأفضل المشترين لكل عقار حسب الميزانية والاهتمامات والموقع")
+        if st.button("بدء المطابقة", key="job_matches"):
+            submit_job(admin_id, 'matches')
+            st.rerun()
+    
+    with col5:
+        st.subheader("الأسعار الشاذة")
+        st.caption("العقارات التي يبتعد سعرها كثيراً عن السعر التقديري لمثيلاتها في المدينة والحي والنوع")
+        if st.button("بدء الفحص", key="job_price_outliers"):
+            submit_job(admin_id, 'price_outliers')
+            st.rerun()
+    
+    with col6:
+        st.subheader("العقارات المكررة")
+        st.caption("مجموعات العقارات التي تتشارك رابط المصدر، أو الحي والمساحة والسعر، أو وصفاً شبه متطابق، للمراجعة")
+        if st.button("بدء الفحص", key="job_duplicates"):
+            submit_job(admin_id, 'duplicates')
+            st.rerun()
+    
+    st.subheader("آخر المهام")
+    jobs_panel(admin_id)
 
 def automation_page():
     st.title("صفحة الأتمتة")
 
+    background_jobs_section()
+
     # Audio Recording Section
     st.header("تسجيل الصوت")
     if st.button("بدء التسجيل"):
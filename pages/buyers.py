@@ -1,10 +1,22 @@
 import streamlit as st
-import pandas as pd
 from database_utils import (
-    search_buyers, add_buyer, update_buyer, delete_buyer,
-    get_all_real_estates, add_buyer_real_estate, delete_buyer_real_estate,
-    get_buyer_real_estates
+    search_buyers_page, add_buyer, update_buyer, delete_buyer,
+    add_buyer_real_estate, delete_buyer_real_estate,
+    get_real_estates_for_buyers, get_property_index, get_interest_terms
 )
+from matching import properties_for_buyer
+from utils.pagination import PAGE_SIZE, current_cursor, page_controls
+from utils.exports import export_button
+from utils.pickers import property_picker
+
+# Suggested properties shown per buyer
+MATCH_SUGGESTIONS = 5
+
+SORT_OPTIONS = {
+    "الاسم": "name",
+    "الميزانية: من الأعلى": "budget_desc",
+    "الميزانية: من الأقل": "budget_asc",
+}
 
 def buyers_page():
     st.title("إدارة المشترين")
@@ -33,6 +45,9 @@ def buyers_page():
             
             with col2:
                 interests = st.text_area("الاهتمامات", value=st.session_state.edit_buyer_data.get('interests', '') if st.session_state.edit_buyer_data else "")
+                preferred_region = st.text_input("المنطقة المفضلة", value=st.session_state.edit_buyer_data.get('preferred_region') or "" if st.session_state.edit_buyer_data else "")
+                preferred_city = st.text_input("المدينة المفضلة", value=st.session_state.edit_buyer_data.get('preferred_city') or "" if st.session_state.edit_buyer_data else "")
+                preferred_district = st.text_input("الحي المفضل", value=st.session_state.edit_buyer_data.get('preferred_district') or "" if st.session_state.edit_buyer_data else "")
             
             submit_button = st.form_submit_button("حفظ")
             
@@ -43,6 +58,9 @@ def buyers_page():
                     'email': email,
                     'budget': budget,
                     'interests': interests,
+                    'preferred_region': preferred_region or None,
+                    'preferred_city': preferred_city or None,
+                    'preferred_district': preferred_district or None,
                     'admin_id': st.session_state.admin_id
                 }
                 
@@ -69,24 +87,46 @@ def buyers_page():
         min_budget = st.number_input("الحد الأدنى للميزانية (ريال)", min_value=0, value=0)
         max_budget = st.number_input("الحد الأقصى للميزانية (ريال)", min_value=0, value=10000000)
     
-    # Get filtered buyers
-    buyers = search_buyers(
-        admin_id=st.session_state.admin_id,
+    with col2:
+        preferred_city = st.text_input("المدينة المفضلة", key="filter_preferred_city")
+        interests = st.multiselect(
+            "الاهتمامات",
+            [term['term'] for term in get_interest_terms(st.session_state.admin_id)],
+            key="filter_interests"
+        )
+        sort = SORT_OPTIONS[st.selectbox("الترتيب", list(SORT_OPTIONS.keys()), key="buyer_sort")]
+    
+    # Get the current page of filtered buyers
+    filters = dict(
         search_term=search_term if search_term else None,
         min_budget=min_budget,
-        max_budget=max_budget
+        max_budget=max_budget,
+        preferred_city=preferred_city if preferred_city else None,
+        interests=interests if interests else None
+    )
+    page = search_buyers_page(
+        st.session_state.admin_id,
+        sort=sort,
+        cursor=current_cursor("buyers", (sort, filters)),
+        limit=PAGE_SIZE,
+        with_total=True,
+        **filters
     )
+    with st.expander("تصدير"):
+        export_button("تصدير المشترين المطابقين", "buyers", st.session_state.admin_id, "export_buyers", **filters)
+        export_button("تصدير روابط المشترين بالعقارات", "buyer_real_estates", st.session_state.admin_id, "export_buyer_links")
+    
+    buyers = page.rows
     
     # Display buyers
     if buyers:
         st.header("قائمة المشترين")
-        buyers_df = pd.DataFrame(buyers, columns=[
-            'id', 'name', 'phone', 'email', 'budget',
-            'interests', 'admin_id'
-        ])
+        # Load every association once for the whole page
+        admin_id = st.session_state.admin_id
+        linked_real_estates = get_real_estates_for_buyers([buyer.id for buyer in buyers], admin_id)
         
         # Display buyers with edit/delete options
-        for _, buyer in buyers_df.iterrows():
+        for buyer in buyers:
             with st.expander(buyer['name']):
                 col1, col2 = st.columns(2)
                 
@@ -97,20 +137,23 @@ def buyers_page():
                 
                 with col2:
                     st.write(f"**الاهتمامات:** {buyer['interests']}")
+                    location = '، '.join(part for part in (buyer['preferred_district'], buyer['preferred_city'], buyer['preferred_region']) if part)
+                    if location:
+                        st.write(f"**الموقع المفضل:** {location}")
                 
                 # Edit/Delete buttons
                 col1, col2 = st.columns(2)
                 with col1:
                     if st.button("تعديل", key=f"edit_{buyer['id']}"):
                         st.session_state.edit_buyer_id = buyer['id']
-                        st.session_state.edit_buyer_data = buyer.to_dict()
+                        st.session_state.edit_buyer_data = buyer._asdict()
                         st.rerun()
                 
                 with col2:
                     if st.button("حذف", key=f"delete_{buyer['id']}"):
                         if st.checkbox(f"هل أنت متأكد من حذف {buyer['name']}؟", key=f"confirm_delete_{buyer['id']}"):
                             try:
-                                delete_buyer(buyer['id'])
+                                delete_buyer(buyer['id'], admin_id)
                                 st.success("تم حذف المشتري بنجاح")
                                 st.rerun()
                             except Exception as e:
@@ -118,13 +161,13 @@ def buyers_page():
                 
                 # Real estate associations
                 st.subheader("العقارات المرتبطة")
-                real_estates = get_buyer_real_estates(buyer['id'])
+                real_estates = linked_real_estates[buyer['id']]
                 if real_estates:
                     for real_estate in real_estates:
                         st.write(f"- {real_estate['title']} ({real_estate['price']} ريال)")
                         if st.button("إزالة", key=f"remove_{buyer['id']}_{real_estate['id']}"):
                             try:
-                                delete_buyer_real_estate(buyer['id'], real_estate['id'])
+                                delete_buyer_real_estate(buyer['id'], real_estate['id'], admin_id)
                                 st.success("تم إزالة العقار بنجاح")
                                 st.rerun()
                             except Exception as e:
@@ -134,22 +177,40 @@ def buyers_page():
                 
                 # Add real estate association
                 st.subheader("إضافة عقار")
-                all_real_estates = get_all_real_estates(st.session_state.admin_id)
-                if all_real_estates:
-                    real_estate_options = {f"{re['title']} ({re['price']} ريال)": re['id'] for re in all_real_estates}
-                    selected_real_estate = st.selectbox(
-                        "اختر عقار",
-                        options=list(real_estate_options.keys()),
-                        key=f"select_real_estate_{buyer['id']}"
-                    )
+                selected_real_estate = property_picker(f"real_estate_picker_{buyer['id']}", admin_id)
+                if selected_real_estate is not None:
                     if st.button("إضافة", key=f"add_real_estate_{buyer['id']}"):
                         try:
-                            add_buyer_real_estate(buyer['id'], real_estate_options[selected_real_estate])
+                            add_buyer_real_estate(buyer['id'], selected_real_estate, admin_id)
                             st.success("تم إضافة العقار بنجاح")
                             st.rerun()
                         except Exception as e:
                             st.error(f"حدث خطأ أثناء إضافة العقار: {str(e)}")
-                else:
-                    st.info("لا توجد عقارات متاحة")
+                
+                # Suggested properties, best match first
+                if st.toggle("العقارات المقترحة", key=f"suggest_{buyer['id']}"):
+                    linked = {real_estate['id'] for real_estate in real_estates}
+                    suggestions = [
+                        (real_estate_id, score)
+                        for real_estate_id, score in properties_for_buyer(admin_id, buyer['id'], MATCH_SUGGESTIONS + len(linked))
+                        if real_estate_id not in linked
+                    ][:MATCH_SUGGESTIONS]
+                    if not suggestions:
+                        st.info("لا توجد عقارات متاحة")
+                    index = get_property_index(admin_id)
+                    for real_estate_id, score in suggestions:
+                        col1, col2 = st.columns([4, 1])
+                        with col1:
+                            st.write(f"- {index.label(real_estate_id) or real_estate_id} - التطابق {score:.0%}")
+                        with col2:
+                            if st.button("ربط", key=f"link_suggested_{buyer['id']}_{real_estate_id}"):
+                                try:
+                                    add_buyer_real_estate(buyer['id'], real_estate_id, admin_id)
+                                    st.success("تم إضافة العقار بنجاح")
+                                    st.rerun()
+                                except Exception as e:
+                                    st.error(f"حدث خطأ أثناء إضافة العقار: {str(e)}")
+        
+        page_controls("buyers", page)
     else:
         st.info("لا توجد مشترين مطابقين للبحث") 
\ No newline at end of file
@@ -0,0 +1,38 @@
+import os
+import streamlit as st
+import pandas as pd
+from utils.query_trace import tracer
+from utils.cache import read_cache
+
+# Usernames allowed to see the query debug panel, e.g. AQARDASH_DEBUG_ADMINS=admin123,manager
+DEBUG_ADMINS = {name.strip() for name in os.environ.get('AQARDASH_DEBUG_ADMINS', '').split(',') if name.strip()}
+
+def _records_df(records):
+    return pd.DataFrame([{
+        'الاستعلام': record.statement,
+        'المعاملات': record.params_shape,
+        'الصفوف': record.rows,
+        'الزمن (ms)': round(record.duration_ms, 2),
+    } for record in records])
+
+def debug_panel(rerun):
+    """Sidebar panel with the SQL issued by this rerun and recent slow queries"""
+    if st.session_state.get('username') not in DEBUG_ADMINS or rerun is None:
+        return
+    
+    with st.sidebar.expander("تتبع الاستعلامات"):
+        st.metric("عدد الاستعلامات", rerun.query_count)
+        st.metric("الزمن الكلي (ms)", f"{rerun.total_ms:.1f}")
+        st.metric("عدد الصفوف", rerun.total_rows)
+        if rerun.records:
+            st.dataframe(_records_df(rerun.records), hide_index=True)
+        
+        stats = read_cache.stats()
+        st.caption(f"ذاكرة القراءة المؤقتة: {stats['entries']} عنصر، "
+                   f"{stats['bytes'] / 1024:.0f} KB، {stats['hits']} إصابة / {stats['misses']} إخفاق")
+        
+        st.subheader(f"الاستعلامات البطيئة (> {tracer.slow_ms:g} ms)")
+        if tracer.slow:
+            st.dataframe(_records_df(reversed(tracer.slow)), hide_index=True)
+        else:
+            st.info("لا توجد استعلامات بطيئة")
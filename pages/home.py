@@ -1,31 +1,12 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from database_utils import search_properties, search_buyers, search_marketers
-
-def create_price_ranges(price):
-    if price < 100000:
-        return "0-100K"
-    elif price < 200000:
-        return "100K-200K"
-    elif price < 300000:
-        return "200K-300K"
-    elif price < 400000:
-        return "300K-400K"
-    else:
-        return "400K+"
-
-def create_area_ranges(area):
-    if area < 100:
-        return "0-100"
-    elif area < 200:
-        return "100-200"
-    elif area < 300:
-        return "200-300"
-    elif area < 400:
-        return "300-400"
-    else:
-        return "400+"
+from analytics import (
+    get_totals, properties_by_status, properties_by_city,
+    properties_by_type, properties_by_price_range, properties_by_area_range,
+    buyers_by_budget_range, top_buyers_by_budget, marketers_by_type
+)
+from utils.map_widgets import property_map
 
 def home_page():
     # Check if user is logged in
@@ -35,87 +16,71 @@ def home_page():
     
     st.title("لوحة التحكم")
     
-    # Get all data for analytics
-    properties = search_properties(admin_id=st.session_state.admin_id)
-    buyers = search_buyers(admin_id=st.session_state.admin_id)
-    marketers = search_marketers(admin_id=st.session_state.admin_id)
-    
-    # Convert to DataFrames with proper column names
-    properties_df = pd.DataFrame(properties, columns=[
-        'id', 'title', 'announcement_date', 'property_type', 'property_scale', 
-        'area', 'category', 'floors', 'bedrooms', 'bathrooms', 'living_rooms', 
-        'price', 'region', 'district', 'city', 'location_link', 'source_link', 
-        'location_details', 'description', 'status', 'admin_id'
-    ])
-    
-    buyers_df = pd.DataFrame(buyers, columns=[
-        'id', 'name', 'phone', 'email', 'budget', 'interests', 'status'
-    ])
-    
-    marketers_df = pd.DataFrame(marketers, columns=[
-        'id', 'name', 'phone', 'marketer_type', 'email', 'admin_id'
-    ])
+    # Figures come from the trigger-maintained DashboardSummary table
+    admin_id = st.session_state.admin_id
+    totals = get_totals(admin_id)
     
     # Section 1: Key Metrics
     st.header("المؤشرات الرئيسية")
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        st.metric("إجمالي العقارات", len(properties))
+        st.metric("إجمالي العقارات", totals['properties'])
     
     with col2:
-        st.metric("إجمالي المشترين", len(buyers))
+        st.metric("إجمالي المشترين", totals['buyers'])
     
     with col3:
-        st.metric("إجمالي المعلنين", len(marketers))
+        st.metric("إجمالي المعلنين", totals['marketers'])
     
     # Section 2: Real Estate Analytics
-    if not properties_df.empty:
+    if totals['properties']:
         st.header("تحليلات العقارات")
         
         # Create tabs for different real estate analytics
-        tab1, tab2, tab3, tab4 = st.tabs(["حسب الحالة", "حسب نطاق السعر", "حسب المدينة", "حسب المساحة"])
+        tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["حسب الحالة", "حسب نطاق السعر", "حسب المدينة", "حسب المساحة", "حسب النوع", "الخريطة"])
         
         with tab1:
-            status_counts = properties_df['status'].value_counts()
-            fig = px.pie(values=status_counts.values, names=status_counts.index, title="توزيع العقارات حسب الحالة")
+            status_df = pd.DataFrame(properties_by_status(admin_id), columns=['status', 'count'])
+            fig = px.pie(status_df, values='count', names='status', title="توزيع العقارات حسب الحالة")
             st.plotly_chart(fig)
         
         with tab2:
-            properties_df['price_range'] = properties_df['price'].apply(create_price_ranges)
-            price_counts = properties_df['price_range'].value_counts()
-            fig = px.pie(values=price_counts.values, names=price_counts.index, title="توزيع العقارات حسب نطاق السعر")
+            price_df = pd.DataFrame(properties_by_price_range(admin_id), columns=['price_range', 'count'])
+            fig = px.pie(price_df, values='count', names='price_range', title="توزيع العقارات حسب نطاق السعر")
             st.plotly_chart(fig)
         
         with tab3:
-            city_counts = properties_df['city'].value_counts()
-            city_df = pd.DataFrame({
-                'city': city_counts.index,
-                'count': city_counts.values
-            })
+            city_df = pd.DataFrame(properties_by_city(admin_id), columns=['city', 'count'])
             fig = px.bar(city_df, x='city', y='count', title="توزيع العقارات حسب المدينة")
             st.plotly_chart(fig)
         
         with tab4:
-            properties_df['area_range'] = properties_df['area'].apply(create_area_ranges)
-            area_counts = properties_df['area_range'].value_counts()
-            fig = px.pie(values=area_counts.values, names=area_counts.index, title="توزيع العقارات حسب المساحة")
+            area_df = pd.DataFrame(properties_by_area_range(admin_id), columns=['area_range', 'count'])
+            fig = px.pie(area_df, values='count', names='area_range', title="توزيع العقارات حسب المساحة")
             st.plotly_chart(fig)
+        
+        with tab5:
+            type_df = pd.DataFrame(properties_by_type(admin_id), columns=['property_type', 'count'])
+            fig = px.pie(type_df, values='count', names='property_type', title="توزيع العقارات حسب النوع")
+            st.plotly_chart(fig)
+        
+        with tab6:
+            property_map(admin_id, "home_map")
     
     # Section 3: Buyers Analytics
-    if not buyers_df.empty:
+    if totals['buyers']:
         st.header("تحليلات المشترين")
-        top_buyers = buyers_df.sort_values('budget', ascending=False).head(10)
+        top_buyers = pd.DataFrame(top_buyers_by_budget(admin_id, 10), columns=['name', 'budget'])
         fig = px.bar(top_buyers, x='name', y='budget', title="أعلى 10 مشترين حسب الميزانية")
         st.plotly_chart(fig)
+        budget_df = pd.DataFrame(buyers_by_budget_range(admin_id), columns=['budget_range', 'count'])
+        fig = px.bar(budget_df, x='budget_range', y='count', title="توزيع المشترين حسب الميزانية")
+        st.plotly_chart(fig)
     
     # Section 4: Marketers Analytics
-    if not marketers_df.empty:
+    if totals['marketers']:
         st.header("تحليلات المعلنين")
-        marketer_type_counts = marketers_df['marketer_type'].value_counts()
-        marketer_df = pd.DataFrame({
-            'type': marketer_type_counts.index,
-            'count': marketer_type_counts.values
-        })
+        marketer_df = pd.DataFrame(marketers_by_type(admin_id), columns=['type', 'count'])
         fig = px.bar(marketer_df, x='type', y='count', title="توزيع المعلنين حسب النوع")
-        st.plotly_chart(fig) 
\ No newline at end of file
+        st.plotly_chart(fig)
@@ -1,10 +1,12 @@
 import streamlit as st
-import pandas as pd
 from database_utils import (
-    search_marketers, add_marketer, update_marketer, delete_marketer,
-    get_all_real_estates, add_marketer_real_estate, delete_marketer_real_estate,
-    get_marketer_real_estates
+    search_marketers_page, add_marketer, update_marketer, delete_marketer,
+    add_marketer_real_estate, delete_marketer_real_estate,
+    get_real_estates_for_marketers
 )
+from utils.pagination import PAGE_SIZE, current_cursor, page_controls
+from utils.exports import export_button
+from utils.pickers import property_picker
 
 def marketers_page():
     st.title("إدارة المعلنين")
@@ -66,21 +68,30 @@ def marketers_page():
     st.header("البحث والتصفية")
     search_term = st.text_input("بحث", key="search_term")
     
-    # Get filtered marketers
-    marketers = search_marketers(
-        admin_id=st.session_state.admin_id,
-        search_term=search_term if search_term else None
+    # Get the current page of filtered marketers
+    filters = dict(search_term=search_term if search_term else None)
+    page = search_marketers_page(
+        st.session_state.admin_id,
+        cursor=current_cursor("marketers", filters),
+        limit=PAGE_SIZE,
+        with_total=True,
+        **filters
     )
+    with st.expander("تصدير"):
+        export_button("تصدير المعلنين المطابقين", "marketers", st.session_state.admin_id, "export_marketers", **filters)
+        export_button("تصدير روابط المعلنين بالعقارات", "marketer_real_estates", st.session_state.admin_id, "export_marketer_links")
+    
+    marketers = page.rows
     
     # Display marketers
     if marketers:
         st.header("قائمة المعلنين")
-        marketers_df = pd.DataFrame(marketers, columns=[
-            'id', 'name', 'phone', 'marketer_type', 'email', 'admin_id'
-        ])
+        # Load every association once for the whole page
+        admin_id = st.session_state.admin_id
+        linked_real_estates = get_real_estates_for_marketers([marketer.id for marketer in marketers], admin_id)
         
         # Display marketers with edit/delete options
-        for _, marketer in marketers_df.iterrows():
+        for marketer in marketers:
             with st.expander(marketer['name']):
                 col1, col2 = st.columns(2)
                 
@@ -96,14 +107,14 @@ def marketers_page():
                 with col1:
                     if st.button("تعديل", key=f"edit_{marketer['id']}"):
                         st.session_state.edit_marketer_id = marketer['id']
-                        st.session_state.edit_marketer_data = marketer.to_dict()
+                        st.session_state.edit_marketer_data = marketer._asdict()
                         st.rerun()
                 
                 with col2:
                     if st.button("حذف", key=f"delete_{marketer['id']}"):
                         if st.checkbox(f"هل أنت متأكد من حذف {marketer['name']}؟", key=f"confirm_delete_{marketer['id']}"):
                             try:
-                                delete_marketer(marketer['id'])
+                                delete_marketer(marketer['id'], admin_id)
                                 st.success("تم حذف المسوق بنجاح")
                                 st.rerun()
                             except Exception as e:
@@ -111,13 +122,13 @@ def marketers_page():
                 
                 # Real estate associations
                 st.subheader("العقارات المرتبطة")
-                real_estates = get_marketer_real_estates(marketer['id'])
+                real_estates = linked_real_estates[marketer['id']]
                 if real_estates:
                     for real_estate in real_estates:
                         st.write(f"- {real_estate['title']} ({real_estate['price']} ريال)")
                         if st.button("إزالة", key=f"remove_{marketer['id']}_{real_estate['id']}"):
                             try:
-                                delete_marketer_real_estate(marketer['id'], real_estate['id'])
+                                delete_marketer_real_estate(marketer['id'], real_estate['id'], admin_id)
                                 st.success("تم إزالة العقار بنجاح")
                                 st.rerun()
                             except Exception as e:
@@ -127,22 +138,16 @@ def marketers_page():
                 
                 # Add real estate association
                 st.subheader("إضافة عقار")
-                all_real_estates = get_all_real_estates(st.session_state.admin_id)
-                if all_real_estates:
-                    real_estate_options = {f"{re['title']} ({re['price']} ريال)": re['id'] for re in all_real_estates}
-                    selected_real_estate = st.selectbox(
-                        "اختر عقار",
-                        options=list(real_estate_options.keys()),
-                        key=f"select_real_estate_{marketer['id']}"
-                    )
+                selected_real_estate = property_picker(f"real_estate_picker_{marketer['id']}", admin_id)
+                if selected_real_estate is not None:
                     if st.button("إضافة", key=f"add_real_estate_{marketer['id']}"):
                         try:
-                            add_marketer_real_estate(marketer['id'], real_estate_options[selected_real_estate])
+                            add_marketer_real_estate(marketer['id'], selected_real_estate, admin_id)
                             st.success("تم إضافة العقار بنجاح")
                             st.rerun()
                         except Exception as e:
                             st.error(f"حدث خطأ أثناء إضافة العقار: {str(e)}")
-                else:
-                    st.info("لا توجد عقارات متاحة")
+        
+        page_controls("marketers", page)
     else:
         st.info("لا توجد مسوقين مطابقين للبحث")
@@ -1,9 +1,168 @@
 import streamlit as st
 import pandas as pd
 from database_utils import (
-    search_properties, add_property, update_property, delete_property,
-    get_all_real_estates
+    search_properties_page, add_property, update_property, delete_property,
+    get_all_real_estates, to_columns, comparable_properties, estimate_prices,
+    DUPLICATE_REASONS, DuplicatePropertyError
 )
+from database import AMENITIES
+from utils.geo import CITY_CENTROIDS
+from utils.pagination import PAGE_SIZE, current_cursor, page_controls
+from jobs import stage_upload, submit_job
+from utils.job_widgets import job_status
+from utils.map_widgets import property_map
+from utils.price_model import OUTLIER_SCORE
+from utils.exports import export_button
+
+SORT_OPTIONS = {
+    "الأحدث": "newest",
+    "الأقدم": "oldest",
+    "السعر: من الأقل": "price_asc",
+    "السعر: من الأعلى": "price_desc",
+    "الأكثر صلة": "relevance",
+}
+
+VIEW_MODES = {
+    "بطاقات": "cards",
+    "جدول": "table",
+}
+
+# The table is a single virtualized element, so it can show larger pages
+TABLE_PAGE_SIZE = 200
+# Comparable properties shown under a listing
+COMPS_SHOWN = 5
+DUPLICATES_SHOWN = 5
+
+STATUS_COLORS = {"متاح": "green", "محجوز": "orange", "مباع": "red"}
+
+def _display_title(property):
+    return property['title'] if property['title'] else f"{property['property_type']} في {property['region']} - {property['city']}, {property['district']}"
+
+def _estimate_section(estimate):
+    """Estimated price of a property and how far its price is from it"""
+    if estimate is None:
+        return
+    price, score = estimate
+    st.write(f"**السعر التقديري:** {price:,.0f} ريال (الانحراف {score:+.1f})")
+    if abs(score) > OUTLIER_SCORE:
+        st.warning("السعر بعيد عن تقدير مثيلاته في نفس المدينة والحي والنوع")
+
+def _comps_section(admin_id, property):
+    """The listings most similar to a property, on demand"""
+    if not st.toggle("عقارات مشابهة", key=f"comps_{property['id']}"):
+        return
+    comps = comparable_properties(admin_id, property['id'], COMPS_SHOWN)
+    if not comps:
+        st.info("لا توجد عقارات مشابهة")
+    for comp, distance in comps:
+        price_per_m2 = f" ({comp['price'] / comp['area']:,.0f} ريال/م²)" if comp['area'] else ""
+        st.write(
+            f"- {_display_title(comp)} - {comp['area']} م² - {comp['bedrooms'] or 0} غرف - "
+            f"{comp['price']} ريال{price_per_m2} - {comp['status']} - الفرق {distance:.2f}"
+        )
+
+def _duplicate_confirmation():
+    """Existing listings a new property duplicates, with the choice to add it anyway"""
+    property_data, duplicates = st.session_state.duplicate_property
+    st.warning("يبدو أن هذا العقار مضاف من قبل:")
+    for duplicate, reason, similarity in duplicates[:DUPLICATES_SHOWN]:
+        st.write(
+            f"- {_display_title(duplicate)} (رقم {duplicate['id']}) - {duplicate['area']} م² - "
+            f"{duplicate['price']} ريال - {duplicate['status']} - {DUPLICATE_REASONS[reason]}"
+        )
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("إضافة على أي حال", key="add_duplicate"):
+            try:
+                add_property(property_data)
+                st.session_state.duplicate_property = None
+                st.rerun()
+            except Exception as e:
+                st.error(f"حدث خطأ: {str(e)}")
+    with col2:
+        if st.button("إلغاء", key="cancel_duplicate"):
+            st.session_state.duplicate_property = None
+            st.rerun()
+
+def _table_columns():
+    return {
+        'title': st.column_config.TextColumn("العنوان", pinned=True),
+        'property_type': st.column_config.TextColumn("النوع"),
+        'property_scale': st.column_config.TextColumn("نطاق العقار"),
+        'category': st.column_config.TextColumn("الفئة"),
+        'city': st.column_config.TextColumn("المدينة"),
+        'district': st.column_config.TextColumn("الحي"),
+        'area': st.column_config.NumberColumn("المساحة (م²)", format="%.0f"),
+        'price': st.column_config.NumberColumn("السعر (ريال)", format="localized"),
+        'bedrooms': st.column_config.NumberColumn("غرف النوم"),
+        'bathrooms': st.column_config.NumberColumn("الحمامات"),
+        'status': st.column_config.MultiselectColumn(
+            "الحالة", options=list(STATUS_COLORS), color=list(STATUS_COLORS.values())
+        ),
+        'announcement_date': st.column_config.TextColumn("تاريخ الإعلان"),
+        'location_link': st.column_config.LinkColumn("رابط الموقع", display_text="فتح"),
+        'source_link': st.column_config.LinkColumn("رابط المصدر", display_text="فتح"),
+    }
+
+def property_table(properties):
+    """Show a page of properties as one dataframe; the selected row can be edited or deleted"""
+    columns = _table_columns()
+    table = pd.DataFrame(to_columns(properties))
+    # MultiselectColumn draws list values as coloured badges
+    table['status'] = [[status] for status in table['status']]
+    event = st.dataframe(
+        table,
+        hide_index=True,
+        column_order=list(columns),
+        column_config=columns,
+        on_select="rerun",
+        selection_mode="single-row",
+        key="properties_table"
+    )
+    
+    selected_rows = [i for i in event.selection.rows if i < len(properties)]
+    if not selected_rows:
+        st.caption("اختر عقاراً من الجدول لتعديله أو حذفه")
+        return
+    
+    property = properties[selected_rows[0]]
+    title = _display_title(property)
+    st.write(f"**العقار المحدد:** {title}")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("تعديل", key="table_edit"):
+            st.session_state.edit_property_id = property['id']
+            st.session_state.edit_property_data = property._asdict()
+            st.rerun()
+    
+    with col2:
+        confirm = st.checkbox("تأكيد الحذف", key=f"table_confirm_delete_{property['id']}")
+    
+    with col3:
+        if st.button("حذف", key="table_delete", disabled=not confirm):
+            try:
+                delete_property(property['id'], st.session_state.admin_id)
+                st.success("تم حذف العقار بنجاح")
+                st.rerun()
+            except Exception as e:
+                st.error(f"حدث خطأ أثناء حذف العقار: {str(e)}")
+
+def import_section():
+    """Upload a CSV/XLSX file of listings and import it as a background job"""
+    with st.expander("استيراد عقارات من ملف"):
+        st.caption("ملف CSV (UTF-8) أو XLSX، عناوين الأعمدة كما في نموذج الإضافة")
+        uploaded = st.file_uploader("الملف", type=["csv", "xlsx"], key="import_file")
+        skip_duplicates = st.checkbox("تخطي العقارات المكررة", value=True, key="import_skip_duplicates",
+                                      help="ترفض الصفوف المكررة لعقار موجود أو لصف سابق في الملف وتظهر في تقرير الأخطاء")
+        if uploaded and st.button("استيراد", key="import_start"):
+            admin_id = st.session_state.admin_id
+            path = stage_upload(uploaded, uploaded.name)
+            st.session_state.import_job_id = submit_job(admin_id, 'import', path=path, filename=uploaded.name,
+                                                        skip_duplicates=skip_duplicates)
+        
+        # The import keeps running if the user leaves the page; its status is also on the automation page
+        if st.session_state.get('import_job_id'):
+            job_status(st.session_state.import_job_id, st.session_state.admin_id)
 
 def real_estate_page():
     st.title("إدارة العقارات")
@@ -92,13 +251,20 @@ def real_estate_page():
                         update_property(property_data)
                         st.success("تم تحديث بيانات العقار بنجاح")
                     else:
-                        add_property(property_data)
+                        add_property(property_data, check_duplicates=True)
                         st.success("تم إضافة العقار بنجاح")
                     st.session_state.edit_property_id = None
                     st.session_state.edit_property_data = None
                     st.rerun()
+                except DuplicatePropertyError as e:
+                    st.session_state.duplicate_property = (property_data, e.duplicates)
                 except Exception as e:
                     st.error(f"حدث خطأ: {str(e)}")
+        
+        if st.session_state.get('duplicate_property'):
+            _duplicate_confirmation()
+    
+    import_section()
     
     # Search and filter section
     st.header("البحث والتصفية")
@@ -122,9 +288,26 @@ def real_estate_page():
         max_area = st.number_input("الحد الأقصى للمساحة (م²)", min_value=0, value=10000)
         district = st.text_input("الحي", key="filter_district")
     
-    # Get filtered properties
-    properties = search_properties(
-        admin_id=st.session_state.admin_id,
+    amenities = st.multiselect("المميزات", list(AMENITIES), key="filter_amenities")
+    with st.expander("البحث حسب الموقع"):
+        default_latitude, default_longitude = CITY_CENTROIDS['الرياض']
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            latitude = st.number_input("خط العرض", min_value=-90.0, max_value=90.0, value=default_latitude, format="%.4f", key="filter_latitude")
+        with col2:
+            longitude = st.number_input("خط الطول", min_value=-180.0, max_value=180.0, value=default_longitude, format="%.4f", key="filter_longitude")
+        with col3:
+            radius_km = st.number_input("نصف القطر (كم)، صفر لإلغاء التصفية", min_value=0.0, value=0.0, key="filter_radius")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        sort = SORT_OPTIONS[st.selectbox("الترتيب", list(SORT_OPTIONS.keys()), key="property_sort")]
+    with col2:
+        view = VIEW_MODES[st.radio("طريقة العرض", list(VIEW_MODES.keys()), horizontal=True, key="property_view")]
+    page_size = TABLE_PAGE_SIZE if view == "table" else PAGE_SIZE
+    
+    # Get the current page of filtered properties
+    filters = dict(
         search_term=search_term if search_term else None,
         property_type=property_type if property_type != "الكل" else None,
         min_price=min_price,
@@ -132,66 +315,85 @@ def real_estate_page():
         min_area=min_area,
         max_area=max_area,
         city=city if city else None,
-        district=district if district else None
+        district=district if district else None,
+        amenities=amenities if amenities else None,
+        within=(latitude, longitude, radius_km) if radius_km else None
+    )
+    page = search_properties_page(
+        st.session_state.admin_id,
+        sort=sort,
+        cursor=current_cursor("properties", (sort, page_size, filters)),
+        limit=page_size,
+        with_total=True,
+        **filters
     )
+    with st.expander("تصدير"):
+        export_button("تصدير العقارات المطابقة", "properties", st.session_state.admin_id, "export_properties", **filters)
+    with st.expander("خريطة العقارات"):
+        st.caption("تعرض الخريطة كل عقاراتك مجمعة حسب الموقع، دون تطبيق عوامل التصفية")
+        property_map(st.session_state.admin_id, "property_map", (latitude, longitude) if radius_km else None)
+    
+    properties = page.rows
     
     # Display properties
     if properties:
         st.header("قائمة العقارات")
-        properties_df = pd.DataFrame(properties, columns=[
-            'id', 'title', 'announcement_date', 'property_type', 'property_scale', 
-            'area', 'category', 'floors', 'bedrooms', 'bathrooms', 'living_rooms', 
-            'price', 'region', 'district', 'city', 'location_link', 'source_link', 
-            'location_details', 'description', 'status', 'admin_id'
-        ])
+        if view == "table":
+            property_table(properties)
+        else:
+            estimates = estimate_prices(st.session_state.admin_id, [property['id'] for property in properties])
+            # Display properties with edit/delete options
+            for property in properties:
+                title = _display_title(property)
+                with st.expander(title):
+                    col1, col2 = st.columns(2)
+                    
+                    with col1:
+                        st.write(f"**النوع:** {property['property_type']}")
+                        st.write(f"**المساحة:** {property['area']} م²")
+                        st.write(f"**المدينة:** {property['city']}")
+                        st.write(f"**الحي:** {property['district']}")
+                        st.write(f"**عدد الطوابق:** {property['floors']}")
+                        st.write(f"**غرف النوم:** {property['bedrooms']}")
+                        st.write(f"**الحمامات:** {property['bathrooms']}")
+                        st.write(f"**الصالات:** {property['living_rooms']}")
+                    
+                    with col2:
+                        st.write(f"**نطاق العقار:** {property['property_scale']}")
+                        st.write(f"**الفئة:** {property['category']}")
+                        st.write(f"**السعر:** {property['price']} ريال")
+                        _estimate_section(estimates.get(property['id']))
+                        st.write(f"**الحالة:** {property['status']}")
+                        if property['location_link']:
+                            st.write(f"**رابط الموقع:** [{property['location_link']}]({property['location_link']})")
+                        if property['source_link']:
+                            st.write(f"**رابط المصدر:** [{property['source_link']}]({property['source_link']})")
+                        if property['location_details']:
+                            st.write(f"**تفاصيل الموقع:** {property['location_details']}")
+                        if property['description']:
+                            st.write(f"**الوصف:** {property['description']}")
+                    
+                    _comps_section(st.session_state.admin_id, property)
+                    
+                    # Edit/Delete buttons
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        if st.button("تعديل", key=f"edit_{property['id']}"):
+                            st.session_state.edit_property_id = property['id']
+                            st.session_state.edit_property_data = property._asdict()
+                            st.rerun()
+                    
+                    with col2:
+                        if st.button("حذف", key=f"delete_{property['id']}"):
+                            confirm = st.checkbox(f"هل أنت متأكد من حذف {title}؟", key=f"confirm_delete_{property['id']}")
+                            if confirm:
+                                try:
+                                    delete_property(property['id'], st.session_state.admin_id)
+                                    st.success("تم حذف العقار بنجاح")
+                                    st.rerun()
+                                except Exception as e:
+                                    st.error(f"حدث خطأ أثناء حذف العقار: {str(e)}")
         
-        # Display properties with edit/delete options
-        for _, property in properties_df.iterrows():
-            title = property['title'] if property['title'] else f"{property['property_type']} في {property['region']} - {property['city']}, {property['district']}"
-            with st.expander(title):
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.write(f"**النوع:** {property['property_type']}")
-                    st.write(f"**المساحة:** {property['area']} م²")
-                    st.write(f"**المدينة:** {property['city']}")
-                    st.write(f"**الحي:** {property['district']}")
-                    st.write(f"**عدد الطوابق:** {property['floors']}")
-                    st.write(f"**غرف النوم:** {property['bedrooms']}")
-                    st.write(f"**الحمامات:** {property['bathrooms']}")
-                    st.write(f"**الصالات:** {property['living_rooms']}")
-                
-                with col2:
-                    st.write(f"**نطاق العقار:** {property['property_scale']}")
-                    st.write(f"**الفئة:** {property['category']}")
-                    st.write(f"**السعر:** {property['price']} ريال")
-                    st.write(f"**الحالة:** {property['status']}")
-                    if property['location_link']:
-                        st.write(f"**رابط الموقع:** [{property['location_link']}]({property['location_link']})")
-                    if property['source_link']:
-                        st.write(f"**رابط المصدر:** [{property['source_link']}]({property['source_link']})")
-                    if property['location_details']:
-                        st.write(f"**تفاصيل الموقع:** {property['location_details']}")
-                    if property['description']:
-                        st.write(f"**الوصف:** {property['description']}")
-                
-                # Edit/Delete buttons
-                col1, col2 = st.columns(2)
-                with col1:
-                    if st.button("تعديل", key=f"edit_{property['id']}"):
-                        st.session_state.edit_property_id = property['id']
-                        st.session_state.edit_property_data = property.to_dict()
-                        st.rerun()
-                
-                with col2:
-                    if st.button("حذف", key=f"delete_{property['id']}"):
-                        confirm = st.checkbox(f"هل أنت متأكد من حذف {title}؟", key=f"confirm_delete_{property['id']}")
-                        if confirm:
-                            try:
-                                delete_property(property['id'])
-                                st.success("تم حذف العقار بنجاح")
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"حدث خطأ أثناء حذف العقار: {str(e)}")
+        page_controls("properties", page, page_size)
     else:
         st.info("لا توجد عقارات مطابقة للبحث") 
\ No newline at end of file
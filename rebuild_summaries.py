@@ -0,0 +1,5 @@
+from database import rebuild_summaries
+
+if __name__ == "__main__":
+    rebuild_summaries()
+    print("Dashboard summaries have been rebuilt.")
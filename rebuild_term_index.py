@@ -0,0 +1,5 @@
+from database import rebuild_term_index
+
+if __name__ == "__main__":
+    rebuild_term_index()
+    print("Interest and amenity index has been rebuilt.")
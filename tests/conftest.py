@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import database_utils as du  # noqa: E402
+from utils.cache import read_cache  # noqa: E402
+
+@pytest.fixture
+def fresh_database(tmp_path, monkeypatch):
+    """A fresh database in tmp_path, with no cached reads or indexes of an earlier test"""
+    monkeypatch.setattr(read_cache, 'enabled', False)
+    monkeypatch.setattr(du, 'MODEL_DIR', str(tmp_path / 'models'))
+    monkeypatch.setattr(du, 'PRICE_MODEL_SAVE_DELAY', 0)
+    for registry in (du._property_indexes, du._comps_indexes, du._dedup_indexes, du._price_models):
+        registry.clear()
+    database.configure_pool(str(tmp_path / 'test.db'))
+    database.init_db()
+    yield database.get_pool().db_path
+    database.get_pool().close_all()
+
+@pytest.fixture
+def admin_id(fresh_database):
+    """An admin of a fresh database"""
+    du.register_admin('admin1', 'admin')
+    return 1
@@ -0,0 +1,19 @@
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+import check_query_plans
+from exporter import FORMATS
+from utils import exports
+
+@pytest.mark.parametrize('fmt', list(FORMATS))
+def test_download_button_accepts_export(admin_id, fmt, monkeypatch):
+    check_query_plans.seed(admin_id)
+    buttons = {}
+    monkeypatch.setattr(exports.st, 'selectbox', lambda label, options, key: fmt)
+    monkeypatch.setattr(exports.st, 'download_button', lambda label, data, **kwargs: buttons.setdefault(kwargs['key'], data))
+    exports.export_button("تصدير", 'properties', admin_id, 'export_properties')
+
+    data = buttons['export_properties_download']()
+    content, _ = convert_data_to_bytes_and_infer_mime(data, TypeError("unsupported type"))
+    assert len(content) > 1000
+    data.close()
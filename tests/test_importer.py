@@ -0,0 +1,41 @@
+import csv
+import io
+
+import database_utils as du
+from database import check_choices
+from generate_dummy_data import generate_real_estate_data
+from importer import import_properties, read_csv, validate_property
+
+def _csv(rows):
+    text = io.StringIO()
+    writer = csv.DictWriter(text, [column for column in du.PROPERTY_COLUMNS if column != 'admin_id'], extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(rows)
+    return io.BytesIO(text.getvalue().encode('utf-8'))
+
+def test_non_finite_numbers_are_rejected(admin_id):
+    valid = generate_real_estate_data(admin_id)
+    rows = [
+        dict(valid, price='nan'),
+        dict(valid, area='nan'),
+        dict(valid, floors='inf'),
+        dict(valid, bedrooms='1e400'),
+        dict(valid, bathrooms='1e300'),
+        valid,
+    ]
+    report = io.StringIO()
+    result = import_properties(read_csv(_csv(rows)), admin_id, report)
+
+    assert (result.imported, result.rejected) == (1, 5)
+    assert du.get_all_real_estates(admin_id)[0]['title'] == valid['title']
+    errors = report.getvalue()
+    for column in ('price', 'area', 'floors', 'bedrooms', 'bathrooms'):
+        assert f"{column}: رقم غير صالح" in errors
+
+def test_non_finite_cell_values_are_rejected(admin_id):
+    # XLSX cells arrive as numbers rather than text
+    choices = check_choices('RealEstate')
+    valid = generate_real_estate_data(admin_id)
+    for column, value in (('price', float('nan')), ('area', float('inf')), ('floors', float('inf')), ('living_rooms', 10**400)):
+        record, errors = validate_property(dict(valid, **{column: value}), admin_id, choices)
+        assert record is None and errors == [f"{column}: رقم غير صالح ({value})"]
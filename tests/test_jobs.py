@@ -0,0 +1,22 @@
+import time
+
+import jobs
+from database_utils import execute_query, execute_update
+
+def _job(admin_id, heartbeat_at):
+    return execute_update("INSERT INTO Job (admin_id, kind, status, heartbeat_at) VALUES (?, 'export', 'running', ?)",
+                          [admin_id, heartbeat_at])
+
+def _status(job_id):
+    return execute_query("SELECT status FROM Job WHERE id = ?", [job_id])[0].status
+
+def test_runner_only_fails_jobs_of_stopped_servers(admin_id):
+    live = _job(admin_id, time.time())
+    stopped = _job(admin_id, time.time() - jobs.JOB_HEARTBEAT_TIMEOUT - 1)
+    unstamped = _job(admin_id, None)
+
+    jobs.JobRunner(threads=1, processes=1)
+
+    assert _status(live) == 'running'
+    assert _status(stopped) == 'failed'
+    assert _status(unstamped) == 'failed'
@@ -0,0 +1,63 @@
+import random
+from collections import namedtuple
+
+import numpy as np
+import pytest
+
+import matching
+from matching import MatchingIndex
+
+Buyer = namedtuple('Buyer', 'id budget interests preferred_region preferred_city preferred_district')
+Property = namedtuple('Property', 'id title description price region city district')
+
+TERMS = ['مسبح', 'حديقة', 'موقف سيارات', 'مدفأة', 'مصعد', 'شرفة', 'ملحق']
+CITIES = {'الرياض': ['الرياض', 'الخرج'], 'مكة المكرمة': ['جدة', 'الطائف']}
+DISTRICTS = ['النرجس', 'الملقا', 'الروضة']
+
+def _index(seed, buyers, properties):
+    """A small index with repeated prices, budgets and features, so that ties are common"""
+    rng = random.Random(seed)
+
+    def place():
+        region = rng.choice(list(CITIES))
+        city = rng.choice(CITIES[region])
+        return region, city, rng.choice(DISTRICTS)
+
+    buyer_rows = []
+    for i in range(buyers):
+        region, city, district = place()
+        buyer_rows.append(Buyer(
+            i + 1, rng.choice([rng.uniform(1e5, 5e6), 1e6, 0, None]), '، '.join(rng.sample(TERMS, rng.randint(0, 4))),
+            rng.choice([region, None]), rng.choice([city, None]), rng.choice([district, None, 'غير محدد'])))
+    property_rows = []
+    for i in range(properties):
+        region, city, district = place()
+        property_rows.append(Property(
+            1000 + i, 'عقار', 'يحتوي على ' + ' و'.join(rng.sample(TERMS, rng.randint(0, 4))),
+            rng.choice([rng.uniform(5e4, 6e6), 1e6, 0]), region, city, district))
+    return MatchingIndex(buyer_rows, property_rows)
+
+def _brute_force(scores, ids, k):
+    """Best k ids and scores of each row of a full score matrix, ties to the lower column"""
+    best = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    return ids[best], np.take_along_axis(scores, best, axis=1)
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('buyers, properties, k', [(1, 1, 10), (5, 7, 3), (60, 400, 10), (400, 60, 10), (3, 100, 10)])
+def test_top_k_matches_scoring_every_pair(seed, buyers, properties, k, monkeypatch):
+    # Small blocks, so that the search goes through several of them
+    monkeypatch.setattr(matching, 'MAX_BLOCK_CELLS', 500)
+    index = _index(seed, buyers, properties)
+    scores = index.score(np.arange(buyers)[:, None], np.arange(properties))
+
+    found = index.top_properties(k)
+    ids, best = _brute_force(scores, index.property_ids, k)
+    np.testing.assert_array_equal(found.matched[:, :ids.shape[1]], ids)
+    np.testing.assert_array_equal(found.scores[:, :ids.shape[1]], best)
+    assert (found.matched[:, ids.shape[1]:] == -1).all() and np.isnan(found.scores[:, ids.shape[1]:]).all()
+
+    found = index.top_buyers(k)
+    ids, best = _brute_force(scores.T, index.buyer_ids, k)
+    np.testing.assert_array_equal(found.matched[:, :ids.shape[1]], ids)
+    np.testing.assert_array_equal(found.scores[:, :ids.shape[1]], best)
+    assert (found.matched[:, ids.shape[1]:] == -1).all() and np.isnan(found.scores[:, ids.shape[1]:]).all()
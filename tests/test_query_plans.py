@@ -0,0 +1,22 @@
+import pytest
+
+import check_query_plans
+import database
+
+def test_queries_use_an_index(fresh_database):
+    check_query_plans.seed_admins()
+    failures = check_query_plans.check_query_plans()
+    assert not failures, '\n'.join(f"{name}: {'; '.join(scans)}\n    {' '.join(statement.split())}"
+                                   for name, statement, scans in failures)
+
+@pytest.mark.parametrize('statement, scans', [
+    ("SELECT rowid FROM RealEstateFTS WHERE RealEstateFTS MATCH 'فيلا'", False),
+    ("SELECT rowid FROM RealEstateFTS", True),
+    ("SELECT id FROM RealEstateGeo WHERE min_lat >= 24 AND max_lat <= 25 AND min_lon >= 46 AND max_lon <= 47", False),
+    ("SELECT id FROM RealEstateGeo WHERE id = 7", False),
+    ("SELECT id FROM RealEstateGeo", True),
+    ("SELECT id FROM RealEstate WHERE description LIKE '%فيلا%'", True),
+])
+def test_full_scans_of_virtual_tables_are_reported(fresh_database, statement, scans):
+    with database.db_connection() as conn:
+        assert bool(check_query_plans.full_scans(conn, statement)) == scans
@@ -0,0 +1,52 @@
+import re
+
+# Letter variants folded to one form so that common spelling differences
+# (أحمد/احمد, مدرسة/مدرسه, مبنى/مبني) still match each other.
+LETTER_MAP = {
+    'أ': 'ا',
+    'إ': 'ا',
+    'آ': 'ا',
+    'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي',
+}
+
+# Tashkeel (harakat, tanween, shadda, sukun), superscript alef and tatweel
+DIACRITICS = [chr(c) for c in range(0x064B, 0x0653)] + ['ٰ', 'ـ']
+
+_DIACRITICS_RE = re.compile('[' + ''.join(DIACRITICS) + ']')
+_TOKEN_RE = re.compile(r'\w+')
+_TERM_SEPARATOR_RE = re.compile('[,،]')
+
+def normalize_arabic(text):
+    """Fold Arabic letter variants and strip tashkeel from text"""
+    if not text:
+        return ''
+    # str.replace and re.sub run in C; str.translate with a dict table does
+    # a Python-level lookup per character and is several times slower
+    text = _DIACRITICS_RE.sub('', text)
+    for source, target in LETTER_MAP.items():
+        if source in text:
+            text = text.replace(source, target)
+    return text.lower()
+
+def sql_normalize_arabic(expr):
+    """Build an SQL expression applying normalize_arabic() to expr.
+
+    Uses nested replace() calls only, so triggers built from it work on any
+    connection without registering a Python function.
+    """
+    sql = f"lower(coalesce({expr}, ''))"
+    for source, target in LETTER_MAP.items():
+        sql = f"replace({sql}, '{source}', '{target}')"
+    for mark in DIACRITICS:
+        sql = f"replace({sql}, '{mark}', '')"
+    return sql
+
+def tokenize(text):
+    """Split normalized text into word tokens"""
+    return _TOKEN_RE.findall(normalize_arabic(text))
+
+def split_terms(text):
+    """Normalized, non-empty items of a "," or "،"-separated list"""
+    return [term for term in (part.strip() for part in _TERM_SEPARATOR_RE.split(normalize_arabic(text))) if term]
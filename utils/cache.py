@@ -0,0 +1,131 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+CACHE_ENABLED = os.environ.get('AQARDASH_CACHE', '1') != '0'
+CACHE_MAX_BYTES = int(float(os.environ.get('AQARDASH_CACHE_MB', '64')) * 1024 * 1024)
+# Bounds how long writes made outside this process (scripts, other
+# servers) can go unnoticed, since those do not bump the versions below
+CACHE_TTL = float(os.environ.get('AQARDASH_CACHE_TTL', '60'))
+
+def estimate_size(value):
+    """Rough deep size in bytes of a query result"""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size += sum(estimate_size(item) for item in value)
+    elif isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    return size
+
+def _copy(value):
+    # Entries are shared between sessions; hand out fresh outer lists so a
+    # caller appending or sorting in place cannot corrupt the cached copy
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, tuple) and hasattr(value, '_replace') and isinstance(getattr(value, 'rows', None), list):
+        return value._replace(rows=list(value.rows))
+    return value
+
+class VersionedCache:
+    """Process-wide LRU cache of read results invalidated by table versions.
+
+    Every write bumps a counter per (admin_id, table); readers put the
+    current counters of the tables they depend on into their cache key, so
+    a write makes older entries unreachable and LRU eviction drops them.
+    Counters under admin_id None change on every write to a table and
+    serve reads that are not scoped to one admin.
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL, enabled=CACHE_ENABLED):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, size, stored_at)
+        self._bytes = 0
+        self._versions = defaultdict(int)
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def versions(self, admin_id, tables):
+        with self._lock:
+            return tuple(self._versions[(admin_id, table)] for table in tables)
+
+    def bump(self, admin_id, *tables):
+        """Record a committed write to tables for admin_id"""
+        with self._lock:
+            for table in tables:
+                self._versions[(admin_id, table)] += 1
+                if admin_id is not None:
+                    self._versions[(None, table)] += 1
+
+    def _lookup(self, key):
+        # Must be called with the lock held
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if time.time() - entry[2] > self.ttl:
+            self._evict(key)
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry[0]
+
+    def _evict(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _store(self, key, value):
+        size = estimate_size(value)
+        if size > self.max_bytes // 4:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = (value, size, time.time())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+
+    def get_or_load(self, admin_id, tables, key, loader):
+        """Return the cached result for key, calling loader() on a miss.
+
+        Concurrent misses on the same key wait for the first loader instead
+        of all querying the database.
+        """
+        if not self.enabled:
+            return loader()
+        key = (admin_id, key, self.versions(admin_id, tables))
+        while True:
+            with self._lock:
+                found, value = self._lookup(key)
+                if found:
+                    self.hits += 1
+                    return _copy(value)
+                event = self._loading.get(key)
+                if event is None:
+                    event = self._loading[key] = threading.Event()
+                    self.misses += 1
+                    break
+            event.wait()
+        try:
+            value = loader()
+            self._store(key, value)
+            return _copy(value)
+        finally:
+            with self._lock:
+                del self._loading[key]
+            event.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+read_cache = VersionedCache()
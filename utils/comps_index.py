@@ -0,0 +1,154 @@
+import threading
+import time
+import numpy as np
+from utils.arabic import normalize_arabic
+
+# Numeric features, compared in standard deviations of the whole portfolio:
+# name -> weight of its squared difference. Area and price per m² are
+# compared as logarithms, so 10% apart means the same at any size.
+FEATURE_WEIGHTS = {
+    'area': 1.0,
+    'bedrooms': 0.5,
+    'bathrooms': 0.5,
+    'price_per_m2': 1.0,
+}
+# Added to the squared distance when a categorical feature differs
+TYPE_PENALTY = 4.0
+SCALE_PENALTY = 2.0
+DISTRICT_PENALTY = 1.0
+# Squared difference, before weighting, counted for a feature the candidate
+# lacks but the property has
+MISSING_PENALTY = 1.0
+
+_WEIGHTS = np.sqrt(np.array(list(FEATURE_WEIGHTS.values())))
+_PENALTIES = np.array([TYPE_PENALTY, SCALE_PENALTY, DISTRICT_PENALTY])
+
+def _positive_log(values):
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(values.shape, np.nan)
+    np.log(values, out=result, where=values > 0)
+    return result
+
+def _as_float(value):
+    return np.nan if value is None else value
+
+class CompsIndex:
+    """In-memory comparable-properties index over one admin's properties.
+
+    Keeps a numeric snapshot of each property (log area, bedrooms,
+    bathrooms, log price per m², and codes for its type, scale and
+    district) in NumPy arrays, and finds the k most similar properties with
+    one vectorized pass over them. Rows are (id, area, bedrooms, bathrooms,
+    price, property_type, property_scale, city, district) tuples; upsert()
+    and remove() keep the index current without a rebuild. Feature scales
+    are fixed when the index is built.
+    """
+
+    def __init__(self, rows=()):
+        self.built_at = time.time()
+        self._rows = {}  # id -> row number in the arrays
+        self._size = 0
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._features = np.zeros((0, len(FEATURE_WEIGHTS)))
+        self._codes = np.zeros((0, 3), dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._categories = ({}, {}, {})  # type, scale, (city, district) -> code
+        self._names = {}  # city and district names repeat, normalize each once
+        self._lock = threading.Lock()
+        self._scales = np.ones(len(FEATURE_WEIGHTS))
+        self.upsert(rows)
+        if self._size:
+            spread = np.nanstd(self._features[:self._size], axis=0)
+            self._scales = np.where(spread > 0, spread, 1.0)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _code(self, level, key):
+        return self._categories[level].setdefault(key, len(self._categories[level]))
+
+    def _name(self, name):
+        if name not in self._names:
+            self._names[name] = normalize_arabic(name)
+        return self._names[name]
+
+    def _grow(self, size):
+        capacity = len(self._ids)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 1024)
+        extra = capacity - len(self._ids)
+        self._ids = np.concatenate([self._ids, np.zeros(extra, dtype=np.int64)])
+        self._features = np.concatenate([self._features, np.full((extra, self._features.shape[1]), np.nan)])
+        self._codes = np.concatenate([self._codes, np.zeros((extra, 3), dtype=np.int32)])
+        self._alive = np.concatenate([self._alive, np.zeros(extra, dtype=bool)])
+
+    def upsert(self, rows):
+        """Add new properties or replace changed ones"""
+        rows = list(rows)
+        if not rows:
+            return
+        ids, areas, bedrooms, bathrooms, prices, types, scales, cities, districts = zip(*rows)
+        areas = np.array([_as_float(area) for area in areas], dtype=np.float64)
+        prices = np.array([_as_float(price) for price in prices], dtype=np.float64)
+        price_per_m2 = np.divide(prices, areas, out=np.full(len(rows), np.nan), where=areas > 0)
+        features = np.column_stack([
+            _positive_log(areas),
+            np.array([_as_float(count) for count in bedrooms], dtype=np.float64),
+            np.array([_as_float(count) for count in bathrooms], dtype=np.float64),
+            _positive_log(price_per_m2),
+        ])
+        with self._lock:
+            codes = np.array([
+                (self._code(0, property_type), self._code(1, scale),
+                 self._code(2, (self._name(city), self._name(district))))
+                for property_type, scale, city, district in zip(types, scales, cities, districts)
+            ], dtype=np.int32)
+            positions = np.empty(len(rows), dtype=np.int64)
+            for i, property_id in enumerate(ids):
+                position = self._rows.get(property_id)
+                if position is None:
+                    position = self._rows[property_id] = self._size
+                    self._size += 1
+                positions[i] = position
+            self._grow(self._size)
+            self._ids[positions] = ids
+            self._features[positions] = features
+            self._codes[positions] = codes
+            self._alive[positions] = True
+
+    def remove(self, property_ids):
+        with self._lock:
+            for property_id in property_ids:
+                position = self._rows.pop(property_id, None)
+                if position is not None:
+                    self._alive[position] = False
+
+    def _distances(self, property_id):
+        """Distance of every row to a property, inf for removed rows and itself"""
+        position = self._rows[property_id]
+        size = self._size
+        features = self._features[:size]
+        query = features[position]
+        # Features the property lacks are left out; those a candidate lacks cost MISSING_PENALTY
+        known = ~np.isnan(query)
+        squared = np.square((features[:, known] - query[known]) / self._scales[known] * _WEIGHTS[known])
+        squared = np.where(np.isnan(squared), MISSING_PENALTY * _WEIGHTS[known] ** 2, squared)
+        distance = squared.sum(axis=1)
+        distance += (self._codes[:size] != self._codes[position]) @ _PENALTIES
+        distance[~self._alive[:size]] = np.inf
+        distance[position] = np.inf
+        return np.sqrt(distance)
+
+    def nearest(self, property_id, k=5):
+        """(id, distance) of the k properties most similar to property_id, closest first"""
+        with self._lock:
+            if property_id not in self._rows:
+                return []
+            distance = self._distances(property_id)
+            k = min(k, len(self._rows) - 1)
+            if k <= 0:
+                return []
+            best = np.argpartition(distance, k - 1)[:k]
+            best = best[np.argsort(distance[best], kind='stable')]
+            return [(int(self._ids[i]), float(distance[i])) for i in best]
@@ -0,0 +1,436 @@
+import hashlib
+import itertools
+import re
+import threading
+import time
+import zlib
+from typing import List, NamedTuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import numpy as np
+from utils.arabic import tokenize
+
+# MinHash signatures of the word bigrams of a listing's title and
+# description, cut into BANDS bands of BAND_ROWS hashes. Two texts with
+# Jaccard similarity s share a band with probability 1 - (1 - s**6)**12:
+# about 97% at 0.8, but 5% at 0.4, the usual similarity of two different
+# listings written from the same template.
+BANDS = 12
+BAND_ROWS = 6
+NUM_HASHES = BANDS * BAND_ROWS
+# Estimated Jaccard similarity from which two texts are near-duplicates
+TEXT_SIMILARITY = 0.8
+# Near-duplicate texts must also have areas and prices this close (relative), when both are known
+AREA_TOLERANCE = 0.05
+PRICE_TOLERANCE = 0.1
+# Texts with fewer bigrams are too short to tell listings apart
+MIN_SHINGLES = 8
+# Keys of rows added since the last sort are kept sorted apart; past this
+# many they are merged into the sorted keys
+MAX_UNSORTED = 4096
+# Bigrams hashed at once while computing signatures, and candidate pairs
+# compared at once while clustering
+SIGNATURE_CHUNK = 1 << 16
+CONFIRM_CHUNK = 1 << 20
+# Rows whose text is tokenized at once
+KEY_CHUNK = 10000
+
+# Match reasons, strongest first
+SOURCE_LINK = 'source_link'
+DETAILS = 'details'
+TEXT = 'text'
+REASONS = (SOURCE_LINK, DETAILS, TEXT)
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid', 'ref')
+
+_rng = np.random.default_rng(1234)
+# Hash functions a * x + b (mod 2**32) with odd a, each a permutation of the 32-bit bigram hashes
+_MULTIPLIERS = (_rng.integers(0, 2**31, NUM_HASHES, dtype=np.uint32) * np.uint32(2) + np.uint32(1))[:, None]
+_OFFSETS = _rng.integers(0, 2**32, NUM_HASHES, dtype=np.uint32)[:, None]
+_BAND_WEIGHTS = _rng.integers(1, 2**63, BAND_ROWS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_GOLDEN = np.uint32(0x9E3779B9)
+_DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩', '0123456789')
+_DIGITS_RE = re.compile('[٠-٩]')
+
+class Match(NamedTuple):
+    id: int
+    reason: str        # SOURCE_LINK, DETAILS or TEXT
+    similarity: float  # estimated Jaccard similarity of the texts
+
+def link_key(link):
+    """source_link reduced to what identifies a listing, or None for a bare site address"""
+    if not link or not str(link).strip():
+        return None
+    parts = urlsplit(str(link).strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    path = parts.path.rstrip('/')
+    query = parts.query and urlencode(sorted(
+        (name, value) for name, value in parse_qsl(parts.query)
+        if not name.lower().startswith(TRACKING_PARAMS)
+    ))
+    if not path and not query:
+        return None
+    return f"{host}{path}?{query}" if query else f"{host}{path}"
+
+def _close(a, b, tolerance):
+    """Whether values are within a relative tolerance of each other; NaN passes"""
+    return ~(np.abs(a - b) > tolerance * np.maximum(a, b))
+
+def _key_hash(key):
+    """Nonzero 64-bit hash of a key, 0 for None"""
+    if key is None:
+        return 0
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+
+class DedupIndex:
+    """In-memory near-duplicate index over one admin's properties.
+
+    A property is a duplicate of another when they share a source_link
+    (see link_key()), the same city, district, area and price, or nearly
+    the same title and description text. Texts are compared through MinHash
+    signatures; candidates come from LSH buckets kept as sorted arrays, so a
+    lookup costs a few binary searches whatever the size of the index. Rows
+    are (id, title, description, source_link, city, district, area, price)
+    tuples; upsert() and remove() keep the index current without a rebuild.
+    """
+
+    def __init__(self, rows=()):
+        self.built_at = time.time()
+        self._rows = {}  # id -> row number in the arrays
+        self._size = 0
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._signatures = np.zeros((0, NUM_HASHES), dtype=np.uint16)
+        self._keys = np.zeros((0, BANDS + 2), dtype=np.uint64)  # band keys, then link and details keys
+        self._areas = np.zeros(0)
+        self._prices = np.zeros(0)
+        self._alive = np.zeros(0, dtype=bool)
+        self._tokens = {}  # token -> hash, tokens repeat across listings
+        self._names = {}  # city and district names repeat, normalize each once
+        self._lock = threading.Lock()
+        # Per key column, (sorted keys, their row numbers) of rows below _sorted_size
+        self._sorted = []
+        self._sorted_size = 0
+        # The same for the rows added since, or None until the next lookup sorts them
+        self._tail = None
+        self.upsert(rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _token_hash(self, token):
+        value = self._tokens.get(token)
+        if value is None:
+            value = self._tokens[token] = zlib.crc32(token.encode())
+        return value
+
+    def _name(self, name):
+        if name not in self._names:
+            self._names[name] = ' '.join(tokenize(name))
+        return self._names[name]
+
+    def _details_key(self, city, district, area, price):
+        """(city, district, area, price) as one string, or None if a part is missing"""
+        if not city or not district or area is None or price is None:
+            return None
+        return f"{self._name(city)}|{self._name(district)}|{float(area):.2f}|{float(price):.2f}"
+
+    def _signatures_of(self, texts):
+        """(MinHash signatures, whether each text is long enough to compare) of texts"""
+        signatures = np.zeros((len(texts), NUM_HASHES), dtype=np.uint16)
+        hashes, counts = [], np.zeros(len(texts), dtype=np.int64)
+        known = self._tokens.get
+        for i, text in enumerate(texts):
+            if _DIGITS_RE.search(text):
+                text = text.translate(_DIGITS)
+            tokens = tokenize(text)
+            if len(tokens) > MIN_SHINGLES:
+                token_hashes = list(map(known, tokens))
+                if None in token_hashes:
+                    token_hashes = [self._token_hash(token) for token in tokens]
+                hashes.append(token_hashes)
+                counts[i] = len(tokens) - 1
+        comparable = counts > 0
+        if not hashes:
+            return signatures, comparable
+
+        # Bigram hashes of all texts, skipping pairs that span two texts
+        flat = np.fromiter(itertools.chain.from_iterable(hashes), dtype=np.uint32, count=int(counts.sum()) + len(hashes))
+        lengths = counts[comparable] + 1
+        ends = np.cumsum(lengths)
+        pairs = np.ones(len(flat) - 1, dtype=bool)
+        pairs[ends[:-1] - 1] = False
+        shingles = flat[:-1][pairs] * _GOLDEN + flat[1:][pairs]
+        # Murmur3 finalizer, so that the permutations below see well-mixed input
+        shingles ^= shingles >> np.uint32(16)
+        shingles *= np.uint32(0x85EBCA6B)
+        shingles ^= shingles >> np.uint32(13)
+        shingles *= np.uint32(0xC2B2AE35)
+        shingles ^= shingles >> np.uint32(16)
+
+        # Min over each text of every hash function, a few thousand texts at a time
+        rows = np.flatnonzero(comparable)
+        starts = np.concatenate([[0], np.cumsum(counts[rows])])
+        buffer = np.empty((NUM_HASHES, max(SIGNATURE_CHUNK, int(counts.max()))), dtype=np.uint32)
+        first = 0
+        while first < len(rows):
+            last = max(int(np.searchsorted(starts, starts[first] + SIGNATURE_CHUNK, 'right')) - 1, first + 1)
+            block = shingles[starts[first]:starts[last]]
+            hashed = buffer[:, :len(block)]
+            np.multiply(_MULTIPLIERS, block, out=hashed)
+            hashed += _OFFSETS
+            minimums = np.minimum.reduceat(hashed, starts[first:last] - starts[first], axis=1).T
+            # 16-bit fingerprints of the minimums: two different minimums agree 1 time in 65536
+            signatures[rows[first:last]] = (minimums * _GOLDEN) >> np.uint32(16)
+            first = last
+        return signatures, comparable
+
+    def _keys_of(self, rows):
+        """Signatures, key matrix, areas and prices of rows, computed a block at a time to bound memory"""
+        blocks = [self._block_keys(rows[start:start + KEY_CHUNK]) for start in range(0, len(rows), KEY_CHUNK)]
+        return tuple(np.concatenate(parts) for parts in zip(*blocks))
+
+    def _block_keys(self, rows):
+        ids, titles, descriptions, links, cities, districts, areas, prices = zip(*rows)
+        signatures, comparable = self._signatures_of([f"{title or ''} {description or ''}" for title, description in zip(titles, descriptions)])
+        keys = np.zeros((len(rows), BANDS + 2), dtype=np.uint64)
+        bands = signatures.reshape(len(rows), BANDS, BAND_ROWS).astype(np.uint64) @ _BAND_WEIGHTS
+        keys[:, :BANDS] = np.where(comparable[:, None], bands | np.uint64(1), 0)
+        keys[:, BANDS] = np.fromiter((_key_hash(link_key(link)) for link in links), dtype=np.uint64, count=len(rows))
+        keys[:, BANDS + 1] = np.fromiter((
+            _key_hash(self._details_key(city, district, area, price))
+            for city, district, area, price in zip(cities, districts, areas, prices)
+        ), dtype=np.uint64, count=len(rows))
+        areas = np.array([np.nan if area is None else area for area in areas], dtype=np.float64)
+        prices = np.array([np.nan if price is None else price for price in prices], dtype=np.float64)
+        return signatures, keys, areas, prices
+
+    def _grow(self, size):
+        capacity = len(self._ids)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 1024)
+        extra = capacity - len(self._ids)
+        self._ids = np.concatenate([self._ids, np.zeros(extra, dtype=np.int64)])
+        self._signatures = np.concatenate([self._signatures, np.zeros((extra, NUM_HASHES), dtype=np.uint16)])
+        self._keys = np.concatenate([self._keys, np.zeros((extra, BANDS + 2), dtype=np.uint64)])
+        self._areas = np.concatenate([self._areas, np.full(extra, np.nan)])
+        self._prices = np.concatenate([self._prices, np.full(extra, np.nan)])
+        self._alive = np.concatenate([self._alive, np.zeros(extra, dtype=bool)])
+
+    def _sort(self):
+        """Sort the keys of every row, first dropping removed rows if they are many"""
+        if self._size - len(self._rows) > self._size // 4:
+            keep = np.flatnonzero(self._alive[:self._size])
+            for name in ('_ids', '_signatures', '_keys', '_areas', '_prices', '_alive'):
+                setattr(self, name, getattr(self, name)[keep])
+            self._size = len(keep)
+            self._rows = dict(zip(self._ids.tolist(), range(self._size)))
+        self._sorted = []
+        for column in range(BANDS + 2):
+            keys = self._keys[:self._size, column]
+            order = np.argsort(keys, kind='stable').astype(np.int32)
+            self._sorted.append((keys[order], order))
+        self._sorted_size = self._size
+        self._tail = None
+
+    def _merge(self):
+        """Merge the keys of the rows added since the last sort into the sorted keys"""
+        if not self._sorted_size or self._size - len(self._rows) > self._size // 4:
+            self._sort()
+            return
+        merged = []
+        for (keys, positions), (added_keys, added_positions) in zip(self._sorted, self._sorted_tail()):
+            # Added rows come after every sorted one, so inserting them after equal keys keeps the order
+            at = np.searchsorted(keys, added_keys, 'right')
+            merged.append((np.insert(keys, at, added_keys), np.insert(positions, at, added_positions.astype(np.int32))))
+        self._sorted = merged
+        self._sorted_size = self._size
+        self._tail = None
+
+    def _sorted_tail(self):
+        """Per key column, (sorted keys, their row numbers) of the rows added since the last sort"""
+        if self._tail is None:
+            unsorted = np.arange(self._sorted_size, self._size)
+            self._tail = []
+            for column in range(BANDS + 2):
+                order = np.argsort(self._keys[unsorted, column], kind='stable')
+                self._tail.append((self._keys[unsorted[order], column], unsorted[order]))
+        return self._tail
+
+    def upsert(self, rows):
+        """Add new properties or replace changed ones"""
+        rows = list(rows)
+        if not rows:
+            return
+        signatures, keys, areas, prices = self._keys_of(rows)
+        with self._lock:
+            # Changed rows are appended again so that their new keys get looked up
+            for row in rows:
+                position = self._rows.pop(row[0], None)
+                if position is not None:
+                    self._alive[position] = False
+            positions = np.arange(self._size, self._size + len(rows))
+            self._size += len(rows)
+            self._grow(self._size)
+            self._ids[positions] = [row[0] for row in rows]
+            self._signatures[positions] = signatures
+            self._keys[positions] = keys
+            self._areas[positions] = areas
+            self._prices[positions] = prices
+            self._alive[positions] = True
+            self._rows.update(zip(self._ids[positions].tolist(), positions.tolist()))
+            self._tail = None
+            if self._size - self._sorted_size > MAX_UNSORTED:
+                self._merge()
+
+    def remove(self, property_ids):
+        with self._lock:
+            for property_id in property_ids:
+                position = self._rows.pop(property_id, None)
+                if position is not None:
+                    self._alive[position] = False
+
+    def _candidates(self, keys):
+        """(query row, index row, key column) of every index row sharing a key with a query row"""
+        found = []
+        tail = self._sorted_tail() if self._size > self._sorted_size else None
+        for column in range(BANDS + 2):
+            sources = [self._sorted[column]] if self._sorted_size else []
+            if tail:
+                sources.append(tail[column])
+            for sorted_keys, positions in sources:
+                low = np.searchsorted(sorted_keys, keys[:, column], 'left')
+                high = np.searchsorted(sorted_keys, keys[:, column], 'right')
+                counts = np.where(keys[:, column] > 0, high - low, 0)
+                total = int(counts.sum())
+                if not total:
+                    continue
+                queries = np.repeat(np.arange(len(keys)), counts)
+                offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(low, counts)
+                found.append((queries, positions[offsets].astype(np.int64), np.full(total, column)))
+        if not found:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return tuple(np.concatenate(parts) for parts in zip(*found))
+
+    def _confirm(self, signatures, areas, prices, queries, positions, columns, query_ids):
+        """Candidate pairs that are duplicates, as (query row, index row, reason code, similarity)"""
+        reasons = np.where(columns < BANDS, 2, columns - BANDS)  # 0 link, 1 details, 2 text
+        close = (_close(areas[queries], self._areas[positions], AREA_TOLERANCE)
+                 & _close(prices[queries], self._prices[positions], PRICE_TOLERANCE))
+        keep = self._alive[positions] & (self._ids[positions] != query_ids[queries]) & ((reasons < 2) | close)
+        queries, positions, reasons = queries[keep], positions[keep], reasons[keep]
+        # Strongest reason of each pair: link, then details, then text
+        pairs = queries * max(self._size, 1) + positions
+        order = np.lexsort((reasons, pairs))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pairs[order][1:] != pairs[order][:-1]
+        order = order[first]
+        queries, positions, reasons = queries[order], positions[order], reasons[order]
+
+        similarity = (self._signatures[positions] == signatures[queries]).mean(axis=1)
+        keep = (reasons < 2) | (similarity >= TEXT_SIMILARITY)
+        return queries[keep], positions[keep], reasons[keep], similarity[keep]
+
+    def match(self, rows) -> List[List[Match]]:
+        """Duplicates of each row in the index, strongest reason then most similar first.
+
+        Rows need not be in the index; a row never matches the property with its own id.
+        """
+        rows = list(rows)
+        if not rows:
+            return []
+        signatures, keys, areas, prices = self._keys_of(rows)
+        query_ids = np.array([-1 if row[0] is None else row[0] for row in rows], dtype=np.int64)
+        with self._lock:
+            found = self._candidates(keys)
+            queries, positions, reasons, similarity = self._confirm(signatures, areas, prices, *found, query_ids)
+            ids = self._ids[positions]
+        matches = [[] for _ in rows]
+        for i in np.lexsort((-similarity, reasons, queries)).tolist():
+            matches[queries[i]].append(Match(int(ids[i]), REASONS[reasons[i]], float(similarity[i])))
+        return matches
+
+    def clusters(self) -> List[List[Match]]:
+        """Groups of duplicate properties, largest first.
+
+        Each group lists its properties with the strongest reason that links
+        them to another member and their highest text similarity to one.
+        """
+        with self._lock:
+            size = self._size
+            alive = np.flatnonzero(self._alive[:size])
+            edges = []  # (row, row, reason code, similarity)
+            for column in (BANDS, BANDS + 1):
+                # Exact keys: chaining neighbours is enough to join the whole bucket
+                keys = self._keys[alive, column]
+                order = np.argsort(keys, kind='stable')
+                rows, keys = alive[order], keys[order]
+                same = (keys[1:] == keys[:-1]) & (keys[1:] > 0)
+                a, b = rows[:-1][same], rows[1:][same]
+                similarity = (self._signatures[a] == self._signatures[b]).mean(axis=1)
+                edges.append((a, b, np.full(len(a), column - BANDS), similarity))
+
+            # Text buckets: every pair must be confirmed. Sorted by area within a
+            # bucket, a row only needs the next ones until they are too large; of
+            # those, only the ones with a close price are paired
+            pairs = []
+            for column in range(BANDS):
+                order = np.lexsort((self._areas[alive], self._keys[alive, column]))
+                rows = alive[order]
+                keys, areas, prices = self._keys[rows, column], self._areas[rows], self._prices[rows]
+                same = (keys[1:] == keys[:-1]) & (keys[1:] > 0)
+                ends = np.append(np.flatnonzero(~same), len(keys) - 1)
+                bucket_end = np.repeat(ends, np.diff(ends, prepend=-1))
+                starts = np.flatnonzero(bucket_end > np.arange(len(keys)))
+                offset = 1
+                while len(starts):
+                    near = ~(areas[starts + offset] - areas[starts] > AREA_TOLERANCE * areas[starts + offset])
+                    starts = starts[near]
+                    priced = starts[_close(prices[starts], prices[starts + offset], PRICE_TOLERANCE)]
+                    pairs.append(rows[priced] * size + rows[priced + offset])
+                    offset += 1
+                    starts = starts[bucket_end[starts] >= starts + offset]
+            # A pair usually shares several bands, confirm it once
+            pairs = np.concatenate(pairs) if pairs else np.zeros(0, dtype=np.int64)
+            pairs.sort()
+            pairs = pairs[np.append(True, pairs[1:] != pairs[:-1])] if len(pairs) else pairs
+            for chunk in range(0, len(pairs), CONFIRM_CHUNK):
+                a, b = np.divmod(pairs[chunk:chunk + CONFIRM_CHUNK], size)
+                similarity = (self._signatures[a] == self._signatures[b]).mean(axis=1)
+                keep = similarity >= TEXT_SIMILARITY
+                edges.append((a[keep], b[keep], np.full(int(keep.sum()), 2), similarity[keep]))
+            ids = self._ids[:size].copy()
+
+        if not edges:
+            return []
+        a, b, reasons, similarity = (np.concatenate(parts) for parts in zip(*edges))
+        # Connected components by repeated min-label propagation with pointer jumping
+        labels = np.arange(size)
+        while True:
+            low = np.minimum(labels[a], labels[b])
+            previous = labels.copy()
+            np.minimum.at(labels, a, low)
+            np.minimum.at(labels, b, low)
+            labels = labels[labels]
+            if np.array_equal(labels, previous):
+                break
+
+        members = np.concatenate([a, b])
+        member_reasons = np.concatenate([reasons, reasons])
+        member_similarity = np.concatenate([similarity, similarity])
+        order = np.lexsort((-member_similarity, member_reasons, members))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = members[order][1:] != members[order][:-1]
+        best = order[first]
+        best_reason = dict(zip(members[best].tolist(), member_reasons[best].tolist()))
+        best_similarity = {}
+        for member, value in zip(members.tolist(), member_similarity.tolist()):
+            best_similarity[member] = max(value, best_similarity.get(member, 0.0))
+
+        groups = {}
+        for member in sorted(best_reason):
+            groups.setdefault(int(labels[member]), []).append(
+                Match(int(ids[member]), REASONS[best_reason[member]], best_similarity[member]))
+        return sorted(groups.values(), key=lambda group: (-len(group), group[0].id))
@@ -0,0 +1,44 @@
+import os
+import tempfile
+import streamlit as st
+from exporter import FORMATS, export
+
+def export_file(dataset, admin_id, fmt, **filters):
+    """Run an export into a temporary file and return it open for reading.
+
+    st.download_button accepts a BufferedReader but not the BufferedRandom of
+    tempfile.TemporaryFile(), so the file is written first and then reopened
+    read-only. Its name is removed at once; the open file stays readable.
+    """
+    with tempfile.NamedTemporaryFile(suffix=f".{FORMATS[fmt][1]}", delete=False) as file:
+        path = file.name
+        try:
+            export(dataset, admin_id, fmt, file, **filters)
+        except BaseException:
+            file.close()
+            os.unlink(path)
+            raise
+    reader = open(path, 'rb')
+    try:
+        os.unlink(path)
+    except OSError:
+        # Windows cannot remove an open file; the temporary directory is cleaned up eventually
+        pass
+    return reader
+
+def export_button(label, dataset, admin_id, key, **filters):
+    """Format selector and download button for one export dataset.
+
+    The export only runs when the button is clicked; it is streamed chunk by
+    chunk into a temporary file that is then handed to the browser.
+    """
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        fmt = st.selectbox("الصيغة", list(FORMATS), key=f"{key}_format")
+    _, extension, mime = FORMATS[fmt]
+
+    def build():
+        return export_file(dataset, admin_id, fmt, **filters)
+
+    with col2:
+        st.download_button(label, data=build, file_name=f"{dataset}.{extension}", mime=mime, key=f"{key}_download")
@@ -0,0 +1,154 @@
+import math
+import re
+from urllib.parse import unquote
+from utils.arabic import normalize_arabic
+
+# Approximate centroids (latitude, longitude) used when a listing's link has
+# no coordinates, by city and by (city, district).
+CITY_CENTROIDS = {
+    'الرياض': (24.7136, 46.6753),
+    'الخرج': (24.1556, 47.3346),
+    'المجمعة': (25.9039, 45.3456),
+    'الدوادمي': (24.5077, 44.3924),
+    'الزلفي': (26.2994, 44.8150),
+    'مكة المكرمة': (21.3891, 39.8579),
+    'جدة': (21.4858, 39.1925),
+    'الطائف': (21.2703, 40.4158),
+    'رابغ': (22.7986, 39.0349),
+    'خليص': (22.1411, 39.3189),
+    'المدينة المنورة': (24.5247, 39.5692),
+    'ينبع': (24.0895, 38.0618),
+    'خيبر': (25.6969, 39.2925),
+    'الدمام': (26.4207, 50.0888),
+    'الخبر': (26.2172, 50.1971),
+    'القطيف': (26.5196, 50.0115),
+    'الجبيل': (27.0046, 49.6460),
+    'الأحساء': (25.3647, 49.5876),
+    'أبها': (18.2164, 42.5053),
+    'خميس مشيط': (18.3000, 42.7333),
+    'النماص': (19.1453, 42.1222),
+    'رجال ألمع': (18.2167, 42.2667),
+    'تبوك': (28.3835, 36.5662),
+    'بريدة': (26.3260, 43.9750),
+    'حائل': (27.5114, 41.7208),
+    'جازان': (16.8892, 42.5511),
+    'نجران': (17.4933, 44.1277),
+    'الباحة': (20.0129, 41.4677),
+    'عرعر': (30.9753, 41.0381),
+    'سكاكا': (29.9697, 40.2064),
+}
+
+DISTRICT_CENTROIDS = {
+    ('الرياض', 'اليرموك'): (24.8138, 46.7772),
+    ('الرياض', 'الربوة'): (24.6933, 46.7576),
+    ('الرياض', 'الخالدية'): (24.6085, 46.7373),
+    ('الرياض', 'الملز'): (24.6650, 46.7330),
+    ('الرياض', 'الروضة'): (24.7347, 46.7721),
+    ('مكة المكرمة', 'الزاهر'): (21.4328, 39.8106),
+    ('مكة المكرمة', 'العزيزية'): (21.4050, 39.8850),
+    ('مكة المكرمة', 'الشوقية'): (21.3700, 39.8000),
+    ('مكة المكرمة', 'المنصور'): (21.4000, 39.8200),
+    ('مكة المكرمة', 'الخالدية'): (21.3900, 39.8550),
+    ('المدينة المنورة', 'العزيزية'): (24.4300, 39.6000),
+    ('المدينة المنورة', 'الخالدية'): (24.4900, 39.6200),
+    ('المدينة المنورة', 'المناخ'): (24.4700, 39.6050),
+    ('المدينة المنورة', 'الربوة'): (24.4950, 39.5800),
+    ('المدينة المنورة', 'الروضة'): (24.4800, 39.6300),
+}
+
+_CITIES = {normalize_arabic(city): point for city, point in CITY_CENTROIDS.items()}
+_DISTRICTS = {(normalize_arabic(city), normalize_arabic(district)): point
+              for (city, district), point in DISTRICT_CENTROIDS.items()}
+
+# Map links with coordinates: ?q=lat,lon (also query, ll, center, destination),
+# /@lat,lon,zoom and the !3dlat!4dlon of place links
+_NUMBER = r'(-?\d{1,3}(?:\.\d+)?)'
+_LINK_PATTERNS = [
+    re.compile(rf'!3d{_NUMBER}!4d{_NUMBER}'),
+    re.compile(rf'[?&](?:q|query|ll|center|destination)={_NUMBER},\s*{_NUMBER}'),
+    re.compile(rf'@{_NUMBER},{_NUMBER}'),
+]
+
+KM_PER_DEGREE_LATITUDE = 110.574
+KM_PER_DEGREE_LONGITUDE = 111.320  # at the equator
+
+def valid_point(latitude, longitude):
+    """Whether both values are numbers within the latitude/longitude ranges"""
+    try:
+        return -90 <= float(latitude) <= 90 and -180 <= float(longitude) <= 180
+    except (TypeError, ValueError):
+        return False
+
+def parse_coordinates(link):
+    """(latitude, longitude) found in a map link, or None"""
+    if not link:
+        return None
+    link = unquote(str(link))
+    for pattern in _LINK_PATTERNS:
+        match = pattern.search(link)
+        if match and valid_point(*match.groups()):
+            return float(match.group(1)), float(match.group(2))
+    return None
+
+def gazetteer_point(city, district=None):
+    """Centroid of the district, else of the city, or None if unknown"""
+    city = normalize_arabic(city)
+    return _DISTRICTS.get((city, normalize_arabic(district))) or _CITIES.get(city)
+
+def locate(property_data):
+    """(latitude, longitude) of a property, or (None, None).
+
+    Coordinates already in property_data win, then the ones in its
+    location_link, then the gazetteer centroid of its district or city.
+    """
+    latitude, longitude = property_data.get('latitude'), property_data.get('longitude')
+    if latitude not in (None, '') and valid_point(latitude, longitude):
+        return float(latitude), float(longitude)
+    point = (parse_coordinates(property_data.get('location_link'))
+             or gazetteer_point(property_data.get('city'), property_data.get('district')))
+    return point or (None, None)
+
+def km_per_degree_longitude(latitude):
+    # Floor keeps boxes finite next to the poles
+    return KM_PER_DEGREE_LONGITUDE * max(math.cos(math.radians(latitude)), 0.01)
+
+def bounding_box(latitude, longitude, km):
+    """(south, west, north, east) of the box holding every point within km"""
+    dlat = km / KM_PER_DEGREE_LATITUDE
+    dlon = km / km_per_degree_longitude(latitude)
+    return (max(latitude - dlat, -90), max(longitude - dlon, -180),
+            min(latitude + dlat, 90), min(longitude + dlon, 180))
+
+def distance_km(latitude, longitude, other_latitude, other_longitude):
+    """Equirectangular distance, scaled at the first point's latitude.
+
+    Well within 1% of the great-circle distance at city scale, and the same
+    metric the SQL radius filter uses.
+    """
+    dy = (other_latitude - latitude) * KM_PER_DEGREE_LATITUDE
+    dx = (other_longitude - longitude) * km_per_degree_longitude(latitude)
+    return math.hypot(dx, dy)
+
+# Web maps (MapLibre, as used by plotly) draw the world as 512 px wide at
+# zoom 0, doubling with each zoom level, in Web Mercator which stops at
+# about 85.05 degrees of latitude.
+MAP_TILE_PX = 512
+MERCATOR_MAX_LATITUDE = 85.0511
+
+def _mercator_y(latitude):
+    return math.degrees(math.log(math.tan(math.pi / 4 + math.radians(latitude) / 2)))
+
+def _mercator_latitude(y):
+    return math.degrees(2 * math.atan(math.exp(math.radians(y))) - math.pi / 2)
+
+def viewport(latitude, longitude, zoom, width_px, height_px):
+    """(south, west, north, east) shown by a web map of that size and zoom"""
+    degrees_per_px = 360 / (MAP_TILE_PX * 2 ** zoom)
+    latitude = max(min(latitude, MERCATOR_MAX_LATITUDE), -MERCATOR_MAX_LATITUDE)
+    y = _mercator_y(latitude)
+    half_height = height_px / 2 * degrees_per_px
+    half_width = width_px / 2 * degrees_per_px
+    return (max(_mercator_latitude(y - half_height), -MERCATOR_MAX_LATITUDE),
+            max(longitude - half_width, -180),
+            min(_mercator_latitude(y + half_height), MERCATOR_MAX_LATITUDE),
+            min(longitude + half_width, 180))
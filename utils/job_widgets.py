@@ -0,0 +1,100 @@
+import json
+import os
+import streamlit as st
+from jobs import ACTIVE_STATUSES, JOB_KINDS, cancel_job, delete_job, get_job, list_jobs
+
+# Seconds between status refreshes while a job is queued or running
+JOB_POLL_INTERVAL = 2
+
+JOB_STATUS_LABELS = {
+    'queued': "في الانتظار",
+    'running': "قيد التنفيذ",
+    'done': "مكتملة",
+    'failed': "فشلت",
+    'cancelled': "ملغاة",
+}
+
+# Keys of job results as shown to the user
+RESULT_LABELS = {
+    'imported': "تم استيراده",
+    'rejected': "مرفوض",
+    'duplicates': "مكرر",
+    'seconds': "المدة (ثانية)",
+    'rows': "الصفوف",
+    'cities': "المدن",
+    'properties': "العقارات",
+    'buyers': "المشترين",
+    'groups': "مجموعات التكرار",
+}
+
+def _poll(render, active):
+    """Run render in a fragment that refreshes itself while a job is active.
+
+    Once nothing is active the whole page reruns, which re-creates the
+    fragment without a timer.
+    """
+    @st.fragment(run_every=JOB_POLL_INTERVAL if active else None)
+    def fragment():
+        if not render() and active:
+            st.rerun()
+    fragment()
+
+def job_card(job):
+    """Status, progress and actions of one job"""
+    kind = JOB_KINDS[job.kind].label if job.kind in JOB_KINDS else job.kind
+    st.write(f"**{kind}** #{job.id} - {JOB_STATUS_LABELS[job.status]}")
+    if job.status in ACTIVE_STATUSES:
+        st.progress(job.progress, text=job.message or "")
+    elif job.message:
+        st.caption(job.message)
+    if job.error:
+        st.error(job.error)
+    if job.status == 'done' and job.result:
+        result = json.loads(job.result)
+        st.caption("، ".join(
+            f"{RESULT_LABELS.get(name, name)}: {round(value, 1) if isinstance(value, float) else value}"
+            for name, value in result.items()
+        ))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if job.status in ACTIVE_STATUSES:
+            if st.button("إلغاء", key=f"cancel_job_{job.id}"):
+                cancel_job(job.id, job.admin_id)
+                st.rerun()
+        elif job.result_file and os.path.exists(job.result_file):
+            st.download_button(
+                "تحميل النتيجة",
+                data=lambda path=job.result_file: open(path, 'rb'),
+                file_name=os.path.basename(job.result_file),
+                key=f"download_job_{job.id}"
+            )
+    with col2:
+        if job.status not in ACTIVE_STATUSES and st.button("حذف", key=f"delete_job_{job.id}"):
+            delete_job(job.id, job.admin_id)
+            st.rerun(scope="fragment")
+
+def job_status(job_id, admin_id):
+    """Live status of a single job"""
+    def render():
+        job = get_job(job_id, admin_id)
+        if job is None:
+            return False
+        job_card(job)
+        return job.status in ACTIVE_STATUSES
+
+    job = get_job(job_id, admin_id)
+    _poll(render, job is not None and job.status in ACTIVE_STATUSES)
+
+def jobs_panel(admin_id, limit=20):
+    """Live list of an admin's recent jobs"""
+    def render():
+        jobs = list_jobs(admin_id, limit)
+        if not jobs:
+            st.info("لا توجد مهام")
+        for job in jobs:
+            with st.container(border=True):
+                job_card(job)
+        return any(job.status in ACTIVE_STATUSES for job in jobs)
+
+    _poll(render, any(job.status in ACTIVE_STATUSES for job in list_jobs(admin_id, limit)))
@@ -0,0 +1,48 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from database_utils import map_clusters, to_columns
+from utils.geo import CITY_CENTROIDS, viewport
+
+# Size the viewport is computed for; the chart stretches to the page width
+MAP_WIDTH_PX = 700
+MAP_HEIGHT_PX = 500
+
+KINGDOM = "المملكة"
+KINGDOM_VIEW = ((24.0, 45.0), 4)  # (center, zoom)
+CITY_ZOOM = 10
+
+def property_map(admin_id, key, center=None):
+    """Clustered map of an admin's listings.
+
+    Only the clusters of the chosen viewport are read (see
+    database_utils.map_clusters), so the browser gets at most a few hundred
+    markers whatever the size of the portfolio. center, e.g. the point of a
+    location filter, is offered as the first choice of map center.
+    """
+    places = ([("نقطة البحث", (center, CITY_ZOOM))] if center else []) + [(KINGDOM, KINGDOM_VIEW)]
+    places += [(city, (point, CITY_ZOOM)) for city, point in CITY_CENTROIDS.items()]
+    views = dict(places)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        place = st.selectbox("مركز الخريطة", list(views), key=f"{key}_center")
+    (latitude, longitude), default_zoom = views[place]
+    with col2:
+        zoom = st.slider("التكبير", min_value=2, max_value=17, value=default_zoom, key=f"{key}_zoom_{place}")
+
+    clusters = map_clusters(admin_id, zoom, *viewport(latitude, longitude, zoom, MAP_WIDTH_PX, MAP_HEIGHT_PX))
+    if not clusters:
+        st.info("لا توجد عقارات في هذه المنطقة")
+        return
+    df = pd.DataFrame(to_columns(clusters))
+    fig = px.scatter_map(
+        df, lat='latitude', lon='longitude', size='count', size_max=40,
+        hover_data={'latitude': False, 'longitude': False, 'count': True},
+        labels={'count': "عدد العقارات"},
+        center={'lat': latitude, 'lon': longitude}, zoom=zoom,
+        map_style="open-street-map", height=MAP_HEIGHT_PX,
+    )
+    fig.update_layout(margin={'l': 0, 'r': 0, 't': 0, 'b': 0})
+    st.plotly_chart(fig, key=f"{key}_chart")
+    st.caption(f"{len(clusters)} نقطة تمثل {int(df['count'].sum())} عقار")
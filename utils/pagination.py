@@ -0,0 +1,37 @@
+import math
+import streamlit as st
+
+PAGE_SIZE = 20
+
+def current_cursor(key, filters):
+    """Return the cursor of the page being shown for the listing `key`.
+
+    The cursors of the pages visited so far are kept in session state so
+    that "previous" can go back; they are reset whenever filters change.
+    """
+    state_key = f"{key}_pagination"
+    state = st.session_state.get(state_key)
+    if state is None or state['filters'] != filters:
+        state = {'filters': filters, 'cursors': [None]}
+        st.session_state[state_key] = state
+    return state['cursors'][-1]
+
+def page_controls(key, page, page_size=PAGE_SIZE):
+    """Draw previous/next buttons for a Page returned by a *_page search"""
+    cursors = st.session_state[f"{key}_pagination"]['cursors']
+    number = len(cursors)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("السابق", key=f"{key}_previous_page", disabled=number == 1):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if page.total is not None:
+            pages = max(1, math.ceil(page.total / page_size))
+            st.write(f"صفحة {number} من {pages} ({page.total} نتيجة)")
+        else:
+            st.write(f"صفحة {number}")
+    with col3:
+        if st.button("التالي", key=f"{key}_next_page", disabled=page.next_cursor is None):
+            cursors.append(page.next_cursor)
+            st.rerun()
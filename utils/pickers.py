@@ -0,0 +1,27 @@
+import streamlit as st
+from database_utils import get_property_index
+
+PICKER_RESULTS = 20
+
+def property_picker(key, admin_id, limit=PICKER_RESULTS):
+    """Type-to-search property selector; returns the chosen property id or None.
+
+    Only the top `limit` matches of the admin's shared picker index are sent
+    to the browser, whatever the size of the portfolio.
+    """
+    index = get_property_index(admin_id)
+    if not len(index):
+        st.info("لا توجد عقارات متاحة")
+        return None
+
+    query = st.text_input("ابحث عن عقار", key=f"{key}_query", placeholder="العنوان أو المدينة أو الحي")
+    matches = dict(index.search(query, limit))
+    if not matches:
+        st.info("لا توجد عقارات مطابقة للبحث")
+        return None
+    return st.selectbox(
+        "اختر عقار",
+        options=list(matches),
+        format_func=matches.get,
+        key=f"{key}_select"
+    )
@@ -0,0 +1,274 @@
+import json
+import os
+import threading
+import time
+from typing import NamedTuple
+import numpy as np
+from utils.arabic import normalize_arabic
+
+# Segments a listing is trained into, finest first. A listing is priced by
+# the finest of its segments holding at least MIN_SEGMENT_LISTINGS listings.
+SEGMENT_LEVELS = (
+    ('city', 'district', 'property_type'),
+    ('city', 'property_type'),
+    ('property_type',),
+    (),
+)
+MIN_SEGMENT_LISTINGS = 20
+# Listings whose log price is this many residual standard deviations off
+# their estimate are outliers
+OUTLIER_SCORE = 3.0
+# Rows whose outer products are accumulated at once
+ACCUMULATE_CHUNK = 4096
+
+class Estimates(NamedTuple):
+    ids: np.ndarray        # property ids
+    estimates: np.ndarray  # estimated prices, NaN where no segment is large enough
+    scores: np.ndarray     # (log price - log estimate) / residual std of the segment
+
+def _positive_log(values):
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(values.shape, np.nan)
+    np.log(values, out=result, where=values > 0)
+    return result
+
+def _counts(values):
+    return np.array([value or 0 for value in values], dtype=np.float64)
+
+def _group_sums(groups, values, count):
+    """Column sums of values (rows x columns) per group number"""
+    return np.stack([np.bincount(groups, weights=column, minlength=count) for column in values.T], axis=1)
+
+class PriceModel:
+    """Per-segment linear models of log price, trained incrementally.
+
+    The features are log area, bedrooms, bathrooms, living rooms, floors and
+    the property type (one-hot), plus an intercept. Each segment keeps the
+    sums X'X, X'y and y'y of its listings, so adding, changing or removing a
+    listing only adds or subtracts its own terms; the coefficients of the
+    segments touched are re-solved with np.linalg.lstsq on next use. Rows
+    are (id, area, bedrooms, bathrooms, living_rooms, floors, price,
+    property_type, city, district) tuples; upsert() and remove() keep the
+    model current without a rebuild.
+    """
+
+    def __init__(self, property_types, rows=()):
+        self.built_at = time.time()
+        self.property_types = list(property_types)
+        self._type_columns = {name: 6 + i for i, name in enumerate(self.property_types[1:])}
+        self.width = 6 + len(self._type_columns)
+        self._rows = {}  # id -> row number in the arrays
+        self._size = 0
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._segments = np.zeros((0, len(SEGMENT_LEVELS)), dtype=np.int32)
+        self._x = np.zeros((0, self.width))
+        self._y = np.zeros(0)
+        self._alive = np.zeros(0, dtype=bool)
+        self._keys = [{} for _ in SEGMENT_LEVELS]  # per level: segment key -> segment number
+        self._xtx = [np.zeros((0, self.width, self.width)) for _ in SEGMENT_LEVELS]
+        self._xty = [np.zeros((0, self.width)) for _ in SEGMENT_LEVELS]
+        self._yty = [np.zeros(0) for _ in SEGMENT_LEVELS]
+        self._count = [np.zeros(0) for _ in SEGMENT_LEVELS]
+        self._beta = [np.zeros((0, self.width)) for _ in SEGMENT_LEVELS]
+        self._sigma = [np.zeros(0) for _ in SEGMENT_LEVELS]
+        self._dirty = [set() for _ in SEGMENT_LEVELS]
+        self._places = {}  # (type, city, district) -> segment numbers
+        self._lock = threading.Lock()
+        self.unsaved = True  # changed since the last save() or load()
+        self.upsert(rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _place_segments(self, property_type, city, district):
+        """Segment number at each level of a listing, computed once per distinct place and type"""
+        found = self._places.get((property_type, city, district))
+        if found is None:
+            names = {'property_type': property_type, 'city': normalize_arabic(city), 'district': normalize_arabic(district)}
+            found = self._places[property_type, city, district] = [
+                self._keys[level].setdefault(key, len(self._keys[level]))
+                for level, key in enumerate(tuple(names[field] for field in fields) for fields in SEGMENT_LEVELS)
+            ]
+        return found
+
+    def _grow_segments(self):
+        for level, keys in enumerate(self._keys):
+            extra = len(keys) - len(self._count[level])
+            if extra > 0:
+                self._xtx[level] = np.concatenate([self._xtx[level], np.zeros((extra, self.width, self.width))])
+                self._xty[level] = np.concatenate([self._xty[level], np.zeros((extra, self.width))])
+                self._yty[level] = np.concatenate([self._yty[level], np.zeros(extra)])
+                self._count[level] = np.concatenate([self._count[level], np.zeros(extra)])
+                self._beta[level] = np.concatenate([self._beta[level], np.full((extra, self.width), np.nan)])
+                self._sigma[level] = np.concatenate([self._sigma[level], np.full(extra, np.nan)])
+
+    def _grow_rows(self, size):
+        capacity = len(self._ids)
+        if size <= capacity:
+            return
+        extra = max(size, capacity * 2, 1024) - capacity
+        self._ids = np.concatenate([self._ids, np.zeros(extra, dtype=np.int64)])
+        self._segments = np.concatenate([self._segments, np.zeros((extra, len(SEGMENT_LEVELS)), dtype=np.int32)])
+        self._x = np.concatenate([self._x, np.zeros((extra, self.width))])
+        self._y = np.concatenate([self._y, np.full(extra, np.nan)])
+        self._alive = np.concatenate([self._alive, np.zeros(extra, dtype=bool)])
+
+    def features(self, areas, bedrooms, bathrooms, living_rooms, floors, property_types):
+        """Feature matrix of listings; rows without a positive area get a NaN log area"""
+        x = np.zeros((len(areas), self.width))
+        x[:, 0] = 1
+        x[:, 1] = _positive_log(np.array([np.nan if area is None else area for area in areas], dtype=np.float64))
+        x[:, 2] = _counts(bedrooms)
+        x[:, 3] = _counts(bathrooms)
+        x[:, 4] = _counts(living_rooms)
+        x[:, 5] = _counts(floors)
+        for i, property_type in enumerate(property_types):
+            column = self._type_columns.get(property_type)
+            if column is not None:
+                x[i, column] = 1
+        return x
+
+    def _accumulate(self, positions, sign):
+        """Add (sign=1) or remove (sign=-1) the terms of trainable rows"""
+        positions = positions[self._alive[positions] & np.isfinite(self._y[positions]) & np.isfinite(self._x[positions, 1])]
+        for start in range(0, len(positions), ACCUMULATE_CHUNK):
+            chunk = positions[start:start + ACCUMULATE_CHUNK]
+            x, y = self._x[chunk], self._y[chunk]
+            # One row of terms per listing: X'X (flattened), X'y, y'y and the count
+            terms = sign * np.hstack([(x[:, :, None] * x[:, None, :]).reshape(len(chunk), -1),
+                                      x * y[:, None], (y * y)[:, None], np.ones((len(chunk), 1))])
+            width = self.width
+            for level in range(len(SEGMENT_LEVELS)):
+                segments, rows = np.unique(self._segments[chunk, level], return_inverse=True)
+                sums = _group_sums(rows.ravel(), terms, len(segments))
+                self._xtx[level][segments] += sums[:, :width * width].reshape(-1, width, width)
+                self._xty[level][segments] += sums[:, width * width:width * width + width]
+                self._yty[level][segments] += sums[:, -2]
+                self._count[level][segments] += sums[:, -1]
+                self._dirty[level].update(segments.tolist())
+
+    def upsert(self, rows):
+        """Add new properties or replace changed ones"""
+        rows = list(rows)
+        if not rows:
+            return
+        ids, areas, bedrooms, bathrooms, living_rooms, floors, prices, types, cities, districts = zip(*rows)
+        x = self.features(areas, bedrooms, bathrooms, living_rooms, floors, types)
+        y = _positive_log(np.array([np.nan if price is None else price for price in prices], dtype=np.float64))
+        with self._lock:
+            segments = np.array([
+                self._place_segments(property_type, city, district)
+                for property_type, city, district in zip(types, cities, districts)
+            ], dtype=np.int32)
+            self._grow_segments()
+            positions = np.empty(len(rows), dtype=np.int64)
+            for i, property_id in enumerate(ids):
+                position = self._rows.get(property_id)
+                if position is None:
+                    position = self._rows[property_id] = self._size
+                    self._size += 1
+                positions[i] = position
+            self._grow_rows(self._size)
+            self._accumulate(positions, -1)
+            self._ids[positions] = ids
+            self._segments[positions] = segments
+            self._x[positions] = x
+            self._y[positions] = y
+            self._alive[positions] = True
+            self._accumulate(positions, 1)
+            self.unsaved = True
+
+    def remove(self, property_ids):
+        with self._lock:
+            positions = np.array([self._rows.pop(property_id) for property_id in property_ids if property_id in self._rows],
+                                 dtype=np.int64)
+            self._accumulate(positions, -1)
+            self._alive[positions] = False
+            self.unsaved = self.unsaved or len(positions) > 0
+
+    def _solve(self):
+        """Re-fit the segments whose sums changed"""
+        for level, dirty in enumerate(self._dirty):
+            for segment in dirty:
+                count = self._count[level][segment]
+                beta, sigma = np.full(self.width, np.nan), np.nan
+                if count >= MIN_SEGMENT_LISTINGS:
+                    xtx, xty = self._xtx[level][segment], self._xty[level][segment]
+                    beta, _, rank, _ = np.linalg.lstsq(xtx, xty, rcond=None)
+                    residual = self._yty[level][segment] - 2 * beta @ xty + beta @ xtx @ beta
+                    if count > rank:
+                        sigma = np.sqrt(max(residual, 0) / (count - rank))
+                self._beta[level][segment] = beta
+                self._sigma[level][segment] = sigma
+            dirty.clear()
+
+    def estimate(self, property_ids=None) -> Estimates:
+        """Estimated prices and deviation scores of the given properties, or of all"""
+        with self._lock:
+            self._solve()
+            if property_ids is None:
+                positions = np.flatnonzero(self._alive[:self._size])
+            else:
+                positions = np.array([self._rows[i] for i in property_ids if i in self._rows], dtype=np.int64)
+            x, y = self._x[positions], self._y[positions]
+            log_estimate = np.full(len(positions), np.nan)
+            sigma = np.full(len(positions), np.nan)
+            # Coarsest first, so each finer segment that can price a row overrides
+            for level in reversed(range(len(SEGMENT_LEVELS))):
+                segments = self._segments[positions, level]
+                usable = np.isfinite(self._sigma[level][segments]) & (self._sigma[level][segments] > 0)
+                beta = self._beta[level][segments[usable]]
+                log_estimate[usable] = np.einsum('ij,ij->i', x[usable], beta)
+                sigma[usable] = self._sigma[level][segments[usable]]
+            return Estimates(self._ids[positions], np.exp(log_estimate), (y - log_estimate) / sigma)
+
+    def outliers(self, threshold=OUTLIER_SCORE) -> Estimates:
+        """Listings scoring beyond threshold either way, largest deviation first"""
+        found = self.estimate()
+        with np.errstate(invalid='ignore'):
+            rows = np.flatnonzero(np.abs(found.scores) > threshold)
+        rows = rows[np.argsort(-np.abs(found.scores[rows]), kind='stable')]
+        return Estimates(found.ids[rows], found.estimates[rows], found.scores[rows])
+
+    def save(self, path):
+        """Write the model to path (.npz) atomically"""
+        with self._lock:
+            self._solve()
+            size = self._size
+            arrays = {
+                'ids': self._ids[:size], 'segments': self._segments[:size], 'x': self._x[:size],
+                'y': self._y[:size], 'alive': self._alive[:size],
+                'meta': np.array(json.dumps({
+                    'built_at': self.built_at,
+                    'property_types': self.property_types,
+                    'keys': [[list(key) for key in keys] for keys in self._keys],
+                })),
+            }
+            for level in range(len(SEGMENT_LEVELS)):
+                for name in ('xtx', 'xty', 'yty', 'count', 'beta', 'sigma'):
+                    arrays[f'{name}_{level}'] = getattr(self, f'_{name}')[level]
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+            np.savez(temporary, **arrays)
+            os.replace(temporary, path)
+            self.unsaved = False
+
+    @classmethod
+    def load(cls, path):
+        """A model written by save()"""
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            model = cls(meta['property_types'])
+            model.built_at = meta['built_at']
+            model._keys = [{tuple(key): i for i, key in enumerate(keys)} for keys in meta['keys']]
+            for level in range(len(SEGMENT_LEVELS)):
+                for name in ('xtx', 'xty', 'yty', 'count', 'beta', 'sigma'):
+                    getattr(model, f'_{name}')[level] = data[f'{name}_{level}']
+            model._ids, model._segments, model._x = data['ids'], data['segments'], data['x']
+            model._y, model._alive = data['y'], data['alive']
+        model._size = len(model._ids)
+        model._rows = {int(i): position for position, i in enumerate(model._ids.tolist()) if model._alive[position]}
+        model.unsaved = False
+        return model
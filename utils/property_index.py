@@ -0,0 +1,146 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from utils.arabic import normalize_arabic, tokenize
+
+# Above this many rows an update re-sorts the title order once instead of
+# inserting row by row
+_RESORT_THRESHOLD = 64
+# A query word matching fewer than 1/_SELECTIVE of the properties is
+# answered from its postings; more common words scan in title order
+_SELECTIVE = 8
+
+def property_label(title, city, district, price):
+    """Text shown for a property in pickers"""
+    place = '، '.join(part for part in (district, city) if part)
+    return f"{title} - {place} ({price} ريال)" if place else f"{title} ({price} ريال)"
+
+def _words_match(query_tokens, tokens):
+    return all(any(token.startswith(q) for token in tokens) for q in query_tokens)
+
+class PropertyIndex:
+    """In-memory type-to-search index over one admin's properties.
+
+    Matches normalized word prefixes of the title, city and district, then
+    falls back to substring matches. Rows are (id, title, city, district,
+    price) tuples; upsert() and remove() keep the index current without a
+    rebuild.
+    """
+
+    def __init__(self, rows=()):
+        self.built_at = time.time()
+        self._entries = {}     # id -> (label, normalized title, normalized text, tokens)
+        self._order = []       # (normalized title, id), sorted
+        self._postings = {}    # token -> ids of the properties containing it
+        self._vocabulary = []  # sorted tokens, for prefix ranges
+        self._lock = threading.Lock()
+        self.upsert(rows)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def upsert(self, rows):
+        """Add new properties or replace changed ones"""
+        with self._lock:
+            added = []
+            new_tokens = []
+            places = {}  # cities and districts repeat, normalize each once
+            for property_id, title, city, district, price in rows:
+                self._remove(property_id)
+                for place in (city, district):
+                    if place not in places:
+                        places[place] = normalize_arabic(place)
+                title_key = normalize_arabic(title)
+                text = ' '.join(part for part in (title_key, places[city], places[district]) if part)
+                tokens = tuple(dict.fromkeys(tokenize(text)))
+                self._entries[property_id] = (property_label(title, city, district, price), title_key, text, tokens)
+                added.append((title_key, property_id))
+                for token in tokens:
+                    ids = self._postings.get(token)
+                    if ids is None:
+                        ids = self._postings[token] = []
+                        new_tokens.append(token)
+                    ids.append(property_id)
+            if len(added) > _RESORT_THRESHOLD:
+                self._order.extend(added)
+                self._order.sort()
+                self._vocabulary.extend(new_tokens)
+                self._vocabulary.sort()
+            else:
+                for pair in added:
+                    insort(self._order, pair)
+                for token in new_tokens:
+                    insort(self._vocabulary, token)
+
+    def label(self, property_id):
+        """Picker text of a property, or None if it is not indexed"""
+        entry = self._entries.get(property_id)
+        return entry[0] if entry else None
+
+    def remove(self, property_ids):
+        with self._lock:
+            for property_id in property_ids:
+                self._remove(property_id)
+
+    def _remove(self, property_id):
+        entry = self._entries.pop(property_id, None)
+        if entry is None:
+            return
+        i = bisect_left(self._order, (entry[1], property_id))
+        del self._order[i]
+        # Emptied postings stay in the vocabulary; they cost nothing to scan
+        for token in entry[3]:
+            self._postings[token].remove(property_id)
+
+    def _prefix_postings(self, prefix):
+        i = bisect_left(self._vocabulary, prefix)
+        postings = []
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+            postings.append(self._postings[self._vocabulary[i]])
+            i += 1
+        return postings
+
+    def search(self, query, limit=20):
+        """Top `limit` (id, label) pairs for query.
+
+        Titles starting with the query come first, then properties where
+        every query word prefixes a word, then substring matches; each group
+        is ordered by title. An empty query returns the first titles.
+        """
+        with self._lock:
+            entries = self._entries
+            tokens = tokenize(query)
+            if not tokens:
+                return [(i, entries[i][0]) for _, i in self._order[:limit]]
+
+            phrase = ' '.join(tokens)
+            found = []
+            seen = set()
+
+            def take(ids):
+                for i in ids:
+                    if len(found) == limit:
+                        return
+                    if i not in seen:
+                        seen.add(i)
+                        found.append(i)
+
+            # Titles starting with the phrase are contiguous in title order
+            start = bisect_left(self._order, (phrase,))
+            take(i for key, i in self._order[start:start + limit] if key.startswith(phrase))
+
+            if len(found) < limit:
+                postings = [self._prefix_postings(token) for token in tokens]
+                sizes = [sum(len(ids) for ids in lists) for lists in postings]
+                rarest = sizes.index(min(sizes))
+                if sizes[rarest] * _SELECTIVE <= len(entries):
+                    candidates = {i for ids in postings[rarest] for i in ids}
+                    matches = (i for i in candidates if _words_match(tokens, entries[i][3]))
+                    take(heapq.nsmallest(limit + len(found), matches, key=lambda i: entries[i][1]))
+                else:
+                    take(i for _, i in self._order if _words_match(tokens, entries[i][3]))
+
+            if len(found) < limit:
+                take(i for _, i in self._order if phrase in entries[i][2])
+            return [(i, entries[i][0]) for i in found]
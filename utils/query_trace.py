@@ -0,0 +1,151 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger('aqardash.sql')
+
+TRACE_ENABLED = os.environ.get('AQARDASH_QUERY_TRACE', '1') != '0'
+SLOW_QUERY_MS = float(os.environ.get('AQARDASH_SLOW_QUERY_MS', '100'))
+BUFFER_SIZE = int(os.environ.get('AQARDASH_QUERY_LOG_SIZE', '500'))
+
+def params_shape(parameters, many=False):
+    """Describe bound parameters by type only, never by value"""
+    if many:
+        parameters = list(parameters)
+        first = params_shape(parameters[0]) if parameters else '()'
+        return f"{len(parameters)} x {first}"
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f"{k}: {type(v).__name__}" for k, v in parameters.items()) + '}'
+    return '(' + ', '.join(type(v).__name__ for v in parameters) + ')'
+
+class QueryRecord:
+    """One traced statement: text, parameter shape, rows and duration"""
+    __slots__ = ('statement', 'params_shape', 'rows', 'duration_ms', 'started_at', 'logged')
+
+    def __init__(self, statement, shape):
+        self.statement = ' '.join(statement.split())
+        self.params_shape = shape
+        self.rows = 0
+        self.duration_ms = 0.0
+        self.started_at = time.time()
+        self.logged = False
+
+class RerunScope:
+    """Totals for the statements issued while one Streamlit rerun was active"""
+
+    def __init__(self):
+        self.records = []
+        self.started_at = time.time()
+
+    @property
+    def query_count(self):
+        return len(self.records)
+
+    @property
+    def total_ms(self):
+        return sum(record.duration_ms for record in self.records)
+
+    @property
+    def total_rows(self):
+        return sum(record.rows for record in self.records)
+
+class QueryTracer:
+    """Ring buffer of recent statements plus a slow-query log"""
+
+    def __init__(self, size=BUFFER_SIZE, slow_ms=SLOW_QUERY_MS):
+        self.slow_ms = slow_ms
+        self.recent = deque(maxlen=size)
+        self.slow = deque(maxlen=size)
+        self._local = threading.local()
+
+    def start_rerun(self):
+        """Attribute the calling thread's statements to a new RerunScope"""
+        self._local.scope = RerunScope()
+        return self._local.scope
+
+    def current_rerun(self):
+        return getattr(self._local, 'scope', None)
+
+    def begin(self, statement, shape):
+        record = QueryRecord(statement, shape)
+        self.recent.append(record)
+        scope = self.current_rerun()
+        if scope is not None:
+            scope.records.append(record)
+        return record
+
+    def add(self, record, duration, rows):
+        record.duration_ms += duration * 1000
+        record.rows += rows
+        if not record.logged and record.duration_ms >= self.slow_ms:
+            record.logged = True
+            self.slow.append(record)
+            logger.warning("Slow query (%.1f ms, %d rows, params %s): %s",
+                           record.duration_ms, record.rows, record.params_shape, record.statement)
+
+tracer = QueryTracer()
+
+class TracingCursor(sqlite3.Cursor):
+    """Cursor timing execute and fetch calls into the tracer"""
+    _record = None
+
+    def execute(self, sql, parameters=()):
+        self._record = tracer.begin(sql, params_shape(parameters))
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._finish(started)
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        self._record = tracer.begin(sql, params_shape(seq_of_parameters, many=True))
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._finish(started)
+
+    def _finish(self, started):
+        # rowcount is only meaningful for DML; SELECT rows are counted on fetch
+        tracer.add(self._record, time.perf_counter() - started, max(self.rowcount, 0))
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        if self._record is not None:
+            tracer.add(self._record, time.perf_counter() - started, 1 if row is not None else 0)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._record is not None:
+            tracer.add(self._record, time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        if self._record is not None:
+            tracer.add(self._record, time.perf_counter() - started, len(rows))
+        return rows
+
+class TracingConnection(sqlite3.Connection):
+    """Connection whose cursors, including execute() shortcuts, are traced"""
+
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def connection_factory():
+    """Connection class for sqlite3.connect(factory=...)"""
+    return TracingConnection if TRACE_ENABLED else sqlite3.Connection